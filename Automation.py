@@ -3,24 +3,68 @@ Automated Email Monitoring System
 Runs email summarization at regular intervals and tracks statistics
 """
 
-import schedule
 import time
 import json
 import os
-from datetime import datetime
+import collections
+import concurrent.futures
+import cProfile
+import threading
+from datetime import datetime, timedelta
 from Gmail_Handler import GmailHandler
 from LLM_Processor import LLM_Processor
-from googleapiclient.discovery import build
-import pandas as pd
+from Sync_Engine import IncrementalSync
+from Pipeline import EmailPipeline
+from Results_Store import ResultsStore
+from Stats_Journal import RunJournal
+from Backlog import BacklogProcessor, BacklogCheckpoint
+from Run_Scheduler import DeadlineScheduler, AdaptiveInterval
+from Push_Receiver import NotificationDebouncer, PushReceiver
+from Notifiers import AlertDispatcher
+from Metrics import metrics, MetricsServer, metric_name
 from Config import Config
 import logging
 
-class EmailAutomationScheduler:
+class AnalysisRun:
+    """State of one analysis run between fetching and writing results"""
+    __slots__ = ('start_time', 'run_timestamp', 'service', 'message_ids', 'history_id', 'emails', 'results',
+                 'skipped_ids')
+    
     def __init__(self):
-        self.gmail_handler = GmailHandler()
-        self.llm_processor = LLM_Processor()
-        self.stats_file = Config.STATS_FILE
-        self.stats = self.load_stats()
+        self.start_time = time.time()
+        self.run_timestamp = datetime.now().isoformat()
+        self.service = None
+        self.message_ids = []
+        self.history_id = None
+        self.emails = []
+        self.results = []
+        self.skipped_ids = []  # Listed but gone by the time they were fetched
+
+
+class EmailAutomationScheduler:
+    def __init__(self, account=None, llm_processor=None, results_store=None):
+        """
+        Args:
+            account: optional account config (name, token_file, stats_file, sync_state_file, ...);
+                     defaults to the single mailbox configured in Config
+            llm_processor / results_store: shared instances when several accounts run in one process
+        """
+        account = account or {}
+        self.name = account.get('name', 'default')
+        self.label = f"[{self.name}] " if account else ""
+        self.gmail_handler = GmailHandler(
+            token_file=account.get('token_file', Config.TOKEN_FILE),
+            credentials_file=account.get('credentials_file', Config.CREDENTIALS_FILE)
+        )
+        self.llm_processor = llm_processor or LLM_Processor()
+        self.stats_file = account.get('stats_file', Config.STATS_FILE)
+        self.journal = RunJournal(account.get('stats_journal_file', Config.STATS_JOURNAL_FILE), self.stats_file)
+        self.sync = IncrementalSync(account.get('sync_state_file', Config.SYNC_STATE_FILE), self.gmail_handler) \
+            if Config.INCREMENTAL_SYNC else None
+        self.results_store = results_store or ResultsStore()
+        self.alerts = AlertDispatcher(account=self.name if account else '')
+        self.run_lock = threading.Lock()  # Runs of the same account never overlap
+        metrics.load(Config.METRICS_FILE)
         
         # Setup logging
         logging.basicConfig(
@@ -29,189 +73,625 @@ class EmailAutomationScheduler:
             format="%(asctime)s [%(levelname)s] %(message)s"
         )
     
-    def load_stats(self):
-        """Load existing automation statistics"""
-        if os.path.exists(self.stats_file):
-            with open(self.stats_file, 'r') as f:
-                return json.load(f)
-        return {
-            'total_runs': 0,
-            'total_emails_processed': 0,
-            'high_importance_emails': 0,
-            'average_processing_time': 0,
-            'runs_history': []
-        }
-    
-    def save_stats(self):
-        """Save automation statistics to a JSON file."""
-        try:
-            with open(self.stats_file, 'w') as f:
-                json.dump(self.stats, f, indent=2)
-            # Add a print or log statement here to show it worked
-            logging.info(f"Successfully saved stats to {self.stats_file}")
-            
-        except IOError as e:
-            # Handle file I/O errors and log them
-            logging.info(f"Error saving stats file")
-            logging.exception("An error occurred while saving the stats file.")
-    
-    def run_email_analysis(self):
-        """Main automation function - runs the email analysis"""
+    def run_email_analysis(self, pipeline=False):
+        """
+        Main automation function - runs the email analysis
+        
+        Args:
+            pipeline: stream emails through fetch, parsing and summarization concurrently
+                      instead of fetching everything before the first LLM call
+        
+        Returns:
+            Number of new emails found, or None if the run failed or another run was in progress
+        """
+        if not self.run_lock.acquire(blocking=False):
+            logging.info(f"{self.label}Previous run still in progress, skipping this one")
+            return None
+        
+        # cProfile only sees this thread; LLM and pipeline worker time shows up in the metrics spans
+        profiler = cProfile.Profile() if Config.PROFILE_RUNS else None
+        if profiler:
+            profiler.enable()
+        
         try:
-            start_time = time.time()
-            run_timestamp = datetime.now().isoformat()
+            run = self.prepare_run(fetch=not pipeline)
+            if run is None:
+                return
             
-            logging.info(f"Starting automated email analysis run at {run_timestamp}")
+            # Urgent results are alerted on as soon as they are ready, not after the whole run
+            def on_result(result):
+                self.alerts.notify(result, run.start_time)
             
-            # Authenticate and build service
-            creds = self.gmail_handler.authenticate_gmail()
-            if not creds:
-                logging.info('Authentication failed. Cred doesn't exist')
-                return
+            if pipeline:
+                # Stream each email into the LLM as soon as its body is extracted
+                print(f"📧 {self.label}Streaming {len(run.message_ids)} new emails through the pipeline...")
+                email_pipeline = EmailPipeline(self.gmail_handler, self.llm_processor)
+                run.emails, run.results = email_pipeline.run(run.service, run.message_ids, on_result=on_result)
+                run.skipped_ids = email_pipeline.skipped_ids
+            elif run.emails:
+                print(f"📧 {self.label}Processing {len(run.emails)} new emails...")
+                if Config.LLM_BATCH_MODE:
+                    run.results = self.llm_processor.process_emails_batched(run.emails, on_result=on_result)
+                else:
+                    run.results = self.llm_processor.process_emails_in_parallel(run.emails, on_result=on_result)
             
-            service = build('gmail', 'v1', credentials=creds)
+            self.finish_run(run)
+            return len(run.emails)
+        
+        except Exception as e:
+            logging.info(f"Error in automation")
+            logging.exception(f"Error in automated run")
+        finally:
+            if profiler:
+                profiler.disable()
+                self.dump_profile(profiler)
+            self.run_lock.release()
+    
+    def dump_profile(self, profiler):
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        profile_file = os.path.join(Config.PROFILE_DIR, f"run_{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler.dump_stats(profile_file)
+        logging.info(f"Saved run profile to {profile_file}")
+    
+    def prepare_run(self, fetch=True):
+        """
+        Authenticates, lists the new messages and (unless fetch is False) downloads them.
+        Returns an AnalysisRun, or None when authentication fails.
+        """
+        run = AnalysisRun()
+        
+        logging.info(f"Starting automated email analysis run {self.label}at {run.run_timestamp}")
+        
+        # Authenticate and reuse the Gmail service (and its open connection) from earlier runs
+        run.service = self.gmail_handler.get_service()
+        if not run.service:
+            logging.info("Authentication failed. Cred doesn't exist")
+            return None
+        
+        # List new messages (only the ones added since the last run when incremental sync is on)
+        if self.sync:
+            run.message_ids, run.history_id = self.sync.list_new_message_ids(run.service, Config.MAX_EMAILS_PER_RUN)
+        else:
+            run.message_ids = self.gmail_handler.list_unread_ids(run.service, Config.MAX_EMAILS_PER_RUN)
+        
+        if fetch:
+            run.emails = self.gmail_handler.fetch_messages_batched(run.service, run.message_ids, mark_read=False,
+                                                                   skipped_ids=run.skipped_ids)
+        return run
+    
+    def finish_run(self, run):
+        """Records fetch failures, writes results, advances the sync point and updates statistics"""
+        email_count = len(run.emails)
+        results = run.results
+        
+        # Messages that could not be fetched, or got no usable LLM answer, are retried on the next run;
+        # deleted ones are forgotten
+        fetched_ids = [email.message_id for email in run.emails]
+        if self.sync:
+            done = {r.message_id for r in results} | set(run.skipped_ids)
+            self.sync.drop(run.skipped_ids)
+            self.sync.defer([m for m in run.message_ids if m not in done])
+        if fetched_ids and (Config.MARK_AS_READ or not self.sync):
+            self.gmail_handler.mark_as_read(run.service, fetched_ids)
+        
+        if email_count == 0:
+            logging.info(f"{self.label}No new emails found")
+            if self.sync:
+                self.sync.commit(run.history_id)
+            self.update_stats(run.run_timestamp, 0, 0, time.time() - run.start_time)
+            return
+        
+        if results:
+            # Count high importance emails (score >= 8)
+            high_importance_count = sum(1 for r in results if r.importance_score >= 8)
+            tokens_saved = sum(r.tokens_saved for r in results)
             
-            # Fetch emails
-            emails = self.gmail_handler.fetch_emails_full_body(service)
-            email_count = len(emails)
+            # Links travel with each result by message ID, only the timestamp is added here
+            for result in results:
+                result.processed_at = run.run_timestamp
             
-            if email_count == 0:
-                logging.info("No new emails found")
-                self.update_stats(run_timestamp, 0, 0, time.time() - start_time)
-                return
+            # Append to the results store in one batched write
+            self.results_store.add_many(results)
+            self.results_store.flush()
             
-            print(f"📧 Processing {email_count} new emails...")
+            # Display summary
+            print(f"✅ {self.label}Processed {email_count} emails in {time.time() - run.start_time:.1f} seconds")
+            print(f"🔥 {self.label}Found {high_importance_count} high-importance emails")
+            print(f"✂️  {self.label}Condensing saved {tokens_saved} prompt tokens")
+            grouped = [r for r in results if r.group_size > 1]
+            if grouped:
+                print(f"🧩 {self.label}{len(grouped)} emails shared {len({r.group_id for r in grouped})} thread/duplicate summaries")
+            print(f"💾 {self.label}Results saved to {self.results_store.db_file}")
             
-            # Process emails
-            results = self.llm_processor.process_emails_in_parallel(emails, max_concurrent=5)
+            # Log high importance emails
+            if high_importance_count > 0:
+                # One line per group: its summarized email, with the number of other members
+                high_importance_emails = [r for r in results if r.importance_score >= 8
+                                          and r.group_id in ('', r.message_id)]
+                print(f"\n🚨 {self.label}HIGH PRIORITY EMAILS:")
+                for email in high_importance_emails:
+                    similar = f", +{email.group_size - 1} more in group" if email.group_size > 1 else ""
+                    print(f"   • {email.original_subject or 'No subject'} (Score: {email.importance_score}{similar})")
             
-            if results:
-                # Count high importance emails (score >= 8)
-                high_importance_count = sum(1 for r in results if r.get('importance_score', 0) >= 8)
-                
-                # Save results with timestamp
-                timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S')
-                csv_filename = f'email_summaries_{timestamp_str}.csv'
-                
-                # Add email links and timestamps
-                for i, result in enumerate(results):
-                    if i < len(emails):
-                        result['link'] = emails[i]['link']
-                    result['processed_at'] = run_timestamp
-                
-                # Create and save DataFrame
-                results_df = pd.DataFrame.from_dict(results)
-                results_df.sort_values(by='importance_score', ascending=False, inplace=True)
-                results_df.to_csv(csv_filename, index=False)
-                
-                # Display summary
-                print(f"✅ Processed {email_count} emails in {time.time() - start_time:.1f} seconds")
-                print(f"🔥 Found {high_importance_count} high-importance emails")
-                print(f"💾 Results saved to {csv_filename}")
-                
-                # Log high importance emails
-                if high_importance_count > 0:
-                    high_importance_emails = [r for r in results if r.get('importance_score', 0) >= 8]
-                    print("\n🚨 HIGH PRIORITY EMAILS:")
-                    for email in high_importance_emails:
-                        print(f"   • {email.get('original_subject', 'No subject')} (Score: {email.get('importance_score', 0)})")
-                
-                # Update statistics
-                processing_time = time.time() - start_time
-                self.update_stats(run_timestamp, email_count, high_importance_count, processing_time)
-                
-                logging.info(f"Successfully processed {email_count} emails, {high_importance_count} high-priority")
+            # Only advance the sync point once the results are safely written
+            if self.sync:
+                self.sync.commit(run.history_id)
             
-            else:
-                logging.info("❌ Failed to process emails")
-                logging.error("Email processing failed")
+            # Update statistics
+            processing_time = time.time() - run.start_time
+            self.update_stats(run.run_timestamp, email_count, high_importance_count, processing_time)
+            
+            logging.info(f"{self.label}Successfully processed {email_count} emails, {high_importance_count} high-priority")
         
-        except Exception as e:
-            logging.info(f"Error in automation")
-            logging.exception(f"Error in automated run")
+        else:
+            logging.info("❌ Failed to process emails")
+            logging.error("Email processing failed")
     
     def update_stats(self, timestamp, email_count, high_importance_count, processing_time):
         """Update automation statistics"""
-        self.stats['total_runs'] += 1
-        self.stats['total_emails_processed'] += email_count
-        self.stats['high_importance_emails'] += high_importance_count
-        
-        # Update average processing time
-        old_avg = self.stats['average_processing_time']
-        total_runs = self.stats['total_runs']
-        self.stats['average_processing_time'] = ((old_avg * (total_runs - 1)) + processing_time) / total_runs
-        
-        # Add to history
-        self.stats['runs_history'].append({
-            'timestamp': timestamp,
-            'emails_processed': email_count,
-            'high_importance_count': high_importance_count,
-            'processing_time': processing_time
-        })
-        
-        # Keep only last 100 runs in history
-        if len(self.stats['runs_history']) > 100:
-            self.stats['runs_history'] = self.stats['runs_history'][-100:]
-        
-        self.save_stats()
-    
-    def print_stats(self):
-        """Print current automation statistics"""
+        metrics.observe('run_seconds', processing_time)
+        metrics.observe('run_emails', email_count)
+        metrics.save(Config.METRICS_FILE)
+        self.journal.record(timestamp, email_count, high_importance_count, processing_time)
+    
+    def print_stats(self, detailed=False):
+        """Print current automation statistics (with per-stage percentiles when detailed is True)"""
         print("\n" + "="*60)
         print("📊 EMAIL AUTOMATION STATISTICS")
         print("="*60)
-        print(f"Total runs: {self.stats['total_runs']}")
-        print(f"Total emails processed: {self.stats['total_emails_processed']}")
-        print(f"High-importance emails found: {self.stats['high_importance_emails']}")
-        print(f"Average processing time: {self.stats['average_processing_time']:.2f} seconds")
-        
-        if self.stats['runs_history']:
-            recent_runs = self.stats['runs_history'][-5:]
-            print(f"\nLast 5 runs:")
+        stats = self.journal.counters()
+        print(f"Total runs: {stats['total_runs']}")
+        print(f"Total emails processed: {stats['total_emails_processed']}")
+        print(f"High-importance emails found: {stats['high_importance_emails']}")
+        print(f"Average processing time: {stats['average_processing_time']:.2f} seconds")
+        
+        cache = self.llm_processor.cache
+        if cache:
+            cache_stats = cache.stats()
+            print(f"Summary cache: {cache_stats['entries']} entries, "
+                  f"{cache_stats['total_hits']} hits / {cache_stats['total_misses']} misses "
+                  f"({cache_stats['hit_rate']:.0%} hit rate)")
+        
+        if stats['recent_runs']:
+            recent_runs = stats['recent_runs']
+            print(f"\nLast {len(recent_runs)} runs:")
             for run in recent_runs:
                 timestamp = datetime.fromisoformat(run['timestamp']).strftime('%m/%d %H:%M')
                 print(f"  {timestamp}: {run['emails_processed']} emails, {run['high_importance_count']} high-priority")
+        
+        if detailed:
+            self.print_metrics()
     
-    def start_monitoring(self, interval_minutes=Config.AUTOMATION_INTERVAL_MINUTES):
+    def print_window_stats(self, since_hours):
+        """Totals for the runs in the last since_hours hours, read from the run journal"""
+        window = self.journal.window(since=datetime.now() - timedelta(hours=since_hours))
+        print(f"\n📅 Runs in the last {since_hours} hours")
+        print("="*60)
+        print(f"Runs: {window['total_runs']}")
+        print(f"Emails processed: {window['total_emails_processed']}")
+        print(f"High-importance emails found: {window['high_importance_emails']}")
+        print(f"Average processing time: {window['average_processing_time']:.2f} seconds")
+    
+    def print_metrics(self):
+        """Per-stage latency percentiles and counters from the metrics registry"""
+        snapshot = metrics.snapshot()
+        print(f"\n⏱️  Stage timings and sizes (recent samples)")
+        print(f"  {'metric':<28}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, h in sorted(snapshot['histograms'].items()):
+            print(f"  {name:<28}{h['count']:>8}{h['p50']:>10.3f}{h['p95']:>10.3f}{h['p99']:>10.3f}{h['max']:>10.3f}")
+        if snapshot['counters']:
+            print(f"\n🔢 Counters")
+            for name, value in sorted(snapshot['counters'].items()):
+                print(f"  {name:<28}{value:>10g}")
+        self.print_cascade_report(snapshot)
+    
+    def print_cascade_report(self, snapshot):
+        """Per-tier share of answers, escalations, latency and agreement with the tier above"""
+        counters, histograms = snapshot['counters'], snapshot['histograms']
+        tags = [metric_name(model) for model in Config.LLM_CASCADE_TIERS]
+        if not any(counters.get(f"cascade_{tag}_answered") for tag in tags):
+            return
+        total = sum(counters.get(f"cascade_{tag}_answered", 0) for tag in tags)
+        print(f"\n🪜 Model cascade")
+        print(f"  {'model':<20}{'answered':>10}{'escalated':>11}{'p50 s':>8}{'tokens p50':>12}{'agree':>8}")
+        for model, tag in zip(Config.LLM_CASCADE_TIERS, tags):
+            answered = counters.get(f"cascade_{tag}_answered", 0)
+            escalated = sum(value for name, value in counters.items() if name.startswith(f"cascade_{tag}_escalated_"))
+            compared = counters.get(f"cascade_{tag}_compared", 0)
+            agree = f"{counters.get(f'cascade_{tag}_agreed_urgency', 0) / compared:.0%}" if compared else "-"
+            latency = histograms.get(f"model_{tag}_request_seconds", {}).get('p50', 0)
+            tokens = histograms.get(f"model_{tag}_prompt_tokens", {}).get('p50', 0)
+            print(f"  {model:<20}{answered / total:>10.0%}{escalated:>11g}{latency:>8.2f}{tokens:>12g}{agree:>8}")
+    
+    def print_top_emails(self, limit=10, since_hours=24):
+        """Print the highest-importance emails from the results store"""
+        top = self.results_store.top_important(limit, since_hours)
+        print(f"\n🔥 Top {limit} high-importance emails in the last {since_hours} hours")
+        print("="*60)
+        for row in top:
+            timestamp = datetime.fromisoformat(row['processed_at']).strftime('%m/%d %H:%M')
+            print(f"  [{row['importance_score']}] {timestamp} {row['original_subject']} - {row['sender']}")
+            print(f"      {row['summary']}")
+        if not top:
+            print("  No high-importance emails found")
+    
+    def run_backlog(self, max_messages=None, query='is:unread', restart=False):
+        """
+        Works through every unread message in bounded windows, writing results as it goes and
+        checkpointing after each window so an interrupted backlog resumes where it stopped
+        """
+        if not self.run_lock.acquire(blocking=False):
+            print(f"⏳ {self.label}A run is already in progress")
+            return None
+        
+        try:
+            checkpoint = BacklogCheckpoint(Config.BACKLOG_CHECKPOINT_FILE)
+            if restart:
+                checkpoint.clear()
+            elif checkpoint.state:
+                print(f"↩️  {self.label}Resuming backlog from {checkpoint.state['updated_at']}")
+            
+            service = self.gmail_handler.get_service()
+            if not service:
+                logging.info("Authentication failed. Cred doesn't exist")
+                return None
+            
+            def on_window(totals):
+                print(f"📦 {self.label}{totals['summarized']} summarized, {totals['skipped']} already done, "
+                      f"{totals['failed']} failed ({totals['listed']} listed so far)")
+            
+            backlog = BacklogProcessor(self.gmail_handler, self.llm_processor, self.results_store, checkpoint)
+            totals = backlog.run(service, query, max_messages, on_window)
+            
+            # The checkpoint carries totals across invocations; the stats only get what this one added
+            this_run = totals['this_run']
+            self.update_stats(datetime.now().isoformat(), this_run['summarized'], this_run['high_importance'],
+                              this_run['seconds'])
+            if totals['complete']:
+                # Scheduled runs pick up from the point the backlog started listing
+                if self.sync and not self.sync.state.get('history_id'):
+                    self.sync.commit(totals['history_id'])
+                print(f"✅ {self.label}Backlog complete: {totals['summarized']} emails summarized, "
+                      f"{totals['high_importance']} high-importance")
+            else:
+                print(f"⏸️  {self.label}Backlog paused after {totals['summarized']} emails; run again to continue")
+            return totals
+        
+        except Exception as e:
+            logging.info(f"Error in backlog")
+            logging.exception(f"Error in backlog run; progress up to the last window is checkpointed")
+        finally:
+            self.run_lock.release()
+    
+    def print_triage_report(self, since_hours=24 * 7):
+        """Share of mail scored by local triage and its agreement with the LLM on the audit sample"""
+        report = self.results_store.triage_report(since_hours, Config.TRIAGE_LOW_SCORE_MAX)
+        print(f"\n🧹 Triage in the last {since_hours} hours")
+        print("="*60)
+        print(f"Emails scored: {report['total']}")
+        print(f"Skipped LLM (bulk): {report['skipped']} ({report['skip_rate']:.0%})")
+        if report['agreement'] is None:
+            print("Audited bulk emails: 0 (no agreement data yet)")
+        else:
+            print(f"Audited bulk emails: {report['audited']}, LLM agreed they were low priority: "
+                  f"{report['agreed']} ({report['agreement']:.0%})")
+            print(f"Audited bulk emails the LLM scored 8+: {report['missed_important']}")
+    
+    def train_triage(self):
+        """Fits the triage model on past LLM scores in the results store"""
+        triage = self.llm_processor.triage
+        if not triage:
+            print("Triage is disabled (Config.TRIAGE_ENABLED)")
+            return
+        summary = triage.train(self.results_store.training_rows())
+        if summary is None:
+            print(f"❌ Need at least {Config.TRIAGE_MIN_TRAINING_SAMPLES} LLM-scored results to train the triage model")
+        else:
+            print(f"✅ Trained triage model on {summary['samples']} results "
+                  f"({summary['training_accuracy']:.0%} training accuracy), saved to {triage.model_file}")
+    
+    def start_monitoring(self, interval_minutes=Config.AUTOMATION_INTERVAL_MINUTES, pipeline=False):
         """Start the automated monitoring system"""
-        print(f"🚀 Starting email automation (every {interval_minutes} minutes)")
+        print(f"🚀 Starting email automation (every {interval_minutes} minutes{', adaptive' if Config.ADAPTIVE_INTERVAL else ''})")
         print("Press Ctrl+C to stop")
         
-        # Schedule the job
-        schedule.every(interval_minutes).minutes.do(self.run_email_analysis)
+        # Runs immediately, then sleeps until each exact deadline
+        scheduler = make_deadline_scheduler(lambda: self.run_email_analysis(pipeline=pipeline), interval_minutes)
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            logging.info(f"Interrupted")
+            logging.exception(f"Interrupted")
+            self.print_stats()
+    
+    def renew_watch(self, topic_name=Config.GMAIL_PUSH_TOPIC):
+        """Re-authenticates and registers the Gmail watch; returns False if either step fails"""
+        try:
+            creds = self.gmail_handler.authenticate_gmail()
+            if not creds:
+                logging.info("Authentication failed. Cred doesn't exist")
+                return False
+            # A separate service: renewal runs on a timer thread and the shared connection is not thread-safe
+            service = self.gmail_handler.build_service(creds)
+            self.gmail_handler.watch(service, topic_name)
+            return True
+        except Exception:
+            logging.info(f"Error renewing Gmail watch")
+            logging.exception("Full traceback in watch renewal")
+            return False
+    
+    def start_push_mode(self, port=Config.PUSH_PORT, pipeline=False):
+        """
+        Event-driven mode: registers a Gmail watch and runs an incremental analysis whenever
+        a push notification arrives (bursts are debounced into one run). The watch is renewed
+        every Config.WATCH_RENEW_HOURS hours.
+        """
+        if not Config.GMAIL_PUSH_TOPIC:
+            print("❌ Set GMAIL_PUSH_TOPIC to the Pub/Sub topic Gmail should publish to")
+            return
+        if not self.renew_watch():
+            print("❌ Could not register the Gmail watch, see the log for details")
+            return
+        
+        # Catch up on anything that arrived while nothing was listening
+        self.run_email_analysis(pipeline=pipeline)
         
-        # Run once immediately
-        self.run_email_analysis()
+        debouncer = NotificationDebouncer(lambda history_id: self.run_email_analysis(pipeline=pipeline))
+        receiver = PushReceiver(debouncer, port=port)
+        receiver.start()
+        print(f"📡 Listening for Gmail push notifications on port {receiver.port}")
+        print("Press Ctrl+C to stop")
         
-        # Keep running
+        renewals = DeadlineScheduler(self.renew_watch, Config.WATCH_RENEW_HOURS * 3600)
         try:
+            renewals.run_forever(run_immediately=False)
+        except KeyboardInterrupt:
+            logging.info(f"Interrupted")
+            receiver.stop()
+            print(f"📬 {receiver.received} notifications received, {debouncer.triggers} runs triggered")
+            self.print_stats()
+
+
+def start_metrics_server():
+    """Serves /metrics for long-running modes when Config.METRICS_PORT is set"""
+    if Config.METRICS_PORT:
+        server = MetricsServer()
+        server.start()
+        print(f"📈 Metrics available at http://localhost:{server.port}/metrics")
+
+
+def make_deadline_scheduler(job, interval_minutes):
+    """DeadlineScheduler for job, with an adaptive interval when Config.ADAPTIVE_INTERVAL is on"""
+    adaptive = None
+    if Config.ADAPTIVE_INTERVAL:
+        adaptive = AdaptiveInterval(interval_minutes * 60,
+                                    Config.ADAPTIVE_MIN_INTERVAL_MINUTES * 60,
+                                    Config.ADAPTIVE_MAX_INTERVAL_MINUTES * 60)
+    return DeadlineScheduler(job, interval_minutes * 60, adaptive)
+
+
+def load_accounts(accounts_file=Config.ACCOUNTS_FILE):
+    """
+    Reads the list of account configs. Each entry needs a name and token_file; per-account
+    stats, run journal and sync state files default to <name>_Automation_Stats.json /
+    <name>_Automation_Runs.jsonl / <name>_Sync_State.json next to Config.STATS_FILE.
+    """
+    with open(accounts_file, 'r') as f:
+        accounts = json.load(f)
+    
+    state_dir = os.path.dirname(Config.STATS_FILE)
+    for account in accounts:
+        name = account['name']
+        account.setdefault('credentials_file', Config.CREDENTIALS_FILE)
+        account.setdefault('stats_file', os.path.join(state_dir, f"{name}_Automation_Stats.json"))
+        account.setdefault('stats_journal_file', os.path.join(state_dir, f"{name}_Automation_Runs.jsonl"))
+        account.setdefault('sync_state_file', os.path.join(state_dir, f"{name}_Sync_State.json"))
+    return accounts
+
+
+class MultiAccountScheduler:
+    """
+    Runs the fetch/summarize cycle for many mailboxes in one process.
+    
+    Each account keeps its own credentials, sync state and stats; the Groq client, rate limiter,
+    adaptive concurrency and results store are shared. Fetching runs on a small thread pool and
+    emails are handed to the shared LLM pool round-robin across accounts, so one busy inbox
+    can't starve the others.
+    """
+    
+    def __init__(self, accounts):
+        self.llm_processor = LLM_Processor()
+        self.results_store = ResultsStore()
+        self.schedulers = [EmailAutomationScheduler(account, self.llm_processor, self.results_store)
+                           for account in accounts]
+    
+    def run_cycle(self):
+        """
+        One fetch/summarize cycle across every account.
+        Accounts whose previous run is still in progress are skipped. Returns the number of new emails found.
+        """
+        condition = threading.Condition()
+        ready = collections.deque()  # (scheduler, run, pending emails) for accounts with emails waiting
+        outstanding = {}
+        email_total = [0]
+        slots = threading.Semaphore(Config.LLM_MAX_CONCURRENCY)
+        
+        def finish(scheduler, run):
+            try:
+                scheduler.finish_run(run)
+            except Exception:
+                logging.info(f"Error in automation")
+                logging.exception(f"Error finishing run for account {scheduler.name}")
+            finally:
+                scheduler.run_lock.release()
+        
+        def on_fetched(future, scheduler):
+            try:
+                run = future.result()
+            except Exception:
+                logging.info(f"Error in automation")
+                logging.exception(f"Error fetching emails for account {scheduler.name}")
+                run = None
+            
+            if run is None:
+                scheduler.run_lock.release()
+            
+            with condition:
+                fetches_left[0] -= 1
+                if run is not None and run.emails:
+                    email_total[0] += len(run.emails)
+                    print(f"📧 {scheduler.label}Processing {len(run.emails)} new emails...")
+                    # Threads and near-duplicates are grouped per account, one LLM call per group
+                    to_summarize, groups, numbers = self.llm_processor.collapse_groups(run.emails)
+                    outstanding[scheduler.name] = len(to_summarize)
+                    pending = self.llm_processor.prioritize(enumerate(to_summarize, 1))
+                    ready.append((scheduler, run, (groups, numbers), collections.deque(pending)))
+                condition.notify_all()
+            
+            if run is not None and not run.emails:
+                finish(scheduler, run)
+        
+        def on_summarized(future, scheduler, run, grouping):
+            slots.release()
+            try:
+                result = future.result()
+            except Exception:
+                logging.info(f"Fatal error in processing email")
+                logging.exception("Full traceback in processing error")
+                result = None
+            
+            expanded = self.llm_processor.expand_groups([result], *grouping) if result else []
+            if expanded:
+                scheduler.alerts.notify(expanded[0], run.start_time)
+            with condition:
+                run.results.extend(expanded)
+                outstanding[scheduler.name] -= 1
+                done = outstanding[scheduler.name] == 0
+            if done:
+                finish(scheduler, run)
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=Config.ACCOUNT_FETCH_WORKERS) as fetch_pool, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=Config.LLM_MAX_CONCURRENCY) as llm_pool:
+            active = [s for s in self.schedulers if s.run_lock.acquire(blocking=False)]
+            for scheduler in self.schedulers:
+                if scheduler not in active:
+                    logging.info(f"{scheduler.label}Previous run still in progress, skipping this one")
+            fetches_left = [len(active)]
+            
+            for scheduler in active:
+                future = fetch_pool.submit(scheduler.prepare_run)
+                future.add_done_callback(lambda f, scheduler=scheduler: on_fetched(f, scheduler))
+            
+            # Dispatch one email per account in turn while fetches are still arriving
             while True:
-                schedule.run_pending()
-                time.sleep(60)  # Check every minute
+                with condition:
+                    while not ready and fetches_left[0]:
+                        condition.wait()
+                    if not ready:
+                        break
+                    scheduler, run, grouping, pending = ready.popleft()
+                    index, email = pending.popleft()
+                    if pending:
+                        ready.append((scheduler, run, grouping, pending))
+                
+                slots.acquire()
+                future = llm_pool.submit(self.llm_processor.process_email, email, index)
+                future.add_done_callback(lambda f, scheduler=scheduler, run=run, grouping=grouping:
+                                         on_summarized(f, scheduler, run, grouping))
+        
+        return email_total[0]
+    
+    def print_stats(self, detailed=False):
+        for scheduler in self.schedulers:
+            print(f"\n👤 Account: {scheduler.name}")
+            scheduler.print_stats()
+        if detailed:
+            self.schedulers[0].print_metrics()
+    
+    def start_monitoring(self, interval_minutes=Config.AUTOMATION_INTERVAL_MINUTES):
+        """Start the automated monitoring system for every account"""
+        print(f"🚀 Starting email automation for {len(self.schedulers)} accounts (every {interval_minutes} minutes)")
+        print("Press Ctrl+C to stop")
+        
+        scheduler = make_deadline_scheduler(self.run_cycle, interval_minutes)
+        try:
+            scheduler.run_forever()
         except KeyboardInterrupt:
             logging.info(f"Interrupted")
-            logging.exception(f"Interrupted")
             self.print_stats()
 
+
 def main():
     """Main function with different run modes"""
     import sys
     
+    # Multi-account mode: python Automation.py multi [once|start [interval_minutes]|stats]
+    if len(sys.argv) > 1 and sys.argv[1] == "multi":
+        multi = MultiAccountScheduler(load_accounts())
+        mode = sys.argv[2] if len(sys.argv) > 2 else "start"
+        if mode == "once":
+            multi.run_cycle()
+        elif mode == "stats":
+            multi.print_stats(detailed="--detailed" in sys.argv)
+        else:
+            interval = int(sys.argv[3]) if len(sys.argv) > 3 else Config.AUTOMATION_INTERVAL_MINUTES
+            start_metrics_server()
+            multi.start_monitoring(interval)
+        return
+    
     scheduler = EmailAutomationScheduler()
     
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "stats":
-            scheduler.print_stats()
-        elif sys.argv[1] == "once":
-            scheduler.run_email_analysis()
-        elif sys.argv[1] == "start":
-            interval = int(sys.argv[2]) if len(sys.argv) > 2 else Config.AUTOMATION_INTERVAL_MINUTES
-            scheduler.start_monitoring(interval)
+    # --pipeline streams emails from Gmail into the LLM as they arrive
+    pipeline = "--pipeline" in sys.argv
+    detailed = "--detailed" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg not in ("--pipeline", "--detailed")]
+    
+    if not args or args[0] in ("start", "watch"):
+        start_metrics_server()
+    
+    if args:
+        if args[0] == "stats":
+            if len(args) > 1 and args[1] == "compact":
+                days = int(args[2]) if len(args) > 2 else Config.STATS_COMPACT_AFTER_DAYS
+                removed = scheduler.journal.compact(days)
+                print(f"🗜️  Compacted {removed} journal lines older than {days} days")
+            elif len(args) > 1:
+                scheduler.print_window_stats(int(args[1]))
+            else:
+                scheduler.print_stats(detailed=detailed)
+        elif args[0] == "top":
+            limit = int(args[1]) if len(args) > 1 else 10
+            since_hours = int(args[2]) if len(args) > 2 else 24
+            scheduler.print_top_emails(limit, since_hours)
+        elif args[0] == "export":
+            since_hours = int(args[1]) if len(args) > 1 else 24
+            csv_filename = args[2] if len(args) > 2 else f"email_summaries_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            count = scheduler.results_store.export_csv(csv_filename, since_hours)
+            print(f"💾 Exported {count} results to {csv_filename}")
+        elif args[0] == "triage":
+            if len(args) > 1 and args[1] == "train":
+                scheduler.train_triage()
+            else:
+                since_hours = int(args[2]) if len(args) > 2 else 24 * 7
+                scheduler.print_triage_report(since_hours)
+        elif args[0] == "backlog":
+            restart = len(args) > 1 and args[1] == "restart"
+            max_messages = int(args[1]) if len(args) > 1 and not restart else None
+            scheduler.run_backlog(max_messages, restart=restart)
+        elif args[0] == "once":
+            scheduler.run_email_analysis(pipeline=pipeline)
+        elif args[0] == "start":
+            interval = int(args[1]) if len(args) > 1 else Config.AUTOMATION_INTERVAL_MINUTES
+            scheduler.start_monitoring(interval, pipeline=pipeline)
+        elif args[0] == "watch":
+            port = int(args[1]) if len(args) > 1 else Config.PUSH_PORT
+            scheduler.start_push_mode(port, pipeline=pipeline)
         else:
-            print("Usage: python automated_scheduler.py [stats|once|start [interval_minutes]]")
+            print("Usage: python Automation.py [stats [hours|compact [days]] [--detailed]|once|start [interval_minutes]|watch [port]|top [N] [hours]|export [hours] [file]|triage [report [hours]|train]|backlog [N|restart]] [--pipeline]")
+            print("       python Automation.py multi [once|stats [--detailed]|start [interval_minutes]]")
     else:
         # Default: start with config interval
-        scheduler.start_monitoring(Config.AUTOMATION_INTERVAL_MINUTES)
+        scheduler.start_monitoring(Config.AUTOMATION_INTERVAL_MINUTES, pipeline=pipeline)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
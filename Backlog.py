@@ -0,0 +1,166 @@
+"""
+Bounded-memory backlog processing
+Walks messages().list page tokens and processes each page in fixed-size windows (fetch, summarize,
+write), so memory stays flat however many unread messages have piled up. A checkpoint written
+after every window lets a crashed backlog resume where it stopped.
+"""
+
+import json
+import os
+import time
+import logging
+from datetime import datetime
+from Config import Config
+from Metrics import metrics
+
+
+class BacklogCheckpoint:
+    """Position in the message listing: the page token of the current page and how much of it is done"""
+
+    def __init__(self, checkpoint_file=Config.BACKLOG_CHECKPOINT_FILE):
+        self.checkpoint_file = checkpoint_file
+        self.state = self.load()
+
+    def load(self):
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r') as f:
+                return json.load(f)
+        return None
+
+    def save(self, state):
+        """Written to a temporary file and renamed so a crash mid-write leaves the previous checkpoint intact"""
+        state['updated_at'] = datetime.now().isoformat()
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, self.checkpoint_file)
+        self.state = state
+
+    def clear(self):
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+        self.state = None
+
+
+class BacklogProcessor:
+    """
+    Args:
+        gmail_handler / llm_processor / results_store: the same objects a normal run uses
+        window_size: messages fetched and summarized together; bounds how many payloads are held at once
+        page_size: message IDs per messages().list page
+    """
+
+    def __init__(self, gmail_handler, llm_processor, results_store, checkpoint=None,
+                 window_size=Config.BACKLOG_WINDOW_SIZE, page_size=Config.BACKLOG_PAGE_SIZE):
+        self.gmail_handler = gmail_handler
+        self.llm_processor = llm_processor
+        self.results_store = results_store
+        self.checkpoint = checkpoint or BacklogCheckpoint()
+        self.window_size = window_size
+        self.page_size = page_size
+
+    def run(self, service, query='is:unread', max_messages=None, on_window=None):
+        """
+        Processes every message matching query (up to max_messages), resuming from the checkpoint
+        when one exists for the same query. Messages already in the results store are skipped.
+        Labels are left untouched so the listing stays stable while it is walked.
+
+        Args:
+            on_window: optional callback invoked with the totals dict after each window
+
+        Returns:
+            Totals dict: listed, skipped, fetched, summarized, high_importance, failed, seconds, all
+            since the backlog started, 'this_run' with the same counts for this invocation alone,
+            'complete' and 'history_id'. It is a copy; the checkpoint's totals are not changed.
+        """
+        state = self.checkpoint.state
+        if state and state.get('query') != query:
+            logging.info(f"Discarding backlog checkpoint for a different query ({state.get('query')!r})")
+            state = None
+
+        if state:
+            logging.info(f"Resuming backlog from checkpoint ({state['totals']['summarized']} already summarized)")
+            totals = state['totals']
+        else:
+            totals = dict.fromkeys(('listed', 'skipped', 'fetched', 'summarized', 'high_importance', 'failed'), 0)
+            state = {'query': query, 'page_token': None, 'page_offset': 0, 'totals': totals,
+                     'started_at': datetime.now().isoformat(),
+                     # Recorded up front so incremental sync can continue from here once the backlog is done
+                     'history_id': service.users().getProfile(userId='me').execute()['historyId']}
+            self.checkpoint.save(state)
+
+        before = dict(totals)
+        start_time = time.time()
+        remaining = max_messages  # Limit applies to this invocation, not to the backlog as a whole
+        pages = self.gmail_handler.iter_message_id_pages(service, query, self.page_size, state['page_token'])
+
+        for page_token, page_ids, next_page_token in pages:
+            if state['page_token'] != page_token:
+                state['page_token'], state['page_offset'] = page_token, 0
+
+            for offset in range(state['page_offset'], len(page_ids), self.window_size):
+                if remaining is not None and remaining <= 0:
+                    break
+                if offset == 0:
+                    totals['listed'] += len(page_ids)
+                window_ids = page_ids[offset:offset + self.window_size]
+                if remaining is not None:
+                    window_ids = window_ids[:remaining]
+                    remaining -= len(window_ids)
+
+                with metrics.span('backlog_window'):
+                    self.process_window(service, window_ids, totals)
+
+                state['page_offset'] = offset + len(window_ids)
+                self.checkpoint.save(state)
+                if on_window:
+                    on_window(totals)
+            else:
+                # Page finished: the checkpoint moves on to the next page
+                state['page_token'], state['page_offset'] = next_page_token, 0
+                if not next_page_token:
+                    state['finished'] = True
+                self.checkpoint.save(state)
+                continue
+            break  # max_messages reached inside the page
+
+        totals['seconds'] = totals.get('seconds', 0) + time.time() - start_time
+        done = state.get('finished', False)
+        if done:
+            self.checkpoint.clear()
+        else:
+            self.checkpoint.save(state)
+        # A new dict, so the checkpoint's totals keep only the counters
+        this_run = {key: totals[key] - before.get(key, 0) for key in
+                    ('listed', 'skipped', 'fetched', 'summarized', 'high_importance', 'failed', 'seconds')}
+        return dict(totals, complete=done, history_id=state['history_id'], this_run=this_run)
+
+    def process_window(self, service, message_ids, totals):
+        """Fetches, summarizes and stores one window, then lets it go"""
+        done = self.results_store.existing_message_ids(message_ids)
+        pending = [m for m in message_ids if m not in done]
+        totals['skipped'] += len(done)
+        if not pending:
+            return
+
+        failed_ids = []
+        messages = list(self.gmail_handler.iter_messages_batched(service, pending, failed_ids=failed_ids))
+        emails = self.gmail_handler.parse_messages(messages, totals['fetched'] + 1)
+        del messages  # Raw payloads are not needed while the window is summarized
+        totals['fetched'] += len(emails)
+        totals['failed'] += len(failed_ids)
+
+        if Config.LLM_BATCH_MODE:
+            results = self.llm_processor.process_emails_batched(emails)
+        else:
+            results = self.llm_processor.process_emails_in_parallel(emails)
+
+        processed_at = datetime.now().isoformat()
+        for result in results:
+            result.processed_at = processed_at
+        self.results_store.add_many(results)
+        self.results_store.flush()
+
+        totals['summarized'] += len(results)
+        totals['high_importance'] += sum(1 for r in results if r.importance_score >= 8)
+        logging.info(f"Backlog window done: {len(results)}/{len(pending)} summarized, {totals['summarized']} total")
@@ -0,0 +1,750 @@
+"""
+Offline benchmarks against the fake services in Fake_Services.py
+Usage: python Benchmark.py [fetch|llm|batch|mime|dedup|cascade|alerts|structured|push] [num_messages] [latency_seconds]
+       python Benchmark.py condense
+       python Benchmark.py parse [num_payloads] [workers]
+       python Benchmark.py startup [runs]
+       python Benchmark.py suite [max_messages] [output.json]
+       python Benchmark.py compare <before.json> <after.json>
+"""
+
+import base64
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from Config import Config
+from Fake_Services import FakeGmailService, FakeGroqClient, FakePublisher, make_message, make_mime_payloads
+from Gmail_Handler import GmailHandler
+from Mime_Extractor import extract_body
+from Text_Condenser import condense_body
+from LLM_Processor import LLM_Processor
+from Deduplicator import Deduplicator
+from Parse_Pool import ParsePool
+from Priority import UrgencyPrior
+from Notifiers import AlertDispatcher
+from Push_Receiver import NotificationDebouncer, PushReceiver
+from Rate_Limiter import RateLimiter
+from Structured_Output import SUMMARY_VALIDATOR, SchemaError, parse_json
+from Results_Store import ResultsStore
+from Sync_Engine import IncrementalSync
+from Metrics import metrics
+import Automation
+
+
+def bench_fetch(num_messages=15, latency=0.05, batch_size=50):
+    """Times fetch_emails_full_body sequentially and with batching against the same fake inbox"""
+    handler = GmailHandler()
+    report = {'num_messages': num_messages, 'latency': latency}
+
+    for mode, size in (('sequential', 1), ('batched', batch_size)):
+        service = FakeGmailService(num_messages=num_messages, latency=latency)
+        start = time.perf_counter()
+        emails = handler.fetch_emails_full_body(service, max_results=num_messages, batch_size=size)
+        elapsed = time.perf_counter() - start
+
+        report[mode] = {
+            'seconds': round(elapsed, 4),
+            'emails': len(emails),
+            'round_trips': service.round_trips,
+            'still_unread': service.unread_count(),
+        }
+
+    report['speedup'] = round(report['sequential']['seconds'] / max(report['batched']['seconds'], 1e-9), 2)
+    return report
+
+
+def make_emails(num_messages, html=False, body_size=800):
+    """EmailRecords built from synthetic Gmail messages"""
+    handler = GmailHandler()
+    return [handler.parse_message(make_message(i, html=html, body_size=body_size), i + 1)
+            for i in range(num_messages)]
+
+
+def make_llm_processor(client):
+    """
+    LLM_Processor wired to a fake client, without the on-disk cache or grouping: each synthetic
+    sender reuses one body template, so grouping would hide the per-email cost being measured
+    """
+    Config.CACHE_ENABLED = False
+    llm = LLM_Processor(client=client)
+    llm.deduplicator = None
+    return llm
+
+
+def bench_llm(num_messages=60, latency=0.05, requests_per_window=20, window_seconds=2.0):
+    """
+    Runs process_emails_in_parallel against a fake Groq client that throttles after
+    requests_per_window calls per window, and reports throughput and lost emails
+    """
+    client = FakeGroqClient(latency=latency, requests_per_minute=requests_per_window,
+                            tokens_per_minute=10 ** 9, window_seconds=window_seconds)
+    llm = make_llm_processor(client)
+    # Scale the client-side buckets to the compressed window the fake server uses
+    llm.rate_limiter = RateLimiter(requests_per_window * 60 / window_seconds, 10 ** 9)
+
+    emails = make_emails(num_messages)
+    start = time.perf_counter()
+    results = llm.process_emails_in_parallel(emails)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'num_messages': num_messages,
+        'seconds': round(elapsed, 4),
+        'emails_per_second': round(len(results) / elapsed, 2),
+        'server_ceiling_per_second': round(requests_per_window / window_seconds, 2),
+        'results': len(results),
+        'lost': num_messages - len(results),
+        'throttled_responses': client.throttled,
+        'retries': llm.retry_count,
+        'final_concurrency': llm.concurrency.limit,
+    }
+
+
+def bench_batch(num_messages=60, latency=0.2, body_size=300):
+    """
+    Compares per-email prompts with batched prompts on the same short emails:
+    requests, prompt/completion tokens and wall time
+    """
+    emails = make_emails(num_messages, body_size=body_size)
+    report = {'num_messages': num_messages, 'latency': latency, 'body_size': body_size}
+
+    for mode in ('per_email', 'batched'):
+        client = FakeGroqClient(latency=latency, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        llm = make_llm_processor(client)
+        llm.rate_limiter = RateLimiter(10 ** 6, 10 ** 9)
+
+        start = time.perf_counter()
+        if mode == 'batched':
+            results = llm.process_emails_batched(emails)
+        else:
+            results = llm.process_emails_in_parallel(emails)
+        elapsed = time.perf_counter() - start
+
+        report[mode] = {
+            'seconds': round(elapsed, 4),
+            'results': len(results),
+            'requests': client.requests,
+            'prompt_tokens': client.prompt_tokens,
+            'completion_tokens': client.completion_tokens,
+        }
+
+    report['request_reduction'] = round(report['per_email']['requests'] / max(report['batched']['requests'], 1), 2)
+    report['prompt_token_reduction'] = round(
+        report['per_email']['prompt_tokens'] / max(report['batched']['prompt_tokens'], 1), 2)
+    return report
+
+
+def bench_dedup(num_messages=200, latency=0.02, thread_size=4):
+    """
+    Requests and wall time with and without thread/near-duplicate grouping. In the first half of
+    the inbox every thread_size consecutive messages share a thread; the second half is standalone
+    messages, where each synthetic sender repeats one body template like an alert storm.
+    """
+    handler = GmailHandler()
+    emails = [handler.parse_message(make_message(i, thread_id=f"thread{i // thread_size:06d}"
+                                                 if i < num_messages // 2 else None), i + 1)
+              for i in range(num_messages)]
+    report = {'num_messages': num_messages, 'latency': latency, 'thread_size': thread_size}
+
+    for mode in ('per_email', 'grouped'):
+        client = FakeGroqClient(latency=latency, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        llm = make_llm_processor(client)
+        llm.rate_limiter = RateLimiter(10 ** 6, 10 ** 9)
+        if mode == 'grouped':
+            llm.deduplicator = Deduplicator()
+
+        start = time.perf_counter()
+        results = llm.process_emails_in_parallel(emails)
+        elapsed = time.perf_counter() - start
+
+        report[mode] = {
+            'seconds': round(elapsed, 4),
+            'results': len(results),
+            'requests': client.requests,
+            'prompt_tokens': client.prompt_tokens,
+        }
+
+    report['request_reduction'] = round(report['per_email']['requests'] / max(report['grouped']['requests'], 1), 2)
+    return report
+
+
+class AlertCollector:
+    """Alert sink that records how long after start each urgent email was alerted on"""
+
+    def __init__(self, start):
+        self.start = start
+        self.seconds = []
+
+    def notify(self, alert):
+        if alert['subject'].startswith('Urgent'):
+            self.seconds.append(time.time() - self.start)
+
+
+def bench_alerts(num_messages=200, latency=0.05, urgent_every=20):
+    """
+    Time to alert for urgent mail: seconds from the start of the run until each urgent email is
+    reported. 'after_run' is the old behaviour, where high-priority emails were only printed once
+    every email was done; 'fifo' and 'priority' alert as results complete, without and with the
+    urgency prior ordering the work. Every urgent_every-th email is urgent.
+    """
+    handler = GmailHandler()
+    emails = [handler.parse_message(make_message(i, urgent=i % urgent_every == urgent_every - 1), i + 1)
+              for i in range(num_messages)]
+    report = {'num_messages': num_messages, 'latency': latency, 'urgent_emails': num_messages // urgent_every}
+
+    for mode in ('fifo', 'priority'):
+        client = FakeGroqClient(latency=latency, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        llm = make_llm_processor(client)
+        llm.rate_limiter = RateLimiter(10 ** 6, 10 ** 9)
+        llm.prioritizer = UrgencyPrior() if mode == 'priority' else None
+
+        start = time.time()
+        collector = AlertCollector(start)
+        dispatcher = AlertDispatcher(notifiers=[collector])
+        llm.process_emails_in_parallel(emails, on_result=lambda result: dispatcher.notify(result, start))
+        elapsed = time.time() - start
+
+        seconds = sorted(collector.seconds) or [None]
+        report[mode] = {
+            'seconds': round(elapsed, 4),
+            'urgent_alerts': len(collector.seconds),
+            'first_alert_seconds': seconds[0] and round(seconds[0], 4),
+            'p50_alert_seconds': seconds[len(seconds) // 2] and round(seconds[len(seconds) // 2], 4),
+            'last_alert_seconds': seconds[-1] and round(seconds[-1], 4),
+        }
+        if mode == 'fifo':
+            report['after_run'] = {'alert_seconds': round(elapsed, 4)}
+
+    return report
+
+
+def bench_structured(num_messages=200, latency=0.02, malformed_rate=0.2):
+    """
+    Structured output against a fake client whose answers are malformed at malformed_rate: usable
+    results, repair requests, emails lost, and the max_tokens asked for (previously a fixed 300),
+    with and without JSON mode. Every result must carry the score the fake meant to give, and scores
+    that json.loads accepts but no int can hold (Infinity, NaN, huge integers) must be sent for repair.
+    """
+    for score in ('Infinity', '-Infinity', 'NaN', '1' + '0' * 400):
+        try:
+            SUMMARY_VALIDATOR.validate(parse_json(f'{{"summary": "s", "importance_score": {score}}}')[0])
+        except SchemaError:
+            continue
+        raise AssertionError(f"importance_score {score[:12]} was accepted")
+
+    emails = make_emails(num_messages, body_size=400)
+    expected = {email.message_id: FakeGroqClient.score_for(email.subject) for email in emails}
+    report = {'num_messages': num_messages, 'latency': latency, 'malformed_rate': malformed_rate,
+              'previous_max_tokens': 300}
+    counters = ('llm_json_retries', 'llm_json_repairs', 'llm_json_failures', 'llm_score_coerced', 'llm_truncated')
+    saved_json_mode = Config.LLM_JSON_MODE
+
+    try:
+        for mode in ('plain', 'json_mode'):
+            Config.LLM_JSON_MODE = mode == 'json_mode'
+            client = FakeGroqClient(latency=latency, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9,
+                                    malformed_rate=malformed_rate)
+            llm = make_llm_processor(client)
+            llm.rate_limiter = RateLimiter(10 ** 6, 10 ** 9)
+            before = metrics.snapshot()['counters']
+
+            start = time.perf_counter()
+            results = llm.process_emails_in_parallel(emails)
+            elapsed = time.perf_counter() - start
+
+            after = metrics.snapshot()['counters']
+            wrong = [r for r in results if r.importance_score != expected[r.message_id]]
+            assert not wrong, f"{mode}: {len(wrong)} wrong scores, e.g. {wrong[0].importance_score} " \
+                              f"for {expected[wrong[0].message_id]}"
+            report[mode] = {
+                'seconds': round(elapsed, 4),
+                'results': len(results),
+                'lost': num_messages - len(results),
+                'wrong_scores': len(wrong),
+                'requests': client.requests,
+                'malformed_answers': client.malformed,
+                'completion_tokens': client.completion_tokens,
+                'average_max_tokens': round(client.max_tokens_requested / max(client.requests, 1), 1),
+                **{name: int(after.get(name, 0) - before.get(name, 0)) for name in counters},
+            }
+    finally:
+        Config.LLM_JSON_MODE = saved_json_mode
+
+    return report
+
+
+def bench_cascade(num_messages=200, latency=0.2, small_latency=0.04):
+    """
+    The single-model baseline (Config.GROQ_MODEL for every email) against the model cascade on the
+    same emails: requests per model, per-email latency, escalations, and how often the cascade's
+    final urgent / not-urgent call matches the baseline's
+    """
+    emails = make_emails(num_messages, body_size=400)
+    small, large = Config.LLM_CASCADE_TIERS[0], Config.LLM_CASCADE_TIERS[-1]
+    report = {'num_messages': num_messages, 'tiers': list(Config.LLM_CASCADE_TIERS),
+              'latency': {small: small_latency, large: latency}}
+    saved_cascade = Config.LLM_CASCADE
+    scores = {}
+
+    try:
+        for mode in ('baseline', 'cascade'):
+            Config.LLM_CASCADE = mode == 'cascade'
+            client = FakeGroqClient(latency=latency, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9,
+                                    model_latency={small: small_latency}, noisy_models=(small,))
+            llm = make_llm_processor(client)
+            llm.rate_limiter = RateLimiter(10 ** 6, 10 ** 9)
+            metrics.reset()
+
+            start = time.perf_counter()
+            results = llm.process_emails_in_parallel(emails)
+            elapsed = time.perf_counter() - start
+
+            snapshot = metrics.snapshot()
+            scores[mode] = {r.message_id: r.importance_score for r in results}
+            email_seconds = snapshot['histograms'].get('llm_email_seconds', {})
+            report[mode] = {
+                'seconds': round(elapsed, 4),
+                'results': len(results),
+                'requests_by_model': dict(client.requests_by_model),
+                'prompt_tokens': client.prompt_tokens,
+                'email_p50': round(email_seconds.get('p50', 0), 4),
+                'email_p95': round(email_seconds.get('p95', 0), 4),
+                'counters': {name: value for name, value in snapshot['counters'].items() if name.startswith('cascade_')},
+            }
+    finally:
+        Config.LLM_CASCADE = saved_cascade
+
+    urgent = Config.LLM_CASCADE_URGENT_SCORE
+    shared = scores['baseline'].keys() & scores['cascade'].keys()
+    report['urgency_agreement_with_baseline'] = round(
+        sum((scores['baseline'][m] >= urgent) == (scores['cascade'][m] >= urgent) for m in shared) / max(len(shared), 1), 4)
+    report['large_model_request_reduction'] = round(
+        report['baseline']['requests_by_model'].get(large, 0) / max(report['cascade']['requests_by_model'].get(large, 0), 1), 2)
+    return report
+
+
+def baseline_email_body(payload):
+    """The original top-level-parts extraction with BeautifulSoup, kept as the reference point"""
+    from bs4 import BeautifulSoup
+
+    all_parts_text = []
+    for part in payload.get('parts', [payload]):
+        data = part.get('body', {}).get('data')
+        if not data:
+            continue
+        decoded_str = base64.urlsafe_b64decode(data).decode('utf-8')
+        if part.get('mimeType') == 'text/plain':
+            all_parts_text.append(decoded_str)
+        elif part.get('mimeType') == 'text/html':
+            all_parts_text.append(BeautifulSoup(decoded_str, 'html.parser').get_text(separator='\n'))
+    return "\n\n".join(all_parts_text)
+
+
+def bench_push(num_messages=100, latency=0.01, burst_size=10, debounce_seconds=0.1):
+    """
+    Push delivery end to end: a fake Pub/Sub publisher POSTs one notification per new message to a
+    local PushReceiver, the NotificationDebouncer collapses each burst of burst_size into as few
+    incremental fetches as it can, and each burst is timed from its last notification until every
+    message in it has been fetched
+    """
+    service = FakeGmailService(num_messages=0, latency=latency)
+    handler = GmailHandler()
+    fetched = []
+    burst_seconds = []
+    report = {'num_messages': num_messages, 'latency': latency, 'burst_size': burst_size,
+              'debounce_seconds': debounce_seconds}
+
+    with tempfile.TemporaryDirectory() as root:
+        sync = IncrementalSync(os.path.join(root, 'Sync_State.json'), handler)
+        sync.commit(sync.list_new_message_ids(service)[1])
+
+        def on_notification(history_id):
+            message_ids, latest_history_id = sync.list_new_message_ids(service, max_results=num_messages)
+            fetched.extend(handler.fetch_messages_batched(service, message_ids, mark_read=False))
+            sync.commit(latest_history_id)
+
+        debouncer = NotificationDebouncer(on_notification, debounce_seconds)
+        receiver = PushReceiver(debouncer, host='127.0.0.1', port=0, verification_token='benchmark')
+        receiver.start()
+        try:
+            publisher = FakePublisher(service, f"http://127.0.0.1:{receiver.port}/?token=benchmark")
+            for first in range(0, num_messages, burst_size):
+                delivered = min(first + burst_size, num_messages)
+                publisher.deliver(delivered - first)
+                start = time.perf_counter()
+                deadline = start + 10 + debounce_seconds
+                while len(fetched) < delivered and time.perf_counter() < deadline:
+                    time.sleep(0.001)
+                burst_seconds.append(time.perf_counter() - start)
+        finally:
+            receiver.stop()
+
+    burst_seconds.sort()
+    report.update({
+        'notifications_published': publisher.published,
+        'notifications_received': receiver.received,
+        'fetch_runs': debouncer.triggers,
+        'emails_fetched': len(fetched),
+        'emails_missed': num_messages - len({email.message_id for email in fetched}),
+        'p50_burst_seconds': round(burst_seconds[len(burst_seconds) // 2], 4),
+        'max_burst_seconds': round(burst_seconds[-1], 4),
+    })
+    return report
+
+
+def bench_mime(num_payloads=200):
+    """Microbenchmark of body extraction over a synthetic MIME corpus, old path vs new extractor"""
+    payloads = make_mime_payloads(num_payloads)
+    report = {'num_payloads': num_payloads,
+              'payload_bytes': sum(len(json.dumps(p)) for p in payloads)}
+
+    for mode, extract in (('baseline_bs4', baseline_email_body),
+                          ('extractor', lambda p: extract_body(p, max_chars=Config.EMAIL_BODY_CHAR_LIMIT))):
+        start = time.perf_counter()
+        texts = [extract(p) for p in payloads]
+        elapsed = time.perf_counter() - start
+        report[mode] = {
+            'seconds': round(elapsed, 4),
+            'payloads_per_second': round(num_payloads / elapsed, 1),
+            'empty_bodies': sum(1 for t in texts if not t.strip()),
+        }
+
+    report['speedup'] = round(report['baseline_bs4']['seconds'] / max(report['extractor']['seconds'], 1e-9), 2)
+    return report
+
+
+# (name, body, text that must survive condensing, text that must not)
+CONDENSE_CASES = [
+    ('forwarded', "FYI, see below\n\n---------- Forwarded message ---------\nFrom: CEO <ceo@example.com>\n"
+                  "Date: Mon, 3 Jun 2024 at 09:12\nSubject: Production database is down\nTo: ops@example.com\n\n"
+                  "Production database is down, all hands needed now.",
+     'Production database is down, all hands', None),
+    ('outlook_forward', "See the note below.\n________________________________\nFrom: Legal <legal@example.com>\n"
+                        "Sent: Monday, June 3, 2024 9:00 AM\nTo: Ana\nSubject: FW: contract deadline\n\n"
+                        "The contract must be signed by Friday.",
+     'signed by Friday', None),
+    ('separator_line', "Agenda for tomorrow\n______________________________\nItem 1: budget review\nItem 2: hiring plan",
+     'Item 2: hiring plan', None),
+    ('gmail_reply', "Sounds good, ship it.\n\nOn Mon, Jun 3, 2024 at 9:00 AM Bob <bob@example.com> wrote:\n"
+                    "> Can we ship today?\n> Old question",
+     'ship it', 'Old question'),
+    ('outlook_reply', "Approved.\n\n________________________________\nFrom: Bob <bob@example.com>\n"
+                      "Sent: Monday, June 3, 2024 9:00 AM\nTo: Ana\nSubject: RE: budget\n\nPlease approve the budget.",
+     'Approved.', 'Please approve'),
+    ('unquoted_wrote', "On Monday the vendor wrote:\nthe shipment will be late by two weeks.",
+     'late by two weeks', None),
+    ('mid_body_markers', "Please update the privacy policy page.\n--\nAlso the unsubscribe link is broken.\n"
+                         + "\n".join(f"Detail {i}" for i in range(12)) + "\n\nThanks\n--\nAna\n\nUnsubscribe | Privacy policy",
+     'unsubscribe link is broken', 'Unsubscribe |'),
+]
+
+
+def bench_condense(repeat=200):
+    """
+    Checks that condensing keeps forwarded content, separator lines and mid-body markers while
+    dropping reply history and trailing footers, then times it over the same cases
+    """
+    report = {'cases': len(CONDENSE_CASES), 'repeat': repeat}
+    for name, body, kept, dropped in CONDENSE_CASES:
+        text = condense_body(body)[0]
+        assert kept in text, f"{name}: lost {kept!r}: {text!r}"
+        assert dropped is None or dropped not in text, f"{name}: kept {dropped!r}: {text!r}"
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, body, _, _ in CONDENSE_CASES:
+            condense_body(body)
+    elapsed = time.perf_counter() - start
+    report['bodies_per_second'] = round(repeat * len(CONDENSE_CASES) / elapsed, 1)
+    return report
+
+
+def bench_parse(num_payloads=400, workers=None):
+    """
+    parse_messages over the synthetic MIME corpus, inline vs the parse pool. The pool is started
+    before timing, so the figure is the steady state of a long-running watch or backlog process.
+    """
+    workers = workers or os.cpu_count()
+    messages = [{'id': f"msg{i:06d}", 'threadId': f"thread{i:06d}", 'payload': payload}
+                for i, payload in enumerate(make_mime_payloads(num_payloads))]
+    report = {'num_payloads': num_payloads, 'workers': workers, 'chunk_size': Config.PARSE_CHUNK_SIZE,
+              'payload_bytes': sum(len(json.dumps(m['payload'])) for m in messages)}
+
+    handler = GmailHandler()
+    pool = ParsePool(workers=workers, min_messages=1)
+    pool.extract_bodies([messages[0]['payload']] * workers)  # Warm-up: spawn and import in every worker
+    bodies = {}
+    try:
+        for mode, parse_pool in (('inline', None), ('pool', pool)):
+            handler.parse_pool = parse_pool
+            start = time.perf_counter()
+            emails = handler.parse_messages(messages)
+            elapsed = time.perf_counter() - start
+            bodies[mode] = [email.body for email in emails]
+            report[mode] = {
+                'seconds': round(elapsed, 4),
+                'payloads_per_second': round(num_payloads / elapsed, 1),
+            }
+    finally:
+        pool.shutdown()
+
+    report['identical_bodies'] = bodies['inline'] == bodies['pool']
+    report['speedup'] = round(report['inline']['seconds'] / max(report['pool']['seconds'], 1e-9), 2)
+    return report
+
+
+def bench_startup(runs=5):
+    """
+    Median wall time of `python Automation.py stats` and of importing Automation in a fresh
+    interpreter, plus the per-run cost of getting the Gmail service the first time and once cached
+    """
+    from google.oauth2.credentials import Credentials
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    report = {'runs': runs}
+
+    with tempfile.TemporaryDirectory() as root:
+        # Config paths are relative (../Email_Summarizer/...), so run from a sibling of a scratch state directory
+        work_dir = os.path.join(root, 'work')
+        os.makedirs(work_dir)
+        os.makedirs(os.path.join(root, 'Email_Summarizer'))
+        for name, command in (('stats_seconds', [sys.executable, os.path.join(script_dir, 'Automation.py'), 'stats']),
+                              ('import_seconds', [sys.executable, '-c', 'import Automation'])):
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run(command, cwd=work_dir, capture_output=True,
+                               env={**os.environ, 'PYTHONPATH': script_dir})
+                timings.append(time.perf_counter() - start)
+            report[name] = round(sorted(timings)[len(timings) // 2], 4)
+
+    # Offline credentials that stay valid for the whole measurement, so no refresh is attempted
+    handler = GmailHandler()
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+    handler.creds = Credentials(token='benchmark', expiry=expiry)
+    for name in ('first_service_seconds', 'cached_service_seconds'):
+        start = time.perf_counter()
+        handler.get_service()
+        report[name] = round(time.perf_counter() - start, 6)
+    return report
+
+
+SUITE_SIZES = (10, 100, 1000, 10000)
+
+
+def measure(fn, stage_metrics, count_items):
+    """
+    Runs fn once with tracemalloc active and the metrics registry reset, then reports wall time,
+    items per second, peak traced memory and p50/p95/p99 of the given metric histograms.
+    Timings include tracemalloc's overhead, which is the same for every commit being compared.
+    """
+    metrics.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    items = count_items(result)
+    snapshot = metrics.snapshot()
+    report = {
+        'seconds': round(elapsed, 4),
+        'items': items,
+        'items_per_second': round(items / max(elapsed, 1e-9), 2),
+        'peak_memory_mb': round(peak / 2 ** 20, 2),
+    }
+    for name in stage_metrics:
+        h = snapshot['histograms'].get(name)
+        if h:
+            report[name] = {key: round(h[key], 6) for key in ('count', 'p50', 'p95', 'p99', 'max')}
+    report['counters'] = snapshot['counters']
+    return report
+
+
+def fast_llm_processor(latency, error_rate, seed=0):
+    """LLM_Processor on a fake client whose limits never bind, so the measurement is our own overhead"""
+    client = FakeGroqClient(latency=latency, requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12,
+                            error_rate=error_rate, seed=seed)
+    llm = make_llm_processor(client)
+    llm.rate_limiter = RateLimiter(10 ** 9, 10 ** 12)
+    return llm
+
+
+def suite_fetch(size, settings):
+    service = FakeGmailService(num_messages=size, latency=settings['gmail_latency'],
+                               error_rate=settings['gmail_error_rate'], html=settings['html'],
+                               body_size=settings['body_size'])
+    handler = GmailHandler()
+    report = measure(lambda: handler.fetch_emails_full_body(service, max_results=size),
+                     ('gmail_batch_get_seconds', 'mime_parse_seconds'), len)
+    report['round_trips'] = service.round_trips
+    return report
+
+
+def suite_body(size, settings):
+    payloads = make_mime_payloads(size)
+    handler = GmailHandler()
+    return measure(lambda: [handler.get_email_body(p, i) for i, p in enumerate(payloads, 1)],
+                   ('mime_parse_seconds',), len)
+
+
+def suite_llm(size, settings):
+    emails = make_emails(size, html=settings['html'], body_size=settings['body_size'])
+    llm = fast_llm_processor(settings['groq_latency'], settings['groq_error_rate'])
+    report = measure(lambda: llm.process_emails_in_parallel(emails),
+                     ('llm_email_seconds', 'llm_request_seconds', 'llm_queue_wait_seconds', 'condense_seconds'), len)
+    report['lost'] = size - report['items']
+    report['final_concurrency'] = llm.concurrency.limit
+    return report
+
+
+def suite_run(size, settings, pipeline=False):
+    """run_email_analysis end to end with fakes in place of Gmail/Groq and state files in a temp directory"""
+    service = FakeGmailService(num_messages=size, latency=settings['gmail_latency'],
+                               error_rate=settings['gmail_error_rate'], html=settings['html'],
+                               body_size=settings['body_size'])
+    llm = fast_llm_processor(settings['groq_latency'], settings['groq_error_rate'])
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        saved = (Config.MAX_EMAILS_PER_RUN, Config.METRICS_FILE)
+        Config.MAX_EMAILS_PER_RUN = size
+        Config.METRICS_FILE = os.path.join(state_dir, 'Metrics.json')
+        store = ResultsStore(os.path.join(state_dir, 'Email_Results.db'))
+        try:
+            scheduler = Automation.EmailAutomationScheduler(
+                {'name': 'bench', 'token_file': os.path.join(state_dir, 'Token.json'),
+                 'stats_file': os.path.join(state_dir, 'Automation_Stats.json'),
+                 'stats_journal_file': os.path.join(state_dir, 'Automation_Runs.jsonl'),
+                 'sync_state_file': os.path.join(state_dir, 'Sync_State.json')},
+                llm_processor=llm, results_store=store)
+            scheduler.gmail_handler.authenticate_gmail = lambda: True
+            scheduler.gmail_handler.build_service = lambda creds: service
+            # The run's progress output goes to stderr so stdout stays valid JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                report = measure(lambda: scheduler.run_email_analysis(pipeline=pipeline),
+                                 ('run_seconds', 'gmail_list_seconds', 'gmail_batch_get_seconds', 'mime_parse_seconds',
+                                  'llm_email_seconds', 'store_write_seconds'),
+                                 lambda count: count or 0)
+        finally:
+            store.close()
+            Config.MAX_EMAILS_PER_RUN, Config.METRICS_FILE = saved
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def bench_suite(sizes=SUITE_SIZES, gmail_latency=0.01, groq_latency=0.02, gmail_error_rate=0.0,
+                groq_error_rate=0.0, body_size=2000, html=True):
+    """
+    Drives fetch_emails_full_body, get_email_body, process_emails_in_parallel and
+    run_email_analysis (batch and pipeline) over each inbox size and collects one JSON report
+    """
+    settings = {'gmail_latency': gmail_latency, 'groq_latency': groq_latency,
+                'gmail_error_rate': gmail_error_rate, 'groq_error_rate': groq_error_rate,
+                'body_size': body_size, 'html': html}
+    saved_backoff = Config.LLM_BACKOFF_BASE_SECONDS, Config.GMAIL_BATCH_BACKOFF_SECONDS
+    # Keep injected-error retries on the fakes' time scale
+    Config.LLM_BACKOFF_BASE_SECONDS, Config.GMAIL_BATCH_BACKOFF_SECONDS = groq_latency, gmail_latency
+
+    report = {'commit': git_commit(), 'timestamp': datetime.now().isoformat(), 'settings': settings, 'results': {}}
+    try:
+        for size in sizes:
+            print(f"Benchmarking {size} messages...", file=sys.stderr)
+            report['results'][str(size)] = {
+                'fetch_emails_full_body': suite_fetch(size, settings),
+                'get_email_body': suite_body(size, settings),
+                'process_emails_in_parallel': suite_llm(size, settings),
+                'run_email_analysis': suite_run(size, settings),
+                'run_email_analysis_pipeline': suite_run(size, settings, pipeline=True),
+            }
+    finally:
+        Config.LLM_BACKOFF_BASE_SECONDS, Config.GMAIL_BATCH_BACKOFF_SECONDS = saved_backoff
+    return report
+
+
+def compare_reports(before, after):
+    """Throughput and peak memory ratios (after / before) for every size and benchmark both reports share"""
+    comparison = {'before': before.get('commit'), 'after': after.get('commit'), 'results': {}}
+    for size, benches in after['results'].items():
+        for name, result in benches.items():
+            old = before['results'].get(size, {}).get(name)
+            if not old:
+                continue
+            comparison['results'].setdefault(size, {})[name] = {
+                'throughput_ratio': round(result['items_per_second'] / max(old['items_per_second'], 1e-9), 3),
+                'peak_memory_ratio': round(result['peak_memory_mb'] / max(old['peak_memory_mb'], 1e-9), 3),
+            }
+    return comparison
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if mode == "suite":
+        max_messages = int(sys.argv[2]) if len(sys.argv) > 2 else SUITE_SIZES[-1]
+        report = bench_suite([size for size in SUITE_SIZES if size <= max_messages] or [max_messages])
+        output = json.dumps(report, indent=2)
+        if len(sys.argv) > 3:
+            with open(sys.argv[3], 'w') as f:
+                f.write(output)
+        print(output)
+        return
+    if mode == "startup":
+        print(json.dumps(bench_startup(int(sys.argv[2]) if len(sys.argv) > 2 else 5), indent=2))
+        return
+    if mode == "parse":
+        num_payloads = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+        print(json.dumps(bench_parse(num_payloads, int(sys.argv[3]) if len(sys.argv) > 3 else None), indent=2))
+        return
+    if mode == "compare" and len(sys.argv) > 3:
+        with open(sys.argv[2]) as f_before, open(sys.argv[3]) as f_after:
+            print(json.dumps(compare_reports(json.load(f_before), json.load(f_after)), indent=2))
+        return
+
+    num_messages = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    if mode == "fetch":
+        print(json.dumps(bench_fetch(num_messages or 15, latency), indent=2))
+    elif mode == "llm":
+        print(json.dumps(bench_llm(num_messages or 60, latency), indent=2))
+    elif mode == "batch":
+        print(json.dumps(bench_batch(num_messages or 60, latency), indent=2))
+    elif mode == "mime":
+        print(json.dumps(bench_mime(num_messages or 200), indent=2))
+    elif mode == "dedup":
+        print(json.dumps(bench_dedup(num_messages or 200, latency), indent=2))
+    elif mode == "structured":
+        print(json.dumps(bench_structured(num_messages or 200, latency if len(sys.argv) > 3 else 0.02), indent=2))
+    elif mode == "alerts":
+        print(json.dumps(bench_alerts(num_messages or 200, latency), indent=2))
+    elif mode == "cascade":
+        print(json.dumps(bench_cascade(num_messages or 200, latency if len(sys.argv) > 3 else 0.2), indent=2))
+    elif mode == "condense":
+        print(json.dumps(bench_condense(), indent=2))
+    elif mode == "push":
+        print(json.dumps(bench_push(num_messages or 100, latency if len(sys.argv) > 3 else 0.01), indent=2))
+    else:
+        print("Usage: python Benchmark.py [fetch|llm|batch|mime|dedup|cascade|alerts|structured|push] [num_messages] [latency_seconds]")
+        print("       python Benchmark.py condense")
+        print("       python Benchmark.py parse [num_payloads] [workers]")
+        print("       python Benchmark.py startup [runs]")
+        print("       python Benchmark.py suite [max_messages] [output.json]")
+        print("       python Benchmark.py compare <before.json> <after.json>")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,158 @@ class Config:
     
     # Groq API settings
     GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+    GROQ_MODEL = "llama3-70b-8192"
+    # Starting client-side limits; the x-ratelimit-limit-* response headers replace them
+    GROQ_REQUESTS_PER_MINUTE = 30
+    GROQ_TOKENS_PER_MINUTE = 6000
+    
+    # Prompt body budgets in tokens, after quoted history, signatures and boilerplate are removed
+    MODEL_BODY_TOKEN_BUDGETS = {
+        "llama3-70b-8192": 300,
+        "llama3-8b-8192": 400,
+    }
+    DEFAULT_BODY_TOKEN_BUDGET = 300
+    
+    # LLM concurrency and retry settings (concurrency adapts between 1 and LLM_MAX_CONCURRENCY)
+    LLM_INITIAL_CONCURRENCY = 4
+    LLM_MAX_CONCURRENCY = 16
+    LLM_MAX_RETRIES = 6
+    LLM_BACKOFF_BASE_SECONDS = 1.0
+    
+    # Model cascade: LLM_CASCADE_TIERS are asked smallest first; an answer goes to the next tier when its score is
+    # within LLM_CASCADE_ESCALATE_MARGIN of the urgent score, its confidence is below LLM_CASCADE_MIN_CONFIDENCE,
+    # or it falls in the LLM_CASCADE_AUDIT_RATE sample used to measure agreement. The last tier always answers.
+    LLM_CASCADE = False
+    LLM_CASCADE_TIERS = ["llama3-8b-8192", "llama3-70b-8192"]
+    LLM_CASCADE_URGENT_SCORE = 8
+    LLM_CASCADE_ESCALATE_MARGIN = 1  # 7-9 are re-scored by the next tier
+    LLM_CASCADE_MIN_CONFIDENCE = 0.7
+    LLM_CASCADE_AUDIT_RATE = 0.05
+    
+    # Structured output: JSON mode where the model supports it, responses checked against a schema (importance_score
+    # an integer 1-10, '85%' and '85/100' rescaled), max_tokens sized from recent completions, and a short repair
+    # request when a response can't be used (including a bare score outside 1-10) instead of a default score
+    LLM_JSON_MODE = True
+    LLM_JSON_REPAIR_RETRIES = 1
+    LLM_OUTPUT_TOKENS_INITIAL = 160
+    LLM_OUTPUT_TOKENS_MIN = 64
+    LLM_OUTPUT_TOKENS_MAX = 300
+    LLM_OUTPUT_TOKENS_HEADROOM = 1.3  # Multiplier on the p99 completion size
+    
+    # Batched prompts: several emails per completion, up to a prompt token budget. Only plain once/start runs
+    # batch; `once --pipeline` and multi-account runs summarize one email (or group) per call
+    LLM_BATCH_MODE = False
+    LLM_BATCH_TOKEN_BUDGET = 3000
+    LLM_BATCH_MAX_EMAILS = 10
     
     # Automation settings
     AUTOMATION_INTERVAL_MINUTES = 30
+    SCHEDULER_OVERRUN_POLICY = 'coalesce'  # 'coalesce' runs once for missed deadlines, 'skip' waits for the next one
+    ADAPTIVE_INTERVAL = False  # Shorten the interval on busy inboxes, lengthen it when idle
+    ADAPTIVE_MIN_INTERVAL_MINUTES = 2
+    ADAPTIVE_MAX_INTERVAL_MINUTES = 60
+    ADAPTIVE_BUSY_THRESHOLD = 3  # New emails in one run that count as busy
+    ADAPTIVE_IDLE_FACTOR = 1.5
     MAX_EMAILS_PER_RUN = 15
+    EMAIL_BODY_CHAR_LIMIT = 4000  # Raw body text extracted per email, before condensing to the token budget
+    
+    # Gmail batch settings (Gmail allows up to 100 calls per batch, 50 is the recommended ceiling)
+    GMAIL_BATCH_SIZE = 50
+    GMAIL_BATCH_RETRIES = 1
+    GMAIL_BATCH_BACKOFF_SECONDS = 1.0  # Base of the jittered exponential wait before each retry round
+    GMAIL_TOKEN_REFRESH_MARGIN_SECONDS = 300  # Refresh the access token this long before it expires
+    
+    # Incremental sync settings (history IDs replace re-listing is:unread, so messages no longer need marking read)
+    INCREMENTAL_SYNC = True
+    MARK_AS_READ = False
+    SYNC_MAX_ATTEMPTS = 3  # Runs a message may fail (fetch or LLM) before it is dropped; deleted messages are dropped at once
+    
+    # Summary cache settings
+    CACHE_ENABLED = True
+    CACHE_TTL_SECONDS = 7 * 24 * 3600
+    CACHE_MAX_ENTRIES = 5000
+    
+    # Local triage: bulk mail is scored without an LLM call
+    TRIAGE_ENABLED = True
+    TRIAGE_BULK_THRESHOLD = 3  # Summed rule weight (List-Unsubscribe=2, Precedence: bulk=2, promotions label=3, ...)
+    TRIAGE_BULK_SCORE = 2
+    TRIAGE_AUDIT_RATE = 0.05  # Share of bulk mail still sent to the LLM to measure agreement
+    TRIAGE_BULK_DOMAINS = ['mailchimp.com', 'mcsv.net', 'sendgrid.net', 'mailgun.org', 'amazonses.com',
+                           'sparkpostmail.com', 'mktomail.com', 'hubspotemail.net', 'exacttarget.com']
+    TRIAGE_PROTECTED_SENDERS = []  # Addresses or domains that always go to the LLM
+    TRIAGE_MODEL_THRESHOLD = 0.9  # Trained-model probability of a low score needed to skip the LLM
+    TRIAGE_LOW_SCORE_MAX = 4
+    TRIAGE_MIN_TRAINING_SAMPLES = 200
+    
+    # Results store settings (rows buffered per SQLite transaction)
+    RESULTS_WRITE_BATCH = 100
+    
+    # Push notification settings (`python Automation.py watch`); the Pub/Sub topic must allow
+    # gmail-api-push@system.gserviceaccount.com to publish, and its push subscription must point at this host
+    GMAIL_PUSH_TOPIC = os.environ.get("GMAIL_PUSH_TOPIC")  # projects/<project-id>/topics/<topic>
+    PUSH_HOST = '127.0.0.1'  # Put a reverse proxy or tunnel in front; use '0.0.0.0' only together with PUSH_VERIFICATION_TOKEN
+    PUSH_PORT = 8080
+    PUSH_VERIFICATION_TOKEN = os.environ.get("PUSH_VERIFICATION_TOKEN")  # Expected ?token= on the push endpoint URL
+    PUSH_DEBOUNCE_SECONDS = 5
+    WATCH_RENEW_HOURS = 24  # Gmail watches expire after 7 days; Google recommends renewing daily
+    
+    # Metrics settings (per-stage histograms, `python Automation.py stats --detailed`)
+    METRICS_MAX_SAMPLES = 2000  # Recent observations kept per histogram for percentiles
+    METRICS_HOST = '127.0.0.1'  # '0.0.0.0' lets a Prometheus server on another host scrape it
+    METRICS_PORT = None  # e.g. 9108 to serve Prometheus text at /metrics while start/watch run
+    PROFILE_RUNS = False  # Dump a cProfile file per run into PROFILE_DIR
+    
+    # Grouping settings: one summary per Gmail thread / group of near-identical emails, copied to every member
+    # (per run, per account in multi-account runs, and per window of parsed emails with --pipeline)
+    DEDUP_ENABLED = True
+    DEDUP_GROUP_THREADS = True
+    DEDUP_MAX_DISTANCE = 3  # SimHash bits (of 64) two emails from the same sender may differ by
+    
+    # Priority-first processing: emails are summarized in order of a cheap urgency prior (allowlisted senders,
+    # urgent subject keywords, direct vs Cc, Gmail's IMPORTANT label) and every result scoring ALERT_MIN_SCORE
+    # or more goes to the ALERT_SINKS ('stdout', 'file', 'webhook') as soon as it is ready
+    PRIORITY_ORDER = True
+    PRIORITY_SENDERS = []  # Addresses or domains summarized first
+    PRIORITY_MY_ADDRESSES = []  # Your own addresses, to tell direct mail from Cc (otherwise a short To list counts as direct)
+    PRIORITY_DIRECT_MAX_RECIPIENTS = 3
+    ALERT_MIN_SCORE = 8
+    ALERT_SINKS = ['stdout']
+    ALERT_WEBHOOK_URL = None  # e.g. 'http://localhost:5000/alerts'
+    ALERT_WEBHOOK_TIMEOUT_SECONDS = 5
+    
+    # Stats journal settings (every run appended to STATS_JOURNAL_FILE; STATS_FILE holds the running totals)
+    STATS_RECENT_RUNS = 5
+    STATS_COMPACT_AFTER_DAYS = 90  # `stats compact` rolls older runs up into one line per day
+    
+    # Multi-account settings (accounts fetched concurrently; LLM calls share one pool and rate limit)
+    ACCOUNT_FETCH_WORKERS = 4
+    
+    # Backlog settings (`python Automation.py backlog`): list pages of up to 500 IDs, processed in bounded windows
+    BACKLOG_PAGE_SIZE = 500
+    BACKLOG_WINDOW_SIZE = 100
+    
+    # Parse pool settings: with 2 or more workers, decoding and HTML stripping of batched fetches run in
+    # worker processes, PARSE_CHUNK_SIZE payloads per task; smaller sets than PARSE_POOL_MIN_MESSAGES stay inline
+    PARSE_WORKERS = 0
+    PARSE_CHUNK_SIZE = 16
+    PARSE_POOL_MIN_MESSAGES = 32
+    
+    # Pipeline settings (used by `once --pipeline`)
+    PIPELINE_QUEUE_SIZE = 20
+    PIPELINE_BATCH_SIZE = 10
     
     # File paths
     CREDENTIALS_FILE = '../Email_Summarizer/Credentials.json'
     TOKEN_FILE = '../Email_Summarizer/Token.json'
     STATS_FILE = '../Email_Summarizer/Automation_Stats.json'
+    STATS_JOURNAL_FILE = '../Email_Summarizer/Automation_Runs.jsonl'
+    SYNC_STATE_FILE = '../Email_Summarizer/Sync_State.json'
+    CACHE_FILE = '../Email_Summarizer/Summary_Cache.db'
+    RESULTS_DB = '../Email_Summarizer/Email_Results.db'
     LOG_FILE = '../Email_Summarizer/Email_Automation.log'
+    ACCOUNTS_FILE = '../Email_Summarizer/Accounts.json'
+    METRICS_FILE = '../Email_Summarizer/Metrics.json'
+    TRIAGE_MODEL_FILE = '../Email_Summarizer/Triage_Model.json'
+    BACKLOG_CHECKPOINT_FILE = '../Email_Summarizer/Backlog_Checkpoint.json'
+    ALERT_FILE = '../Email_Summarizer/Alerts.jsonl'
+    PROFILE_DIR = '../Email_Summarizer/Profiles'
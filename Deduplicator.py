@@ -0,0 +1,193 @@
+"""
+Grouping stage between fetch and the LLM
+Messages from the same Gmail thread, and near-identical messages from the same sender (CI alerts,
+monitoring pings, repeated notifications, matched by SimHash over the subject and body), are
+summarized once per group and the result is copied to every member.
+"""
+
+import hashlib
+import re
+import logging
+from Config import Config
+from Email_Record import EmailRecord, SummaryResult
+from Metrics import metrics
+from Text_Condenser import strip_quoted_history, strip_signature, collapse_urls, collapse_whitespace, \
+    truncate_to_tokens, token_budget_for
+
+WORD = re.compile(r'[a-z0-9]+')
+DIGITS = re.compile(r'\d+')
+
+GROUP_THREAD = 'thread'
+GROUP_NEAR_DUPLICATE = 'near_duplicate'
+
+
+def simhash(text, bits=64, shingle_size=3):
+    """
+    SimHash of the word shingles in text. Numbers are normalized first, so alerts that differ
+    only in counters, IDs or timestamps hash close together.
+    """
+    words = WORD.findall(DIGITS.sub('0', collapse_urls(text.lower())))
+    if len(words) > shingle_size:
+        shingles = {' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    else:
+        shingles = {' '.join(words)}
+
+    weights = [0] * bits
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=bits // 8).digest(), 'big')
+        for bit in range(bits):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def sender_address(sender):
+    match = re.search(r'<([^>]+)>', sender or '')
+    return (match.group(1) if match else sender or '').strip().lower()
+
+
+class EmailGroup:
+    """
+    Emails summarized together. members keeps the fetch order; the first member is the
+    representative whose message ID the shared summary is keyed on.
+    """
+    __slots__ = ('members', 'kinds')
+
+    def __init__(self, members, kinds):
+        self.members = members
+        self.kinds = kinds  # Set of GROUP_THREAD / GROUP_NEAR_DUPLICATE
+
+    @property
+    def representative(self):
+        return self.members[0]
+
+    def combined_email(self, model=Config.GROQ_MODEL):
+        """
+        The EmailRecord sent to the LLM for the group. Near-duplicates are represented by their first
+        member; a thread gets each message's new text (quoted history removed), each with an equal
+        share of the body budget.
+        """
+        first = self.representative
+        if len(self.members) == 1:
+            return first
+
+        subject = f"{first.subject} [{len(self.members)} messages]"
+        if GROUP_THREAD not in self.kinds:
+            return EmailRecord(first.message_id, first.thread_id, subject, first.sender, first.body,
+                               first.link, first.headers, first.label_ids)
+
+        share = max(1, token_budget_for(model) // len(self.members))
+        parts = []
+        for number, member in enumerate(self.members, 1):
+            lines = strip_signature(strip_quoted_history((member.body or '').splitlines()))
+            text = truncate_to_tokens(collapse_whitespace(lines), share)
+            parts.append(f"[Message {number} of {len(self.members)}, {member.sender}]\n{text}")
+        return EmailRecord(first.message_id, first.thread_id, subject, first.sender, "\n\n".join(parts),
+                           first.link, first.headers, first.label_ids)
+
+
+class Deduplicator:
+    """
+    Args:
+        max_distance: largest SimHash Hamming distance (of 64 bits) still counted as a near-duplicate
+        group_threads: also group messages that share a Gmail thread ID
+    """
+
+    def __init__(self, max_distance=Config.DEDUP_MAX_DISTANCE, group_threads=Config.DEDUP_GROUP_THREADS):
+        self.max_distance = max_distance
+        self.group_threads = group_threads
+
+    def group(self, emails):
+        """Partitions emails into EmailGroups, keeping fetch order within and across groups"""
+        with metrics.span('dedup'):
+            parent = list(range(len(emails)))
+            kinds = [set() for _ in emails]
+
+            def find(i):
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+
+            def union(i, j, kind):
+                root_i, root_j = find(i), find(j)
+                root, other = min(root_i, root_j), max(root_i, root_j)
+                parent[other] = root
+                kinds[root].update(kinds[other] | {kind})
+
+            in_thread = set()
+            if self.group_threads:
+                first_in_thread = {}
+                for i, email in enumerate(emails):
+                    if email.thread_id:
+                        first = first_in_thread.setdefault(email.thread_id, i)
+                        if first != i:
+                            union(first, i, GROUP_THREAD)
+                            in_thread.update((first, i))
+
+            # Conversations stay whole; only standalone messages are matched as near-duplicates,
+            # so two threads can't be chained together through similar-looking replies
+            self.group_near_duplicates(emails, [i for i in range(len(emails)) if i not in in_thread], union)
+
+            groups = {}
+            for i, email in enumerate(emails):
+                groups.setdefault(find(i), []).append(email)
+            result = [EmailGroup(members, kinds[root]) for root, members in groups.items()]
+
+        collapsed = len(emails) - len(result)
+        if collapsed:
+            metrics.inc('dedup_collapsed', collapsed)
+            logging.info(f"Grouped {len(emails)} emails into {len(result)} summaries")
+        return result
+
+    def group_near_duplicates(self, emails, candidates, union):
+        """
+        Splits each 64-bit SimHash into max_distance + 1 bands; two hashes within max_distance
+        bits agree on at least one band, so only emails sharing a band bucket are compared.
+        """
+        if self.max_distance < 0:
+            return
+        bands = self.max_distance + 1
+        width = 64 // bands
+        mask = (1 << width) - 1
+        hashes = {i: simhash(f"{emails[i].subject}\n{emails[i].body or ''}") for i in candidates}
+
+        buckets = {}
+        for i, h in hashes.items():
+            sender = sender_address(emails[i].sender)
+            for band in range(bands):
+                key = (sender, band, h >> (band * width) & mask)
+                bucket = buckets.setdefault(key, [])
+                match = next((j for j in bucket if hamming_distance(h, hashes[j]) <= self.max_distance), None)
+                if match is None:
+                    bucket.append(i)
+                else:
+                    # Joined to a bucket member, so an alert storm keeps its buckets at one entry
+                    union(match, i, GROUP_NEAR_DUPLICATE)
+
+    def fan_out(self, group, result, numbers):
+        """
+        Copies the group's result to every member, each with its own message ID, subject, sender,
+        link and number. Prompt tokens saved are counted on the representative only.
+
+        Args:
+            numbers: message ID -> run index, as given to process_email
+        """
+        group_id = group.representative.message_id
+        results = []
+        for member in group.members:
+            copy = SummaryResult(**result.to_dict())
+            copy.message_id = member.message_id
+            copy.number = numbers.get(member.message_id, result.number)
+            copy.original_subject = member.subject
+            copy.sender = member.sender
+            copy.link = member.link
+            copy.group_id = group_id
+            copy.group_size = len(group.members)
+            if member is not group.representative:
+                copy.tokens_saved = 0
+            results.append(copy)
+        return results
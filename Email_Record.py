@@ -0,0 +1,86 @@
+"""
+Compact, ID-keyed records passed between the fetch, LLM and output stages
+Both classes use __slots__ so holding hundreds of emails per run doesn't pay for a dict per object.
+"""
+
+
+class EmailRecord:
+    """
+    A fetched email. message_id is the Gmail message ID and is carried through to the result.
+    headers holds the lower-cased triage headers (List-Unsubscribe, Precedence, To, ...) and
+    label_ids the Gmail labels (CATEGORY_PROMOTIONS, IMPORTANT, ...).
+    """
+    __slots__ = ('message_id', 'thread_id', 'subject', 'sender', 'body', 'link', 'headers', 'label_ids')
+
+    def __init__(self, message_id, thread_id, subject, sender, body, link, headers=None, label_ids=None):
+        self.message_id = message_id
+        self.thread_id = thread_id
+        self.subject = subject
+        self.sender = sender
+        self.body = body
+        self.link = link
+        self.headers = headers or {}
+        self.label_ids = label_ids or []
+
+    def __repr__(self):
+        return f"EmailRecord({self.message_id!r}, subject={self.subject!r})"
+
+
+class SummaryResult:
+    """
+    The LLM's summary and score for one email, joined to the email by message_id
+    """
+    __slots__ = ('message_id', 'number', 'original_subject', 'sender', 'link', 'summary',
+                 'importance_score', 'importance_level', 'reason', 'tokens_saved', 'processed_at',
+                 'source', 'triage_verdict', 'signals', 'group_id', 'group_size', 'model')
+
+    FIELDS = __slots__
+
+    def __init__(self, message_id, number, original_subject, sender, link, summary, importance_score,
+                 importance_level, reason, tokens_saved=0, processed_at=None, source='llm',
+                 triage_verdict='', signals='', group_id='', group_size=1, model=''):
+        self.message_id = message_id
+        self.number = number
+        self.original_subject = original_subject
+        self.sender = sender
+        self.link = link
+        self.summary = summary
+        self.importance_score = importance_score
+        self.importance_level = importance_level
+        self.reason = reason
+        self.tokens_saved = tokens_saved
+        self.processed_at = processed_at
+        self.source = source  # 'llm' or 'triage' (scored locally without an LLM call)
+        self.triage_verdict = triage_verdict  # 'bulk' when triage would have skipped it, e.g. audited samples
+        self.signals = signals  # Comma-separated triage signals, used to train the triage model
+        self.group_id = group_id  # Message ID of the email summarized for this thread / near-duplicate group
+        self.group_size = group_size
+        self.model = model  # Model that produced the final answer (the answering tier in cascade mode)
+
+    @classmethod
+    def from_response(cls, email, number, response, tokens_saved=0):
+        """Builds a result from the parsed LLM JSON for the given EmailRecord"""
+        try:
+            score = min(10, max(1, int(float(response.get('importance_score', 5)))))
+        except (TypeError, ValueError):
+            score = 5
+        return cls(
+            message_id=email.message_id,
+            number=number,
+            original_subject=email.subject,
+            sender=email.sender,
+            link=email.link,
+            summary=response.get('summary', ''),
+            importance_score=score,
+            importance_level=response.get('importance_level', ''),
+            reason=response.get('reason', ''),
+            tokens_saved=tokens_saved,
+            model=response.get('model', ''),
+        )
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"SummaryResult({self.message_id!r}, score={self.importance_score})"
+
@@ -0,0 +1,587 @@
+"""
+Local stand-ins for the Gmail API and the Groq client so the pipeline can be exercised and timed offline.
+Every call sleeps for a configurable round-trip latency, the same way a real HTTP call blocks.
+"""
+
+import base64
+import collections
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def encode_body(text):
+    """Base64url-encodes text the way Gmail returns message bodies"""
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def make_message(index, html=False, body_size=800, thread_id=None, bulk=False, urgent=False):
+    """
+    Builds a synthetic Gmail message resource (format='full') with a text/plain part
+    and, when html is True, an extra text/html alternative. bulk=True makes it a newsletter
+    with List-Unsubscribe / Precedence headers and the promotions category label; urgent=True
+    an "Urgent:" email sent directly to you and labelled IMPORTANT, which FakeGroqClient scores 8-10.
+    """
+    msg_id = f"msg{index:06d}"
+    text = (f"Hello, this is synthetic email number {index}. " * (body_size // 45 + 1))[:body_size]
+    headers = [
+        {'name': 'Subject', 'value': f"Synthetic subject {index}"},
+        {'name': 'From', 'value': f"sender{index % 25}@example.com"},
+    ]
+    labels = ['INBOX', 'UNREAD']
+    if urgent:
+        headers = [
+            {'name': 'Subject', 'value': f"Urgent: action required on invoice {index}"},
+            {'name': 'From', 'value': f"finance{index % 5}@example.com"},
+            {'name': 'To', 'value': 'me@example.com'},
+        ]
+        labels.append('IMPORTANT')
+    if bulk:
+        headers = [
+            {'name': 'Subject', 'value': f"Weekly newsletter {index}: 20% off everything"},
+            {'name': 'From', 'value': f"news@shop{index % 5}.example.com"},
+            {'name': 'List-Unsubscribe', 'value': f"<https://shop.example.com/unsub?u={index}>"},
+            {'name': 'Precedence', 'value': 'bulk'},
+        ]
+        labels.append('CATEGORY_PROMOTIONS')
+    parts = [{'mimeType': 'text/plain', 'body': {'data': encode_body(text)}}]
+
+    if html:
+        markup = f"<html><body><table><tr><td><p>{text}</p></td></tr></table></body></html>"
+        parts.append({'mimeType': 'text/html', 'body': {'data': encode_body(markup)}})
+
+    return {
+        'id': msg_id,
+        'threadId': thread_id or f"thread{index:06d}",
+        'labelIds': labels,
+        'payload': {
+            'mimeType': 'multipart/alternative',
+            'headers': headers,
+            'body': {},
+            'parts': parts,
+        },
+    }
+
+
+def make_newsletter_html(index, size=50000):
+    """Table-heavy marketing HTML of roughly `size` characters"""
+    row = ('<tr><td style="padding:8px;font-family:Arial"><a href="https://example.com/track?id={i}&u={n}">'
+           '<img src="https://cdn.example.com/{i}.png" width="120"></a></td>'
+           '<td style="padding:8px"><p>Deal {i} of newsletter {n}: save big on items you viewed.</p></td></tr>')
+    rows = []
+    length = 0
+    i = 0
+    while length < size:
+        rows.append(row.format(i=i, n=index))
+        length += len(rows[-1])
+        i += 1
+    return ('<html><head><style>td {color: #333}</style><script>var t = 1;</script></head><body><table>'
+            + ''.join(rows) + '</table></body></html>')
+
+
+def make_mime_payloads(count, seed=0):
+    """
+    Synthetic corpus of Gmail payload shapes: single-part plain, plain+html alternatives,
+    HTML-only newsletters, mixed/alternative with attachments and related HTML with inline images
+    """
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        text = f"Hi team, notes for item {i}. " * rng.randint(5, 200)
+        html = make_newsletter_html(i, size=rng.randint(5000, 80000))
+        plain_part = {'mimeType': 'text/plain', 'body': {'data': encode_body(text)}}
+        html_part = {'mimeType': 'text/html', 'body': {'data': encode_body(html)}}
+        attachment = {'mimeType': 'application/pdf', 'filename': 'report.pdf',
+                      'body': {'attachmentId': f"att{i}", 'size': 20000}}
+        image = {'mimeType': 'image/png', 'filename': 'logo.png', 'body': {'attachmentId': f"img{i}", 'size': 4000}}
+
+        shape = i % 5
+        if shape == 0:
+            payload = dict(plain_part)
+        elif shape == 1:
+            payload = {'mimeType': 'multipart/alternative', 'parts': [plain_part, html_part]}
+        elif shape == 2:
+            payload = dict(html_part)
+        elif shape == 3:
+            payload = {'mimeType': 'multipart/mixed', 'parts': [
+                {'mimeType': 'multipart/alternative', 'parts': [plain_part, html_part]}, attachment]}
+        else:
+            payload = {'mimeType': 'multipart/related', 'parts': [html_part, image]}
+
+        payload['headers'] = [{'name': 'Subject', 'value': f"Payload {i}"}]
+        payload.setdefault('body', {})
+        payloads.append(payload)
+    return payloads
+
+
+class FakeHttpError(HttpError):
+    """A real googleapiclient HttpError carrying only a status code"""
+
+    def __init__(self, status, reason=''):
+        resp = httplib2.Response({'status': status})
+        resp.reason = reason
+        super().__init__(resp, b'', uri='fake://gmail')
+
+
+class _FakeRequest:
+    def __init__(self, service, fn):
+        self._service = service
+        self._fn = fn
+
+    def execute(self):
+        self._service._round_trip()
+        return self._service._call(self._fn)
+
+
+class _FakeBatch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request, callback or self._callback, request_id or str(len(self._requests))))
+
+    def execute(self):
+        # A batch is a single HTTP round-trip regardless of how many calls it carries
+        self._service._round_trip()
+        for request, callback, request_id in self._requests:
+            try:
+                response = self._service._call(request._fn)
+                callback(request_id, response, None)
+            except FakeHttpError as e:
+                callback(request_id, None, e)
+
+
+class _FakeMessages:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId='me', maxResults=100, q=None, pageToken=None, **kwargs):
+        def fn():
+            ids = [m['id'] for m in self._service.messages.values()
+                   if not q or 'is:unread' not in q or 'UNREAD' in m['labelIds']]
+            start = int(pageToken or 0)
+            page = ids[start:start + maxResults]
+            response = {'messages': [{'id': i, 'threadId': self._service.messages[i]['threadId']} for i in page],
+                        'resultSizeEstimate': len(page)}
+            if start + maxResults < len(ids):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        return _FakeRequest(self._service, fn)
+
+    def get(self, userId='me', id=None, format='full', **kwargs):
+        def fn():
+            if id not in self._service.messages:
+                raise FakeHttpError(404, 'Not Found')
+            return self._service.messages[id]
+        return _FakeRequest(self._service, fn)
+
+    def modify(self, userId='me', id=None, body=None):
+        def fn():
+            self._service._remove_labels([id], body.get('removeLabelIds', []))
+            return self._service.messages[id]
+        return _FakeRequest(self._service, fn)
+
+    def batchModify(self, userId='me', body=None):
+        def fn():
+            self._service._remove_labels(body['ids'], body.get('removeLabelIds', []))
+            return ''
+        return _FakeRequest(self._service, fn)
+
+
+class _FakeHistory:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, labelId=None, pageToken=None,
+             maxResults=100):
+        def fn():
+            start_id = int(startHistoryId)
+            if start_id < self._service.oldest_history_id:
+                raise FakeHttpError(404, 'Requested entity was not found.')
+
+            records = [r for r in self._service.history_records if r['id'] > start_id]
+            if labelId:
+                records = [r for r in records
+                           if labelId in r['messagesAdded'][0]['message']['labelIds']]
+            offset = int(pageToken or 0)
+            page = records[offset:offset + maxResults]
+
+            response = {'historyId': str(self._service.history_id)}
+            if page:
+                response['history'] = [{'id': str(r['id']), 'messagesAdded': r['messagesAdded']} for r in page]
+            if offset + maxResults < len(records):
+                response['nextPageToken'] = str(offset + maxResults)
+            return response
+        return _FakeRequest(self._service, fn)
+
+
+class _FakeUsers:
+    def __init__(self, service):
+        self._service = service
+
+    def messages(self):
+        return _FakeMessages(self._service)
+
+    def history(self):
+        return _FakeHistory(self._service)
+
+    def getProfile(self, userId='me'):
+        def fn():
+            return {'emailAddress': 'me@example.com', 'historyId': str(self._service.history_id),
+                    'messagesTotal': len(self._service.messages)}
+        return _FakeRequest(self._service, fn)
+
+    def watch(self, userId='me', body=None):
+        def fn():
+            self._service.watch_topic = body['topicName']
+            self._service.watch_count += 1
+            return {'historyId': str(self._service.history_id),
+                    'expiration': str(int((time.time() + 7 * 24 * 3600) * 1000))}
+        return _FakeRequest(self._service, fn)
+
+    def stop(self, userId='me'):
+        def fn():
+            self._service.watch_topic = None
+            return ''
+        return _FakeRequest(self._service, fn)
+
+
+class FakeGmailService:
+    """
+    In-memory Gmail service exposing the subset of the discovery API the handlers use.
+
+    Args:
+        num_messages: number of unread synthetic messages to seed
+        latency: seconds slept per HTTP round-trip
+        error_rate: probability that an individual call fails with a 429
+        html: whether the synthetic messages carry an HTML alternative part
+        body_size: characters in each synthetic body
+        bulk_rate: share of seeded messages that are newsletters (see make_message)
+    """
+
+    def __init__(self, num_messages=15, latency=0.05, error_rate=0.0, html=False, body_size=800, seed=0,
+                 bulk_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.messages = {}
+        self.history_id = 1000
+        self.oldest_history_id = 1000
+        self.history_records = []
+        self.round_trips = 0
+        self.calls = 0
+        self.watch_topic = None
+        self.watch_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        for i in range(num_messages):
+            message = make_message(i, html=html, body_size=body_size, bulk=bulk_rate > 0 and self._random.random() < bulk_rate)
+            self.messages[message['id']] = message
+
+    def users(self):
+        return _FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    def add_message(self, html=False, body_size=800, thread_id=None, bulk=False):
+        """Delivers a new unread message and records it in the mailbox history"""
+        with self._lock:
+            message = make_message(len(self.messages), html=html, body_size=body_size, thread_id=thread_id, bulk=bulk)
+            self.messages[message['id']] = message
+            self.history_id += 1
+            self.history_records.append({
+                'id': self.history_id,
+                'messagesAdded': [{'message': {'id': message['id'], 'threadId': message['threadId'],
+                                               'labelIds': list(message['labelIds'])}}],
+            })
+        return message
+
+    def expire_history(self):
+        """Drops every stored history record, as Gmail does after roughly a week"""
+        with self._lock:
+            self.history_records = []
+            self.oldest_history_id = self.history_id + 1
+
+    def unread_count(self):
+        return sum(1 for m in self.messages.values() if 'UNREAD' in m['labelIds'])
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _call(self, fn):
+        with self._lock:
+            self.calls += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if failed:
+            raise FakeHttpError(429, 'Too Many Requests')
+        return fn()
+
+    def _remove_labels(self, ids, labels):
+        with self._lock:
+            for msg_id in ids:
+                message = self.messages[msg_id]
+                message['labelIds'] = [l for l in message['labelIds'] if l not in labels]
+
+
+class FakePublisher:
+    """
+    Stands in for the Pub/Sub push subscription: delivers new messages to a FakeGmailService and
+    POSTs the matching Gmail notification to the local push endpoint in Pub/Sub's push format.
+    """
+
+    def __init__(self, service, endpoint_url, email_address='me@example.com'):
+        self.service = service
+        self.endpoint_url = endpoint_url
+        self.email_address = email_address
+        self.published = 0
+
+    def publish(self, history_id=None):
+        """Sends one notification and returns the HTTP status of the push endpoint"""
+        data = json.dumps({'emailAddress': self.email_address,
+                           'historyId': history_id or self.service.history_id}).encode()
+        envelope = {
+            'message': {'data': base64.b64encode(data).decode(), 'messageId': str(self.published),
+                        'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+            'subscription': 'projects/fake/subscriptions/gmail-push',
+        }
+        request = urllib.request.Request(self.endpoint_url, data=json.dumps(envelope).encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request) as response:
+            self.published += 1
+            return response.status
+
+    def deliver(self, count=1, **kwargs):
+        """Adds count new messages to the mailbox, notifying after each like Gmail does"""
+        for _ in range(count):
+            self.service.add_message(**kwargs)
+            self.publish()
+
+
+class FakeAPIStatusError(Exception):
+    """Mimics groq.APIStatusError: carries status_code and a response with headers"""
+
+    def __init__(self, status_code, headers=None, message=''):
+        super().__init__(message or f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = type('FakeHttpxResponse', (), {'headers': headers or {}, 'status_code': status_code})()
+
+
+class _FakeObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _FakeRawResponse:
+    def __init__(self, headers, completion):
+        self.headers = headers
+        self._completion = completion
+
+    def parse(self):
+        return self._completion
+
+
+class _FakeRawCompletions:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, **kwargs):
+        return self._client._complete(kwargs)
+
+
+class _FakeCompletions:
+    def __init__(self, client):
+        self._client = client
+        self.with_raw_response = _FakeRawCompletions(client)
+
+    def create(self, **kwargs):
+        return self._client._complete(kwargs).parse()
+
+
+class FakeGroqClient:
+    """
+    Stand-in for groq.Groq that answers summarization prompts with deterministic JSON and
+    enforces server-side requests/tokens per window, answering 429 with retry-after once exhausted.
+
+    Args:
+        latency: seconds slept per completion
+        requests_per_minute / tokens_per_minute: server-side limits per window
+        window_seconds: length of the rate-limit window (shorten it to compress time in benchmarks)
+        error_rate: probability of a transient 503
+        model_latency: per-model latency overrides, e.g. a faster small model for cascade tests
+        noisy_models: models whose scores are shifted by up to 1 from the reference score, so
+                      cascade agreement can be measured
+        malformed_rate: probability that a single-email answer comes back malformed (see malform)
+    """
+
+    def __init__(self, latency=0.2, requests_per_minute=30, tokens_per_minute=6000, window_seconds=60.0,
+                 error_rate=0.0, seed=0, model_latency=None, noisy_models=(), malformed_rate=0.0):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.noisy_models = tuple(noisy_models)
+        self.requests_by_model = collections.Counter()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window_seconds = window_seconds
+        self.error_rate = error_rate
+        self.chat = _FakeObject(completions=_FakeCompletions(self))
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.malformed_rate = malformed_rate
+        self.malformed = 0
+        self.max_tokens_requested = 0
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._window_tokens = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def count_tokens(text):
+        return max(1, len(text) // 4)
+
+    def _complete(self, kwargs):
+        prompt = ''.join(m['content'] for m in kwargs['messages'])
+        prompt_tokens = self.count_tokens(prompt)
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window_seconds:
+                self._window_start = now
+                self._window_requests = 0
+                self._window_tokens = 0
+            reset = self.window_seconds - (now - self._window_start)
+
+            if (self._window_requests + 1 > self.requests_per_minute
+                    or self._window_tokens + prompt_tokens > self.tokens_per_minute):
+                self.throttled += 1
+                raise FakeAPIStatusError(429, {'retry-after': f"{reset:.3f}"}, 'Rate limit reached')
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                raise FakeAPIStatusError(503, message='Service Unavailable')
+
+            self._window_requests += 1
+            self._window_tokens += prompt_tokens
+            # Limits are reported per minute, as the real API does, whatever window the fake runs on
+            per_minute = 60 / self.window_seconds
+            headers = {
+                'x-ratelimit-limit-requests': str(self.requests_per_minute * per_minute),
+                'x-ratelimit-limit-tokens': str(self.tokens_per_minute * per_minute),
+                'x-ratelimit-remaining-requests': str(self.requests_per_minute - self._window_requests),
+                'x-ratelimit-reset-requests': f"{reset:.3f}s",
+                'x-ratelimit-remaining-tokens': str(self.tokens_per_minute - self._window_tokens),
+                'x-ratelimit-reset-tokens': f"{reset:.3f}s",
+            }
+
+        model = kwargs.get('model')
+        latency = self.model_latency.get(model, self.latency)
+        if latency:
+            time.sleep(latency)
+
+        content = self.respond(prompt, model)
+        json_mode = (kwargs.get('response_format') or {}).get('type') == 'json_object'
+        with self._lock:
+            malformed = self.malformed_rate and self._random.random() < self.malformed_rate
+            kind = self._random.randrange(5)
+        if malformed:
+            content = self.malform(content, kind, json_mode)
+
+        # Answers longer than max_tokens are cut off, as the real API does
+        finish_reason = 'stop'
+        completion_tokens = self.count_tokens(content)
+        max_tokens = kwargs.get('max_tokens')
+        if max_tokens and completion_tokens > max_tokens:
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = 'length'
+        with self._lock:
+            self.malformed += bool(malformed)
+            self.max_tokens_requested += max_tokens or 0
+            self.requests += 1
+            self.requests_by_model[model] += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+        completion = _FakeObject(
+            choices=[_FakeObject(message=_FakeObject(content=content), finish_reason=finish_reason)],
+            usage=_FakeObject(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                              total_tokens=prompt_tokens + completion_tokens),
+            model=kwargs.get('model'),
+        )
+        return _FakeRawResponse(headers, completion)
+
+    @staticmethod
+    def malform(content, kind, json_mode=False):
+        """
+        One of the ways real answers go wrong: a score written as '8/10' or '80%', a bare score on a
+        0-100 scale (which can't be told apart from a 1-10 one and needs a repair request), a missing
+        summary, or (outside JSON mode, which guarantees syntax) JSON wrapped in prose
+        """
+        answer = json.loads(content)
+        if not isinstance(answer, dict):
+            return content
+        if kind == 0:
+            answer['importance_score'] = f"{answer['importance_score']}/10"
+        elif kind == 1:
+            answer['importance_score'] = f"{answer['importance_score'] * 10}%"
+        elif kind == 2:
+            answer['importance_score'] = answer['importance_score'] * 10 + 5
+        elif kind == 3 or json_mode:
+            del answer['summary']
+        else:
+            return f"Here is my analysis of the email:\n```json\n{json.dumps(answer, indent=2)}\n```\nLet me know if you need more."
+        return json.dumps(answer)
+
+    @staticmethod
+    def score_for(subject):
+        """Deterministic importance score derived from the subject line (newsletters always score low)"""
+        digest = int(hashlib.md5(subject.encode('utf-8')).hexdigest(), 16)
+        if 'newsletter' in subject.lower():
+            return digest % 3 + 1
+        if subject.lower().startswith('urgent'):
+            return digest % 3 + 8
+        return digest % 10 + 1
+
+    def _answer(self, subject, model=None, confidence=False):
+        score = self.score_for(subject)
+        digest = int(hashlib.md5(f"{model}:{subject}".encode('utf-8')).hexdigest(), 16)
+        if model in self.noisy_models:
+            score = min(10, max(1, score + digest % 3 - 1))
+        level = 'high' if score >= 8 else 'medium' if score >= 5 else 'low'
+        answer = {
+            'summary': f"Summary of {subject}",
+            'importance_score': score,
+            'importance_level': level,
+            'reason': 'Synthetic score',
+        }
+        if confidence:
+            answer['confidence'] = round(0.5 + digest % 50 / 100, 2)
+        return answer
+
+    def respond(self, prompt, model=None):
+        """Answers a single-email prompt with an object, or a '### Email N' batch prompt with an array"""
+        blocks = re.split(r'^### Email (\d+)\n', prompt, flags=re.MULTILINE)
+        if len(blocks) > 1:
+            answers = []
+            for number, block in zip(blocks[1::2], blocks[2::2]):
+                subject = re.search(r'Subject: (.*)', block)
+                answers.append({'email': int(number), **self._answer(subject.group(1).strip() if subject else '', model)})
+            return json.dumps(answers)
+
+        # Repair requests name the email as: the email "<subject>"
+        subject = re.search(r'Subject: (.*)', prompt) or re.search(r'the email "(.*)"', prompt)
+        return json.dumps(self._answer(subject.group(1).strip() if subject else '', model, '"confidence"' in prompt))
@@ -3,15 +3,20 @@
 
 
 import os.path
-import base64
-from bs4 import BeautifulSoup
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from Config import Config 
+from Mime_Extractor import extract_body
+from Email_Record import EmailRecord
+from Metrics import metrics
+from Parse_Pool import shared_parse_pool
+from Rate_Limiter import RETRYABLE_STATUS_CODES, backoff_delay
 import logging
 
+# Headers kept on each EmailRecord for local triage and prioritisation
+KEPT_HEADERS = ('list-unsubscribe', 'list-id', 'precedence', 'auto-submitted', 'return-path', 'to', 'cc', 'reply-to')
+
 class GmailHandler:
     
     logging.basicConfig(
@@ -24,37 +29,64 @@ class GmailHandler:
     Class to handle Gmail API authentication, fetching emails,
     and extracting readable email bodies.
     """
-    def __init__(self):
+    def __init__(self, token_file=Config.TOKEN_FILE, credentials_file=Config.CREDENTIALS_FILE):
         self.SCOPES = Config.GMAIL_SCOPES
         self.creds = None
+        self.token_file = token_file
+        self.credentials_file = credentials_file
+        self.service = None
+        self._service_creds = None
+        self._lock = threading.Lock()
+        self.parse_pool = shared_parse_pool() if Config.PARSE_WORKERS > 1 else None
 
 
     def authenticate_gmail(self):
         """
         Handles logging into Gmail and obtains permission for the rest of the program; returns error if authentication fails
         """
+        # Credentials stay in memory between runs; Token.json is only read once and only rewritten after a refresh
+        if self.creds and self.creds.valid and not self.expires_soon():
+            return self.creds
+        
         logging.info("Starting Gmail authentication process...")
+        with metrics.span('gmail_auth'):
+            return self._authenticate()
+
+    def expires_soon(self):
+        """True when the access token expires within Config.GMAIL_TOKEN_REFRESH_MARGIN_SECONDS"""
+        expiry = self.creds.expiry  # naive UTC, as google-auth stores it
+        if expiry is None:
+            return False
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return expiry - now < timedelta(seconds=Config.GMAIL_TOKEN_REFRESH_MARGIN_SECONDS)
+
+    def _authenticate(self):
+        # Imported on first use so commands that never touch Gmail (stats, top, export) start faster
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        
         try:
             # If login credentials exist, use them
-            if os.path.exists(Config.TOKEN_FILE):
-                self.creds = Credentials.from_authorized_user_file(Config.TOKEN_FILE, self.SCOPES)
+            if self.creds is None and os.path.exists(self.token_file):
+                self.creds = Credentials.from_authorized_user_file(self.token_file, self.SCOPES)
     
-            # If no valid credentials, sign in or refresh token
-            if not self.creds or not self.creds.valid:
+            # If no valid credentials (or they are about to expire), sign in or refresh token
+            if not self.creds or not self.creds.valid or self.expires_soon():
                 
-                # If the credentials exist but expired and have refresh token, refresh to avoid new auth
-                if self.creds and self.creds.expired and self.creds.refresh_token:
+                # If the credentials exist and have refresh token, refresh to avoid new auth
+                if self.creds and self.creds.refresh_token:
                     logging.debug("Refreshing expired Gmail credentials.")
                     self.creds.refresh(Request())
                     
                 else:
                     # Sign in with OAuth flow
                     logging.info("No valid credentials found. Running OAuth flow.")
-                    flow = InstalledAppFlow.from_client_secrets_file(Config.CREDENTIALS_FILE, self.SCOPES)
+                    flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, self.SCOPES)
                     self.creds = flow.run_local_server(port=0)
     
                 # Save the credentials for next run
-                with open(Config.TOKEN_FILE, 'w') as token_file:
+                with open(self.token_file, 'w') as token_file:
                     logging.debug("Saved new credentials to token.json.")
                     token_file.write(self.creds.to_json())
                     
@@ -63,71 +95,109 @@ class GmailHandler:
     
         except Exception as e:
             
-            logger.info(f"Fatal error in email processing") 
-            logger.exception("Full traceback in email processing error") 
+            logging.info(f"Fatal error in email processing") 
+            logging.exception("Full traceback in email processing error") 
             return None
 
 
 
-    def get_email_body(self, payload, index):
-        all_parts_text = []
-        decode_failures = 0
-        total_parts = len(payload.get('parts', [])) if 'parts' in payload else 1
+    def get_service(self):
+        """
+        Returns the long-lived Gmail service, authenticating first. The service (and its HTTP
+        connection) is built once and reused by every run; refreshed credentials are picked up in place.
+        Returns None when authentication fails.
+        """
+        creds = self.authenticate_gmail()
+        if not creds:
+            return None
+        with self._lock:
+            if self.service is None or self._service_creds is not creds:
+                self.service = self.build_service(creds)
+                self._service_creds = creds
+            return self.service
+
+    def build_service(self, creds):
+        """A new Gmail service from the discovery document bundled with google-api-python-client"""
+        from googleapiclient.discovery import build
         
+        with metrics.span('gmail_build'):
+            return build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
+
+    def get_email_body(self, payload, index):
+        """
+        Extracts readable text from a message payload, walking nested multipart bodies.
+        Decoding stops once Config.EMAIL_BODY_CHAR_LIMIT characters have been collected,
+        since anything past that is truncated before prompting anyway.
+        """
         logging.debug(f"Getting body for email {index}")
+        with metrics.span('mime_parse'):
+            return extract_body(payload, index, Config.EMAIL_BODY_CHAR_LIMIT)
+
+    def parse_message(self, msg_data, index, body=None):
+        """
+        Turns a Gmail message resource (format='full') into the EmailRecord used downstream.
+        body is the already extracted text when the parse pool has done it.
+        """
+        headers = msg_data.get('payload', {}).get('headers', [])
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')  # Extracting subject
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), '(Unknown Sender)')  # Extracting sender
+        if body is None:
+            body = self.get_email_body(msg_data.get('payload', {}), index)
+        email_link = f"https://mail.google.com/mail/u/0/#inbox/{msg_data['id']}"
+        kept_headers = {h['name'].lower(): h['value'] for h in headers if h['name'].lower() in KEPT_HEADERS}
+
+        return EmailRecord(msg_data['id'], msg_data.get('threadId'), subject, sender, body, email_link,
+                           kept_headers, msg_data.get('labelIds', []))
+
+    def parse_messages(self, messages, first_index=1):
+        """
+        parse_message for a list of message resources, numbered from first_index. With
+        Config.PARSE_WORKERS of 2 or more, bodies are extracted in the parse pool's worker processes.
+        """
+        if self.parse_pool:
+            bodies = self.parse_pool.extract_bodies([msg_data.get('payload', {}) for msg_data in messages])
+        else:
+            bodies = [None] * len(messages)
+        return [self.parse_message(msg_data, index, body)
+                for index, (msg_data, body) in enumerate(zip(messages, bodies), first_index)]
+
+    def list_unread_ids(self, service, max_results=Config.MAX_EMAILS_PER_RUN):
+        """
+        Returns the IDs of the latest unread messages
+        """
+        logging.info(f"Fetching up to {max_results} latest emails")
         
-        if 'parts' in payload:  # If the email has multiple parts
-            for idx, part in enumerate(payload['parts']):
-                mime_type = part.get('mimeType')
-                data = part['body'].get('data')
-                
-                if data:
-                    try:
-                        decoded_bytes = base64.urlsafe_b64decode(data)
-                        decoded_str = decoded_bytes.decode('utf-8')
-                        
-                    except (binascii.Error, UnicodeDecodeError) as e:
-                        decode_failures += 1
-                        logging.debug(f"Decoding failed for part {idx+1}/{total_parts}: {e}")
-                        continue
-    
-                    if mime_type == 'text/plain':
-                        all_parts_text.append(decoded_str)
-                        
-                    elif mime_type == 'text/html':
-                        soup = BeautifulSoup(decoded_str, 'html.parser')
-                        all_parts_text.append(soup.get_text(separator='\n'))
-                else:
-                    decode_failures += 1
-    
-            if decode_failures == total_parts:
-                logging.info(f"All parts  of email {index} failed to decode or had no data.")
-        
-        else:  # Single part email
-            mime_type = payload.get('mimeType')
-            data = payload['body'].get('data')
-            
-            if data:
-                
-                try:
-                    decoded_bytes = base64.urlsafe_b64decode(data)
-                    decoded_str = decoded_bytes.decode('utf-8')
-                    
-                    if mime_type == 'text/plain':
-                        all_parts_text.append(decoded_str)
-                        
-                    elif mime_type == 'text/html':
-                        soup = BeautifulSoup(decoded_str, 'html.parser')
-                        all_parts_text.append(soup.get_text(separator='\n'))
-                        
-                except (binascii.Error, UnicodeDecodeError) as e:
-                    logging.info(f"Failed to decode single-part email {index}: {e}")
-            else:
-                logging.info(f"No data found in single-part email {index}.")
-    
-        return "\n\n".join(all_parts_text)
+        with metrics.span('gmail_list'):
+            results = service.users().messages().list(
+                userId='me',
+                maxResults=max_results,
+                q='is:unread'
+            ).execute()  # retrieving unread emails
+
+        return [msg['id'] for msg in results.get('messages', [])]
 
-    def fetch_emails_full_body(self, service, max_results=Config.MAX_EMAILS_PER_RUN):
+    def iter_message_id_pages(self, service, query='is:unread', page_size=Config.BACKLOG_PAGE_SIZE, page_token=None):
+        """
+        Walks messages().list page by page, yielding (page_token, message_ids, next_page_token).
+        page_token is the token that produced the page (None for the first), so a caller can resume there.
+        """
+        while True:
+            with metrics.span('gmail_list'):
+                response = service.users().messages().list(
+                    userId='me',
+                    maxResults=page_size,
+                    q=query,
+                    pageToken=page_token
+                ).execute()
+
+            next_page_token = response.get('nextPageToken')
+            yield page_token, [msg['id'] for msg in response.get('messages', [])], next_page_token
+
+            if not next_page_token:
+                break
+            page_token = next_page_token
+
+    def fetch_emails_full_body(self, service, max_results=Config.MAX_EMAILS_PER_RUN, batch_size=Config.GMAIL_BATCH_SIZE):
         """
         Extracts full emails (subject, sender, body, and link) from unread messages,
         then marks them as read.
@@ -135,46 +205,141 @@ class GmailHandler:
         Args:
             service: Gmail API service instance
             max_results: number of unread emails to fetch
+            batch_size: number of messages().get calls grouped into one HTTP batch request;
+                        1 or less falls back to one request per message
 
         Returns:
-            List of dictionaries each containing subject, sender, body, and link of an email.
+            List of EmailRecords (message_id, thread_id, subject, sender, body, and link).
         """
-        logging.info(f"Fetching up to {max_results} latest emails")
-        
-        results = service.users().messages().list(
-            userId='me',
-            maxResults=max_results,
-            q='is:unread'
-        ).execute()  # retrieving unread emails
+        message_ids = self.list_unread_ids(service, max_results)
+
+        if batch_size and batch_size > 1:
+            return self.fetch_messages_batched(service, message_ids, batch_size)
 
-        messages = results.get('messages', [])
         emails = []
 
-        for i, msg in enumerate(messages, 1):
-            msg_data = service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
+        for i, msg_id in enumerate(message_ids, 1):
+            with metrics.span('gmail_get'):
+                msg_data = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
 
             # Mark the message as read to avoid duplication on next run
             service.users().messages().modify(
                 userId='me',
-                id=msg['id'],
+                id=msg_id,
                 body={'removeLabelIds': ['UNREAD']}
             ).execute()
 
-            headers = msg_data.get('payload', {}).get('headers', [])
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')  # Extracting subject
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), '(Unknown Sender)')  # Extracting sender
-            body = self.get_email_body(msg_data.get('payload', {}), i)
-            email_link = f"https://mail.google.com/mail/u/0/#inbox/{msg['id']}"
+            emails.append(self.parse_message(msg_data, i))
+
+        return emails
+
+    def iter_messages_batched(self, service, message_ids, batch_size=Config.GMAIL_BATCH_SIZE, failed_ids=None,
+                              skipped_ids=None):
+        """
+        Yields raw Gmail message resources as each HTTP batch request completes.
+
+        Messages throttled or hit by a server error inside a batch are retried up to
+        Config.GMAIL_BATCH_RETRIES times, after a jittered exponential wait so the same rate limit
+        isn't hit again at once; IDs that still fail are appended to failed_ids when a list is given.
+        Other errors (404 for a deleted message) aren't retried and go to skipped_ids.
+        """
+        pending = list(message_ids)
+        failed = []
+
+        for attempt in range(Config.GMAIL_BATCH_RETRIES + 1):
+            failed = []
+            if attempt:
+                time.sleep(backoff_delay(attempt, Config.GMAIL_BATCH_BACKOFF_SECONDS))
+
+            for start in range(0, len(pending), batch_size):
+                fetched = []
+
+                def on_response(request_id, response, exception):
+                    if exception is None:
+                        fetched.append(response)
+                        return
+                    logging.debug(f"Batch get failed for message {request_id}: {exception}")
+                    metrics.inc('gmail_get_failures')
+                    if getattr(getattr(exception, 'resp', None), 'status', None) in RETRYABLE_STATUS_CODES:
+                        failed.append(request_id)
+                    elif skipped_ids is not None:
+                        skipped_ids.append(request_id)
+
+                batch = service.new_batch_http_request(callback=on_response)
+                for msg_id in pending[start:start + batch_size]:
+                    batch.add(
+                        service.users().messages().get(userId='me', id=msg_id, format='full'),
+                        request_id=msg_id
+                    )
+                with metrics.span('gmail_batch_get'):
+                    batch.execute()
+                metrics.inc('gmail_messages_fetched', len(fetched))
 
-            emails.append({'subject': subject, 'body': body, 'link': email_link, 'sender': sender})
+                yield from fetched
 
+            if not failed:
+                break
+
+            logging.info(f"{len(failed)} messages failed in batch fetch (attempt {attempt + 1})")
+            pending = failed
+
+        if failed:
+            logging.info(f"Skipping {len(failed)} messages that could not be fetched")
+            if failed_ids is not None:
+                failed_ids.extend(failed)
+
+    def fetch_messages_batched(self, service, message_ids, batch_size=Config.GMAIL_BATCH_SIZE, mark_read=True,
+                               skipped_ids=None):
+        """
+        Fetches full messages through Gmail HTTP batch requests, then removes the UNREAD label
+        from every successfully fetched message with a single batchModify call.
+        Messages that cannot be fetched are skipped and left unread so the next run picks them up;
+        those that failed for good (see iter_messages_batched) are appended to skipped_ids.
+
+        Returns:
+            List of EmailRecords in the same order as message_ids.
+        """
+        fetched = {msg['id']: msg for msg in self.iter_messages_batched(service, message_ids, batch_size,
+                                                                        skipped_ids=skipped_ids)}
+
+        emails = self.parse_messages([fetched[msg_id] for msg_id in message_ids if msg_id in fetched])
+
+        if mark_read and emails:
+            self.mark_as_read(service, [email.message_id for email in emails])
+
+        logging.info(f"Fetched {len(emails)}/{len(message_ids)} messages via batch requests")
         return emails
 
+    def mark_as_read(self, service, message_ids):
+        """
+        Removes the UNREAD label from the given messages (batchModify accepts up to 1000 ids per call)
+        """
+        for start in range(0, len(message_ids), 1000):
+            with metrics.span('gmail_modify'):
+                service.users().messages().batchModify(
+                    userId='me',
+                    body={'ids': message_ids[start:start + 1000], 'removeLabelIds': ['UNREAD']}
+                ).execute()
+
+    def watch(self, service, topic_name=Config.GMAIL_PUSH_TOPIC, label_ids=('INBOX',)):
+        """
+        Registers (or renews) push notifications for new inbox mail on the given Pub/Sub topic.
+        Returns the watch response with the current historyId and the expiration in epoch milliseconds.
+        """
+        response = service.users().watch(
+            userId='me',
+            body={'topicName': topic_name, 'labelIds': list(label_ids), 'labelFilterBehavior': 'include'}
+        ).execute()
+        logging.info(f"Gmail watch registered on {topic_name}, expires at {response.get('expiration')}")
+        return response
+
+    def stop_watch(self, service):
+        service.users().stop(userId='me').execute()
+
 
 def main():
     gmail_handler = GmailHandler()
-    creds = gmail_handler.authenticate_gmail()
-    service = build('gmail', 'v1', credentials=creds)
+    service = gmail_handler.get_service()
     emails = gmail_handler.fetch_emails_full_body(service)
 
 
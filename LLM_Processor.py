@@ -4,24 +4,96 @@
 # In[1]:
 
 
-from Gmail_Handler import GmailHandler
-import os.path
-import base64
-from bs4 import BeautifulSoup
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 import os
-from groq import Groq
+import re
 import json
-import pandas as pd
 import concurrent.futures
+import threading
 import logging
+from Config import Config
+from Summary_Cache import SummaryCache
+from Text_Condenser import condense_body, count_tokens, token_budget_for
+from Email_Record import SummaryResult
+from Triage import Triage, in_sample
+from Deduplicator import Deduplicator
+from Priority import UrgencyPrior
+from Metrics import metrics, record_usage, metric_name
+from Structured_Output import SUMMARY_VALIDATOR, SchemaError, OutputTokenBudget, parse_json
+from Rate_Limiter import RateLimiter, AdaptiveConcurrency, is_retryable, is_throttled, retry_after_seconds, backoff_delay
+import time
 
 # In[7]:
 
 
+PROMPT_TEMPLATE = """Rate email NECESSITY and URGENCY 1-10 and summarize. Return JSON only:
+
+{{"summary": "brief summary", "importance_score": 1-10, "importance_level": "low/medium/high", "reason": "why this score"}}
+
+From: {sender}
+Subject: {subject}
+Body: {body}
+
+Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent"""
+
+# Used for every cascade tier except the last, which answers with PROMPT_TEMPLATE
+CASCADE_PROMPT_TEMPLATE = """Rate email NECESSITY and URGENCY 1-10 and summarize. Return JSON only:
+
+{{"summary": "brief summary", "importance_score": 1-10, "importance_level": "low/medium/high", "reason": "why this score", "confidence": 0.0-1.0}}
+
+From: {sender}
+Subject: {subject}
+Body: {body}
+
+Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent
+confidence: how sure you are of the score"""
+
+# Sent when a response can't be used; carries the bad reply and what is wrong with it, not the email body
+REPAIR_PROMPT_TEMPLATE = """Your reply about the email "{subject}" could not be used: {problems}
+
+Your reply:
+{response}
+
+Return only the corrected JSON object, in this format:
+{response_format}"""
+
+BATCH_PROMPT_TEMPLATE = """Rate each email's NECESSITY and URGENCY 1-10 and summarize it. Return a JSON array only, one object per email:
+
+[{{"email": 1, "summary": "brief summary", "importance_score": 1-10, "importance_level": "low/medium/high", "reason": "why this score"}}]
+
+Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent
+
+{emails}"""
+
+EMAIL_BLOCK_TEMPLATE = """### Email {number}
+From: {sender}
+Subject: {subject}
+Body: {body}
+"""
+
+
+def prepare_body(body, index=None, model=None):
+    """
+    Condense the body (quoted history, signatures, boilerplate, URLs) and cut it to the token
+    budget of model (Config.GROQ_MODEL unless given). Returns (body, tokens_saved).
+    """
+    with metrics.span('condense'):
+        body, original_tokens, condensed_tokens = condense_body(body, model or Config.GROQ_MODEL)
+    tokens_saved = max(0, original_tokens - condensed_tokens)
+    logging.debug(f"Email {index}: condensing saved {tokens_saved} of {original_tokens} body tokens")
+    return body, tokens_saved
+
+def response_format_line(prompt):
+    """The JSON format line of a summarization prompt, repeated in repair requests"""
+    match = re.search(r'^\{"summary".*$', prompt, re.MULTILINE)
+    return match.group(0) if match else ''
+
+def response_score(response, default=5):
+    """The integer importance score of a parsed response, or default when it is missing or malformed"""
+    try:
+        return int(float(response.get('importance_score', default)))
+    except (TypeError, ValueError):
+        return default
+
 # Initialize Groq client
 
 class LLM_Processor:
@@ -30,79 +102,230 @@ class LLM_Processor:
     level=logging.INFO,                
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
-    def __init__(self):
-        self.client = Groq(
-            api_key=os.environ.get("GROQ_API_KEY"),  
-        )
+    def __init__(self, client=None):
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.cache = SummaryCache() if Config.CACHE_ENABLED else None
+        self.triage = Triage() if Config.TRIAGE_ENABLED else None
+        self.deduplicator = Deduplicator() if Config.DEDUP_ENABLED else None
+        self.prioritizer = UrgencyPrior() if Config.PRIORITY_ORDER else None
+        
+        # Shared across every worker thread so the whole process respects the provider limits
+        self.rate_limiter = RateLimiter(Config.GROQ_REQUESTS_PER_MINUTE, Config.GROQ_TOKENS_PER_MINUTE)
+        self.concurrency = AdaptiveConcurrency(Config.LLM_INITIAL_CONCURRENCY, Config.LLM_MAX_CONCURRENCY)
+        self.retry_count = 0
+        self.throttle_count = 0
+        self.output_budgets = {}  # Prompt template -> OutputTokenBudget
+        self.json_mode_unsupported = set()  # Models that rejected response_format
     
-    def summarize_and_score_email(self, email_subject, email_body, sender, index):
-        logging.debug(f"Summarizing email {index}")
+    @property
+    def client(self):
         """
-        Summarize an email and score its importance using Groq
+        Groq client, created on first use: runs where triage or the cache answer everything,
+        and commands that never call the LLM, skip importing and constructing it.
         """
-        prompt = f"""Rate email NECESSITY and URGENCY 1-10 and summarize. Return JSON only:
-
-{{"summary": "brief summary", "importance_score": 1-10, "importance_level": "low/medium/high", "reason": "why this score"}}
-
-From: {sender}
-Subject: {email_subject}
-Body: {email_body}
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from groq import Groq
+                    self._client = Groq(
+                        api_key=os.environ.get("GROQ_API_KEY"),  
+                    )
+        return self._client
+    
+    def create_completion(self, **kwargs):
+        """
+        Calls the chat completions API through the rate limiter, retrying throttled and
+        transient failures with jittered exponential backoff. Raises once retries run out.
+        """
+        prompt_chars = sum(len(m['content']) for m in kwargs['messages'])
+        estimated_tokens = prompt_chars // 4 + kwargs.get('max_tokens', 0)
+        
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            # Time spent waiting for the client-side limits, separate from the request itself
+            with metrics.span('llm_queue_wait'):
+                self.rate_limiter.acquire(estimated_tokens)
+                self.concurrency.acquire()
+            request_start = time.perf_counter()
+            try:
+                raw_response = self.client.chat.completions.with_raw_response.create(**kwargs)
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.concurrency.release(throttled=throttled)
+                if not is_retryable(e) or attempt == Config.LLM_MAX_RETRIES:
+                    raise
+                
+                delay = max(retry_after_seconds(e) or 0, backoff_delay(attempt, Config.LLM_BACKOFF_BASE_SECONDS))
+                if throttled:
+                    self.throttle_count += 1
+                    metrics.inc('llm_throttled')
+                    self.rate_limiter.pause(delay)
+                self.retry_count += 1
+                metrics.inc('llm_retries')
+                logging.info(f"Groq call failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            
+            request_seconds = time.perf_counter() - request_start
+            metrics.observe('llm_request_seconds', request_seconds)
+            self.concurrency.release()
+            self.rate_limiter.observe_headers(raw_response.headers)
+            completion = raw_response.parse()
+            record_usage(completion)
+            
+            # Per-model latency and tokens, to compare cascade tiers with the single-model baseline
+            model_prefix = f"model_{metric_name(kwargs.get('model', ''))}"
+            metrics.observe(f"{model_prefix}_request_seconds", request_seconds)
+            record_usage(completion, model_prefix)
+            return completion
+    
+    def summarize_and_score_email(self, email_subject, email_body, sender, index, message_id=None,
+                                  model=None, prompt_template=PROMPT_TEMPLATE):
+        """
+        Summarize an email and score its importance using Groq (Config.GROQ_MODEL unless model is given).
+        The response is validated against the summary schema; one that can't be used gets a short
+        repair request, and if that fails too the email is reported as failed (None) rather than
+        given a made-up score.
+        """
+        logging.debug(f"Summarizing email {index}")
+        model = model or Config.GROQ_MODEL
+        prompt = prompt_template.format(sender=sender, subject=email_subject, body=email_body)
 
-Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent"""
+        # Serve repeated emails from the on-disk cache instead of paying for the completion again
+        cache_key = self.cache_key(message_id, sender, email_subject, email_body, prompt_template, model)
+        if cache_key:
+            cached = self.cached_response(message_id, cache_key, index)
+            if cached:
+                return cached
     
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model="llama3-70b-8192",  # Fast and capable model
-                temperature=0.1,  # Lower temperature for more consistent scoring
-                max_tokens=300,   # Sufficient for summary + scoring
-            )
+            budget = self.output_budget(prompt_template)
+            response_text = self.complete_json(prompt, model, budget)
+            result, problems = self.parse_structured(response_text)
+            if result is None:
+                result, problems = self.repair_response(response_text, problems, email_subject, prompt, model, index)
             
-            response_text = chat_completion.choices[0].message.content
+            if result is None:
+                metrics.inc('llm_json_failures')
+                logging.info(f"Failed to get a usable response for email {index}: {'; '.join(problems)}")
+                return None
             
-            # Parse the JSON response - extract JSON from mixed content
-            try:
-                # Try direct JSON parsing first
-                result = json.loads(response_text)
-                logging.debug(f"Summarizing email {index} successful!")
-                
-                return result
-            except json.JSONDecodeError:
-                # If that fails, try to extract JSON from mixed content
-                try:
-                    # Look for JSON block in the response
-                    start_idx = response_text.find('{')
-                    end_idx = response_text.rfind('}') + 1
-                    
-                    if start_idx != -1 and end_idx != 0:
-                        json_str = response_text[start_idx:end_idx]
-                        result = json.loads(json_str)
-                        
-                        logging.debug(f"JSON code found in response to email {index}")
-                        
-                        return result
-                except json.JSONDecodeError:
-                    logging.info(f"Fatal error in summarizing")
-                    logging.exception("Full traceback from summarizing error:")                    
-                    pass
-                
-                # Final fallback if JSON parsing completely fails
-                return {
-                    "summary": response_text[:200] + "..." if len(response_text) > 200 else response_text,
-                    "importance_score": 5,
-                    "importance_level": "medium",
-                    "reason": "Unable to parse structured response"
-                }
+            result['model'] = model
+            logging.debug(f"Summarizing email {index} successful!")
+            if cache_key:
+                self.cache.put(message_id, cache_key, result)
+            return result
                 
         except Exception as e:
             logging.info(f"Fatal error with Grok AI")
             logging.exception("Full traceback with Grok AI error")               
             return None
+    
+    def output_budget(self, prompt_template):
+        """The OutputTokenBudget for a prompt template, created on first use"""
+        budget = self.output_budgets.get(prompt_template)
+        if budget is None:
+            budget = self.output_budgets.setdefault(prompt_template, OutputTokenBudget())
+        return budget
+    
+    def complete_json(self, prompt, model, budget, max_tokens=None):
+        """
+        One completion in JSON mode (when Config.LLM_JSON_MODE is on and the model hasn't rejected it),
+        with max_tokens from budget. Returns the response text; a generation the API refused as invalid
+        JSON is returned as-is so it goes through the same repair path.
+        """
+        kwargs = dict(
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+            temperature=0.1,  # Lower temperature for more consistent scoring
+            max_tokens=max_tokens or budget.max_tokens(),
+        )
+        if Config.LLM_JSON_MODE and model not in self.json_mode_unsupported:
+            kwargs['response_format'] = {"type": "json_object"}
+        
+        try:
+            chat_completion = self.create_completion(**kwargs)
+        except Exception as e:
+            if getattr(e, 'status_code', None) != 400 or 'response_format' not in kwargs:
+                raise
+            message = str(e)
+            if 'json_validate_failed' in message:
+                metrics.inc('llm_json_mode_rejected')
+                error = (getattr(e, 'body', None) or {}).get('error', {})
+                return error.get('failed_generation', '') if isinstance(error, dict) else ''
+            if 'response_format' not in message:
+                raise
+            logging.info(f"{model} does not support JSON mode, using plain completions")
+            self.json_mode_unsupported.add(model)
+            return self.complete_json(prompt, model, budget, max_tokens)
+        
+        choice = chat_completion.choices[0]
+        response_text = choice.message.content or ''
+        truncated = getattr(choice, 'finish_reason', None) == 'length'
+        if truncated:
+            metrics.inc('llm_truncated')
+        usage = getattr(chat_completion, 'usage', None)
+        budget.observe(getattr(usage, 'completion_tokens', None) or len(response_text) // 4, truncated)
+        return response_text
+    
+    def cache_key(self, message_id, sender, subject, body, prompt_template, model):
+        """Key of the cached summary for these prompt inputs, or None when caching is off"""
+        if not (self.cache and message_id):
+            return None
+        return SummaryCache.content_hash(sender, subject, body, prompt_template, model)
+    
+    def cached_response(self, message_id, cache_key, index=None):
+        cached = self.cache.get(message_id, cache_key)
+        if cached:
+            logging.debug(f"Cache hit for email {index}")
+            metrics.inc('cache_hits')
+        else:
+            metrics.inc('cache_misses')
+        return cached
+    
+    def repair_response(self, response_text, problems, subject, prompt, model, index=None):
+        """
+        Sends up to Config.LLM_JSON_REPAIR_RETRIES short repair requests for an unusable response.
+        prompt is the single-email prompt whose format line the repair repeats.
+        Returns (validated response, None) or (None, [problems]).
+        """
+        result = None
+        for attempt in range(Config.LLM_JSON_REPAIR_RETRIES):
+            logging.info(f"Unusable response to email {index} ({'; '.join(problems)}), asking for a repair")
+            metrics.inc('llm_json_retries')
+            repair_prompt = REPAIR_PROMPT_TEMPLATE.format(
+                problems='; '.join(problems), response=(response_text or '')[:1000], subject=subject,
+                response_format=response_format_line(prompt))
+            response_text = self.complete_json(repair_prompt, model, self.output_budget(REPAIR_PROMPT_TEMPLATE),
+                                               max_tokens=Config.LLM_OUTPUT_TOKENS_MAX)
+            result, problems = self.parse_structured(response_text)
+            if result is not None:
+                break
+        return result, problems
+    
+    def parse_structured(self, response_text):
+        """Returns (validated response, None) or (None, [problems])"""
+        try:
+            response, extracted = parse_json(response_text)
+        except ValueError as e:
+            metrics.inc('llm_json_parse_errors')
+            return None, [f"invalid JSON ({e})"]
+        if extracted:
+            metrics.inc('llm_json_repairs')
+        return self.validate_response(response)
+    
+    def validate_response(self, response):
+        """Checks a parsed response against the summary schema. Returns (validated response, None) or (None, [problems])"""
+        try:
+            result, coerced = SUMMARY_VALIDATOR.validate(response)
+        except SchemaError as e:
+            metrics.inc('llm_schema_errors')
+            return None, e.problems
+        if coerced:
+            metrics.inc('llm_fields_coerced')
+            if 'importance_score' in coerced:
+                metrics.inc('llm_score_coerced')
+        return result, None
 
 
 
@@ -115,56 +338,194 @@ Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent"""
         print("="*80)
         
         # Sort by importance score (highest first)
-        sorted_results = sorted(results, key=lambda x: x['importance_score'], reverse=True)
+        sorted_results = sorted(results, key=lambda x: x.importance_score, reverse=True)
         
         for result in sorted_results:
-            importance_level = result['importance_level'].upper()
-            score = result['importance_score']
+            importance_level = result.importance_level.upper()
+            score = result.importance_score
             
-            print(f"From: {result['sender']}; Number: {result['Number']}")
-            print(f"Subject: {result['original_subject']}")
+            print(f"From: {result.sender}; Number: {result.number}")
+            print(f"Subject: {result.original_subject}")
             print(f"Importance: {score}/10 ({importance_level})")
-            print(f"Summary: {result['summary']}")
-            print(f"Reason: {result['reason']}")
+            print(f"Summary: {result.summary}")
+            print(f"Reason: {result.reason}")
             print("-" * 60)
 
-    def process_emails_in_parallel(self, emails, max_concurrent=5):
+    def triage_email(self, email, index):
         """
-        Process a list of emails in parallel and return summaries with importance scores
+        Runs local triage. Returns (decision, result) where result is the locally scored
+        SummaryResult for bulk mail that skips the LLM, otherwise None.
         """
-        logging.info(f"Begin processing emails in parallel")
-        results = []
-        
-        def process_single_email(email_data):
-            """Helper function to process a single email"""
-            email, index = email_data
-            
-            subject = email['subject']
-            body = email['body']
-            sender = email['sender']
-            
-            # Truncate very long emails to stay within token limits
-            if len(body) > 1000:
-                body = body[:1000] + "... [truncated]"
+        if not self.triage:
+            return None, None
+        decision = self.triage.classify(email)
+        if not decision.skip_llm:
+            return decision, None
+        logging.debug(f"Email {index} triaged as bulk ({', '.join(decision.signals)})")
+        result = SummaryResult.from_response(email, index, self.triage.bulk_response(email, decision))
+        self.label_result(result, decision, source='triage')
+        return decision, result
+    
+    def label_result(self, result, decision, source='llm'):
+        result.source = source
+        if decision:
+            result.triage_verdict = decision.verdict
+            result.signals = ','.join(decision.signals)
+        return result
+    
+    def summarize_cascade(self, email, index, tiers=None):
+        """
+        Asks the models in Config.LLM_CASCADE_TIERS in order, smallest first, and stops at the first
+        answer that needn't be escalated (see escalation_reason). The last tier's answer is final.
+        When a tier is escalated, its score is compared with the next tier's to track agreement.
+        Each tier gets the body condensed to its own token budget.
+
+        Returns:
+            (response or None, tokens saved by condensing the body the response was given)
+        """
+        tiers = tiers or Config.LLM_CASCADE_TIERS
+        bodies = {}  # Token budget -> (body, tokens_saved), so tiers with the same budget share one
+        previous, previous_saved = None, 0
+        for number, model in enumerate(tiers):
+            final = number == len(tiers) - 1
+            tag = metric_name(model)
+            budget = token_budget_for(model)
+            if budget not in bodies:
+                bodies[budget] = prepare_body(email.body, index, model)
+            body, tokens_saved = bodies[budget]
+            with metrics.span(f"cascade_{tag}"):
+                response = self.summarize_and_score_email(
+                    email.subject, body, email.sender, index, message_id=email.message_id, model=model,
+                    prompt_template=PROMPT_TEMPLATE if final else CASCADE_PROMPT_TEMPLATE)
             
-            result = self.summarize_and_score_email(subject, body, sender, index)
+            if response is None:
+                if final:
+                    return previous, previous_saved
+                metrics.inc(f"cascade_{tag}_escalated_error")
+                continue
+            if previous is not None:
+                self.record_agreement(previous, response)
             
-            if result:
-                result['original_subject'] = subject
-                result['Number'] = index
-                result['sender'] = sender
-                return result
+            reason = None if final else self.escalation_reason(response, email.message_id)
+            if reason is None:
+                metrics.inc(f"cascade_{tag}_answered")
+                return response, tokens_saved
+            logging.debug(f"Email {index}: escalating from {model} ({reason})")
+            metrics.inc(f"cascade_{tag}_escalated_{reason}")
+            previous, previous_saved = response, tokens_saved
+        return previous, previous_saved
+    
+    def escalation_reason(self, response, message_id=None):
+        """
+        Why a non-final tier's answer goes to the next tier: 'near_threshold' (score within
+        Config.LLM_CASCADE_ESCALATE_MARGIN of the urgent score), 'low_confidence', 'audit'
+        (a sample of confident answers, checked to measure agreement), or None to accept it
+        """
+        if abs(response_score(response) - Config.LLM_CASCADE_URGENT_SCORE) <= Config.LLM_CASCADE_ESCALATE_MARGIN:
+            return 'near_threshold'
+        try:
+            confidence = float(response.get('confidence'))
+        except (TypeError, ValueError):
+            confidence = None
+        if confidence is None or confidence < Config.LLM_CASCADE_MIN_CONFIDENCE:
+            return 'low_confidence'
+        if in_sample(message_id, Config.LLM_CASCADE_AUDIT_RATE):
+            return 'audit'
+        return None
+    
+    def record_agreement(self, lower, upper):
+        """Agreement of an escalated answer with the tier above: same side of the urgent score, and score within 1"""
+        tag = metric_name(lower.get('model', ''))
+        lower_score, upper_score = response_score(lower), response_score(upper)
+        metrics.inc(f"cascade_{tag}_compared")
+        if (lower_score >= Config.LLM_CASCADE_URGENT_SCORE) == (upper_score >= Config.LLM_CASCADE_URGENT_SCORE):
+            metrics.inc(f"cascade_{tag}_agreed_urgency")
+        if abs(lower_score - upper_score) <= 1:
+            metrics.inc(f"cascade_{tag}_agreed_score")
+        metrics.observe(f"cascade_{tag}_score_delta", abs(lower_score - upper_score))
+    
+    def process_email(self, email, index):
+        """
+        Summarize a single fetched EmailRecord into a SummaryResult carrying its message ID and link
+        """
+        decision, result = self.triage_email(email, index)
+        if result:
+            return result
+        
+        with metrics.span('llm_email'):
+            if Config.LLM_CASCADE:
+                response, tokens_saved = self.summarize_cascade(email, index)
             else:
-                logging.info(f"Failed to process email {index}")
-                return None
+                body, tokens_saved = prepare_body(email.body, index)
+                response = self.summarize_and_score_email(email.subject, body, email.sender, index, message_id=email.message_id)
+        
+        if response:
+            return self.label_result(SummaryResult.from_response(email, index, response, tokens_saved), decision)
+        else:
+            logging.info(f"Failed to process email {index}")
+            return None
+
+    def urgency(self, email):
+        """Urgency prior of an email (0 when priority ordering is off)"""
+        return self.prioritizer.score(email) if self.prioritizer else 0
+    
+    def prioritize(self, indexed_emails):
+        """(index, email) pairs in the order they should be summarized: most likely urgent first"""
+        if not self.prioritizer:
+            return list(indexed_emails)
+        with metrics.span('prioritize'):
+            return self.prioritizer.order(indexed_emails)
+    
+    def collapse_groups(self, emails):
+        """
+        Groups threads and near-duplicates so each group is summarized once.
+
+        Returns:
+            (emails to summarize, groups keyed by the summarized email's message ID, message ID -> original index)
+        """
+        numbers = {email.message_id: i for i, email in enumerate(emails, 1)}
+        if not self.deduplicator:
+            return emails, {}, numbers
+        groups = {}
+        to_summarize = []
+        for group in self.deduplicator.group(emails):
+            if len(group.members) > 1:
+                groups[group.representative.message_id] = group
+            to_summarize.append(group.combined_email())
+        return to_summarize, groups, numbers
+    
+    def expand_groups(self, results, groups, numbers):
+        """Copies each group's result to all of its members and restores the original email numbers"""
+        expanded = []
+        for result in results:
+            group = groups.get(result.message_id)
+            if group:
+                expanded.extend(self.deduplicator.fan_out(group, result, numbers))
+            else:
+                result.number = numbers.get(result.message_id, result.number)
+                expanded.append(result)
+        return expanded
+    
+    def process_emails_in_parallel(self, emails, max_concurrent=Config.LLM_MAX_CONCURRENCY, on_result=None):
+        """
+        Process a list of emails in parallel and return summaries with importance scores
+        
+        max_concurrent sizes the thread pool; the number of calls actually in flight is
+        adapted below that ceiling by self.concurrency as the provider accepts or throttles them.
+        Emails are submitted most likely urgent first (see prioritize). on_result, if given, is
+        called with each summarized email's result as soon as it completes, once per group.
+        """
+        logging.info(f"Begin processing emails in parallel")
+        results = []
+        emails, groups, numbers = self.collapse_groups(emails)
     
         # Create list of (email, index) tuples for processing
-        email_data_list = [(email, i+1) for i, email in enumerate(emails)]
+        email_data_list = [(email, index) for index, email in self.prioritize(enumerate(emails, 1))]
         
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent) as executor:
             # Submit all tasks
             future_to_email = {
-                executor.submit(process_single_email, email_data): email_data[1] 
+                executor.submit(self.process_email, *email_data): email_data[1] 
                 for email_data in email_data_list
             }
             
@@ -174,8 +535,11 @@ Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent"""
                 try:
                     result = future.result()
                     if result:
-                        results.append(result)
+                        expanded = self.expand_groups([result], groups, numbers)
+                        results.extend(expanded)
                         logging.info(f"Completed processing email {email_index}/{len(emails)}")
+                        if on_result:
+                            on_result(expanded[0])
                         
                 except Exception as e:
                     logging.info(f"Fatal error in processing email {email_index}")
@@ -183,5 +547,159 @@ Scoring: 1-4=ignorable, 5-7=review later, 8-10=urgent"""
         
         return results
 
+    def pack_batches(self, entries, token_budget=Config.LLM_BATCH_TOKEN_BUDGET, max_batch_size=Config.LLM_BATCH_MAX_EMAILS):
+        """
+        Greedily groups (email, index, condensed_body, tokens_saved) entries so each
+        batch prompt stays under token_budget
+        """
+        preamble_tokens = count_tokens(BATCH_PROMPT_TEMPLATE)
+        batches = []
+        current, current_tokens = [], preamble_tokens
+        
+        for email, index, body, tokens_saved in entries:
+            block = EMAIL_BLOCK_TEMPLATE.format(number=len(current) + 1, sender=email.sender,
+                                                subject=email.subject, body=body)
+            tokens = count_tokens(block)
+            
+            if current and (current_tokens + tokens > token_budget or len(current) >= max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], preamble_tokens
+            current.append((email, index, body, tokens_saved))
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
 
+    def summarize_batch(self, batch):
+        """
+        Summarizes several emails with one completion that returns a JSON array keyed by email number.
+        Each item is checked like a single-email answer: an unusable one gets a repair request, and
+        emails missing from a malformed or partial response fall back to individual calls. Usable
+        answers are cached under the same key as the single-email path.
+        
+        Returns:
+            List of results in the same shape as process_email
+        """
+        blocks = []
+        for number, (email, index, body, tokens_saved) in enumerate(batch, 1):
+            blocks.append(EMAIL_BLOCK_TEMPLATE.format(number=number, sender=email.sender,
+                                                      subject=email.subject, body=body))
+        prompt = BATCH_PROMPT_TEMPLATE.format(emails="\n".join(blocks))
+        
+        parsed = {}
+        unusable = {}
+        try:
+            chat_completion = self.create_completion(
+                messages=[{"role": "user", "content": prompt}],
+                model=Config.GROQ_MODEL,
+                temperature=0.1,
+                # The per-email allowance of the single prompt; no JSON mode, which only returns objects
+                max_tokens=self.output_budget(PROMPT_TEMPLATE).max_tokens() * len(batch),
+            )
+            response_text = chat_completion.choices[0].message.content
+            
+            start_idx = response_text.find('[')
+            end_idx = response_text.rfind(']') + 1
+            items = json.loads(response_text[start_idx:end_idx]) if start_idx != -1 else []
+            
+            for item in items:
+                try:
+                    number = int(item.pop('email'))
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    metrics.inc('llm_schema_errors')
+                    continue
+                result, problems = self.validate_response(item)
+                if result is None:
+                    unusable[number] = (json.dumps(item), problems)
+                else:
+                    parsed[number] = result
+        except (json.JSONDecodeError, ValueError, KeyError, TypeError):
+            logging.info(f"Malformed batch response, falling back to per-email calls")
+        except Exception:
+            logging.info(f"Fatal error with Grok AI in batch call")
+            logging.exception("Full traceback with Grok AI batch error")
+        
+        results = []
+        for number, (email, index, body, tokens_saved) in enumerate(batch, 1):
+            response = parsed.get(number)
+            if response is None and number in unusable:
+                try:
+                    prompt = PROMPT_TEMPLATE.format(sender=email.sender, subject=email.subject, body=body)
+                    response, _ = self.repair_response(*unusable[number], email.subject, prompt, Config.GROQ_MODEL, index)
+                except Exception:
+                    logging.info(f"Fatal error with Grok AI in batch item repair")
+                    logging.exception("Full traceback with Grok AI batch repair error")
+            if response is not None:
+                response['model'] = Config.GROQ_MODEL
+                cache_key = self.cache_key(email.message_id, email.sender, email.subject, body, PROMPT_TEMPLATE,
+                                           Config.GROQ_MODEL)
+                if cache_key:
+                    self.cache.put(email.message_id, cache_key, response)
+            if response is None:
+                logging.debug(f"Email {index} missing from batch response, summarizing individually")
+                metrics.inc('llm_batch_fallbacks')
+                result = self.process_email(email, index)
+            else:
+                result = SummaryResult.from_response(email, index, response, tokens_saved)
+            if result:
+                results.append(result)
+        return results
 
+    def process_emails_batched(self, emails, token_budget=Config.LLM_BATCH_TOKEN_BUDGET, max_concurrent=Config.LLM_MAX_CONCURRENCY,
+                               on_result=None):
+        """
+        Like process_emails_in_parallel, but packs several emails into each prompt so the
+        instruction preamble and the request overhead are paid once per batch.
+        The most likely urgent emails go into the first batches.
+        """
+        # Bulk mail is scored locally and never enters a batch prompt
+        results = []
+        emails, groups, numbers = self.collapse_groups(emails)
+        pending = []
+        decisions = {}
+        for index, email in self.prioritize(enumerate(emails, 1)):
+            decision, result = self.triage_email(email, index)
+            if result:
+                results.extend(self.expand_groups([result], groups, numbers))
+            else:
+                pending.append((index, email))
+                decisions[email.message_id] = decision
+        
+        # Emails already summarized with the same inputs come from the cache and stay out of the prompts
+        entries = []
+        for index, email in pending:
+            body, tokens_saved = prepare_body(email.body, index)
+            cache_key = self.cache_key(email.message_id, email.sender, email.subject, body, PROMPT_TEMPLATE,
+                                       Config.GROQ_MODEL)
+            cached = self.cached_response(email.message_id, cache_key, index) if cache_key else None
+            if cached:
+                result = self.label_result(SummaryResult.from_response(email, index, cached, tokens_saved),
+                                           decisions.get(email.message_id))
+                expanded = self.expand_groups([result], groups, numbers)
+                results.extend(expanded)
+                if on_result:
+                    on_result(expanded[0])
+            else:
+                entries.append((email, index, body, tokens_saved))
+        
+        batches = self.pack_batches(entries, token_budget)
+        logging.info(f"Begin processing {len(entries)} emails in {len(batches)} batched prompts")
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+            futures = [executor.submit(self.summarize_batch, batch) for batch in batches]
+            
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    for result in future.result():
+                        if result.source == 'llm':
+                            self.label_result(result, decisions.get(result.message_id))
+                        expanded = self.expand_groups([result], groups, numbers)
+                        results.extend(expanded)
+                        if on_result:
+                            on_result(expanded[0])
+                except Exception as e:
+                    logging.info(f"Fatal error in processing email batch")
+                    logging.exception("Full traceback in batch processing error")
+        
+        return results
@@ -0,0 +1,218 @@
+"""
+Per-stage timing and counters
+Spans time each stage (auth, list, get, MIME parsing, LLM calls, JSON repair, store writes) into
+histograms with p50/p95/p99, and Groq usage tokens are recorded per call. The registry is persisted
+to Config.METRICS_FILE after each run so `stats --detailed` can report across runs, and can be
+served in the Prometheus text format.
+"""
+
+import collections
+import json
+import math
+import os
+import re
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Config import Config
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Count, sum, min and max over every observation, with percentiles computed from the most
+    recent max_samples observations.
+    """
+
+    def __init__(self, max_samples=Config.METRICS_MAX_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, q):
+        """Nearest-rank percentile over the retained samples"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.total, 'min': self.min, 'max': self.max,
+                'samples': list(self.samples)}
+
+    @classmethod
+    def from_dict(cls, data, max_samples=Config.METRICS_MAX_SAMPLES):
+        histogram = cls(max_samples)
+        histogram.count = data['count']
+        histogram.total = data['sum']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        histogram.samples.extend(data['samples'])
+        return histogram
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms shared by every module through the `metrics` instance below"""
+
+    def __init__(self):
+        self.counters = collections.defaultdict(float)
+        self.histograms = {}
+        self._loaded_files = set()
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name):
+        """Times the enclosed block into the <name>_seconds histogram, errors included"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors")
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start)
+
+    def snapshot(self):
+        """Percentile summary of every metric"""
+        with self._lock:
+            histograms = {}
+            for name, h in self.histograms.items():
+                histograms[name] = {'count': h.count, 'sum': h.total, 'min': h.min, 'max': h.max,
+                                    **{f"p{int(q * 100)}": h.percentile(q) for q in QUANTILES}}
+            return {'counters': dict(self.counters), 'histograms': histograms}
+
+    def to_prometheus(self, prefix='email_automation_'):
+        """Renders counters and histograms (as summaries) in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                lines.append(f"{prefix}{name}_total {value:g}")
+            for name, h in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} summary")
+                for q in QUANTILES:
+                    lines.append(f'{prefix}{name}{{quantile="{q}"}} {h.percentile(q):.6g}')
+                lines.append(f"{prefix}{name}_sum {h.total:.6g}")
+                lines.append(f"{prefix}{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, metrics_file=Config.METRICS_FILE):
+        """Writes the full registry (including retained samples) so later runs continue from it"""
+        with self._lock:
+            data = {'counters': dict(self.counters),
+                    'histograms': {name: h.to_dict() for name, h in self.histograms.items()}}
+        try:
+            tmp_file = f"{metrics_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, metrics_file)
+        except IOError:
+            logging.info(f"Error saving metrics file")
+            logging.exception("An error occurred while saving the metrics file.")
+
+    def load(self, metrics_file=Config.METRICS_FILE):
+        """Merges a saved registry into this one once per file; missing or unreadable files are ignored"""
+        if metrics_file in self._loaded_files or not os.path.exists(metrics_file):
+            return
+        self._loaded_files.add(metrics_file)
+        try:
+            with open(metrics_file, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            logging.info(f"Ignoring unreadable metrics file {metrics_file}")
+            return
+        with self._lock:
+            for name, value in data.get('counters', {}).items():
+                self.counters[name] += value
+            for name, saved in data.get('histograms', {}).items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram.from_dict(saved)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+metrics = MetricsRegistry()
+
+
+def metric_name(text):
+    """A model name or other label made safe to use inside a metric name"""
+    return re.sub(r'[^a-zA-Z0-9_]', '_', text)
+
+
+def record_usage(completion, prefix='llm'):
+    """Records the token counts from a Groq completion's usage field, when present"""
+    usage = getattr(completion, 'usage', None)
+    if usage is None:
+        return
+    for field in ('prompt_tokens', 'completion_tokens'):
+        tokens = getattr(usage, field, None)
+        if tokens is not None:
+            metrics.observe(f"{prefix}_{field}", tokens)
+
+
+class MetricsServer:
+    """Serves GET /metrics in the Prometheus text format from a background thread"""
+
+    def __init__(self, registry=metrics, host=Config.METRICS_HOST, port=Config.METRICS_PORT or 0):
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Metrics server: {format % args}")
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.info(f"Metrics endpoint listening on port {self.port}")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
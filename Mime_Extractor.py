@@ -0,0 +1,177 @@
+"""
+Recursive MIME body extraction for Gmail message payloads
+Prefers text/plain alternatives, strips HTML with a streaming parser, and stops decoding
+once enough text has been collected for the downstream truncation limit.
+"""
+
+import base64
+import binascii
+import codecs
+import logging
+from html.parser import HTMLParser
+from Config import Config
+
+DECODE_CHUNK_SIZE = 8192  # base64 characters per decode step, must be a multiple of 4
+
+SKIPPED_TAGS = {'script', 'style', 'head', 'title', 'noscript'}
+
+
+class HtmlTextStripper(HTMLParser):
+    """
+    Streaming HTML-to-text converter: drops markup, scripts and styles and keeps one line per text run.
+    Text is collected in self.parts and its running length in self.length.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.length = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        text = ' '.join(data.split())
+        if text:
+            self.parts.append(text)
+            self.length += len(text) + 1
+
+    def text(self):
+        return '\n'.join(self.parts)
+
+
+def iter_decoded(data, chunk_size=DECODE_CHUNK_SIZE):
+    """Decodes base64url data to text chunk by chunk, so callers can stop early"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    data = data + '=' * (-len(data) % 4)  # Gmail omits padding on some bodies
+    for start in range(0, len(data), chunk_size):
+        yield decoder.decode(base64.urlsafe_b64decode(data[start:start + chunk_size]))
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def html_to_text(html, max_chars=None):
+    """Converts an HTML string to plain text, stopping once max_chars of text has been produced"""
+    stripper = HtmlTextStripper()
+    for start in range(0, len(html), DECODE_CHUNK_SIZE):
+        stripper.feed(html[start:start + DECODE_CHUNK_SIZE])
+        if max_chars and stripper.length > max_chars:
+            break
+    stripper.close()
+    return stripper.text()
+
+
+def _decode_part(part, remaining):
+    """Extracts up to roughly `remaining` characters of text from a single text/* part"""
+    data = part.get('body', {}).get('data')
+    if not data:
+        return None
+
+    if part.get('mimeType') == 'text/html':
+        stripper = HtmlTextStripper()
+        for chunk in iter_decoded(data):
+            stripper.feed(chunk)
+            if stripper.length > remaining:
+                break
+        stripper.close()
+        return stripper.text()
+
+    # Plain text maps almost 1:1 from decoded bytes, so only decode about as much as is still needed
+    chunk_size = DECODE_CHUNK_SIZE
+    if remaining != float('inf'):
+        chunk_size = min(DECODE_CHUNK_SIZE, (int(remaining) // 3 + 1) * 4)
+
+    pieces, length = [], 0
+    for chunk in iter_decoded(data, chunk_size):
+        pieces.append(chunk)
+        length += len(chunk)
+        if length > remaining:
+            break
+    return ''.join(pieces)
+
+
+def _has_mime_type(part, mime_type):
+    if part.get('mimeType') == mime_type:
+        return True
+    return any(_has_mime_type(child, mime_type) for child in part.get('parts', []))
+
+
+def _is_attachment(part):
+    return bool(part.get('filename')) or 'attachmentId' in part.get('body', {})
+
+
+class MimeBodyExtractor:
+    """
+    Walks a Gmail payload recursively and returns readable text.
+
+    multipart/alternative keeps only the best child (text/plain when one exists, otherwise HTML);
+    multipart/mixed and multipart/related are read in order and attachments are skipped.
+    """
+
+    def __init__(self, max_chars=Config.EMAIL_BODY_CHAR_LIMIT):
+        self.max_chars = max_chars
+
+    def extract(self, payload, index=None):
+        self.collected = []
+        self.length = 0
+        self.decode_failures = 0
+        self._walk(payload)
+
+        if self.decode_failures and not self.collected:
+            logging.info(f"All parts of email {index} failed to decode or had no data.")
+        return "\n\n".join(self.collected)
+
+    def _full(self):
+        return self.max_chars and self.length > self.max_chars
+
+    def _walk(self, part):
+        if self._full():
+            return
+
+        mime_type = part.get('mimeType', '')
+
+        if mime_type == 'multipart/alternative':
+            children = part.get('parts', [])
+            preferred = next((c for c in children if _has_mime_type(c, 'text/plain')), None)
+            if preferred is None:
+                preferred = next((c for c in children if _has_mime_type(c, 'text/html')), None)
+            if preferred is not None:
+                self._walk(preferred)
+            return
+
+        if mime_type.startswith('multipart/') or ('parts' in part and not mime_type.startswith('text/')):
+            for child in part.get('parts', []):
+                if not _is_attachment(child):
+                    self._walk(child)
+            return
+
+        if mime_type not in ('text/plain', 'text/html') or _is_attachment(part):
+            return
+
+        remaining = self.max_chars - self.length if self.max_chars else float('inf')
+        try:
+            text = _decode_part(part, remaining)
+        except (binascii.Error, ValueError) as e:
+            self.decode_failures += 1
+            logging.debug(f"Decoding failed for {mime_type} part: {e}")
+            return
+
+        if text is None:
+            self.decode_failures += 1
+        elif text.strip():
+            self.collected.append(text)
+            self.length += len(text) + 2
+
+
+def extract_body(payload, index=None, max_chars=Config.EMAIL_BODY_CHAR_LIMIT):
+    """Convenience wrapper around MimeBodyExtractor"""
+    return MimeBodyExtractor(max_chars).extract(payload, index)
@@ -0,0 +1,119 @@
+"""
+Early alerts for high-importance emails
+Results scoring Config.ALERT_MIN_SCORE or more are sent to the configured sinks (stdout, a JSONL
+file, a local webhook) as soon as they are ready, while the rest of the run is still summarizing.
+"""
+
+import json
+import threading
+import time
+import urllib.request
+import logging
+from datetime import datetime
+from Config import Config
+from Metrics import metrics
+
+
+def alert_payload(result, account=''):
+    return {
+        'account': account,
+        'message_id': result.message_id,
+        'subject': result.original_subject,
+        'sender': result.sender,
+        'importance_score': result.importance_score,
+        'summary': result.summary,
+        'reason': result.reason,
+        'link': result.link,
+        'group_size': result.group_size,
+        'alerted_at': datetime.now().isoformat(),
+    }
+
+
+class StdoutNotifier:
+    def notify(self, alert):
+        account = f"[{alert['account']}] " if alert['account'] else ""
+        similar = f", +{alert['group_size'] - 1} more in group" if alert['group_size'] > 1 else ""
+        print(f"🚨 {account}{alert['subject'] or 'No subject'} (Score: {alert['importance_score']}{similar})"
+              f" - {alert['sender']}\n   {alert['summary']}\n   {alert['link']}", flush=True)
+
+
+class FileNotifier:
+    """Appends one JSON line per alert, for other local tools to tail"""
+
+    def __init__(self, alert_file=Config.ALERT_FILE):
+        self.alert_file = alert_file
+        self._lock = threading.Lock()
+
+    def notify(self, alert):
+        with self._lock, open(self.alert_file, 'a') as f:
+            f.write(json.dumps(alert) + "\n")
+
+
+class WebhookNotifier:
+    """POSTs each alert as JSON to a local webhook"""
+
+    def __init__(self, url=Config.ALERT_WEBHOOK_URL, timeout=Config.ALERT_WEBHOOK_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+
+    def notify(self, alert):
+        request = urllib.request.Request(self.url, data=json.dumps(alert).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+NOTIFIERS = {
+    'stdout': StdoutNotifier,
+    'file': FileNotifier,
+    'webhook': WebhookNotifier,
+}
+
+
+def make_notifiers(sinks=Config.ALERT_SINKS):
+    notifiers = []
+    for sink in sinks:
+        if sink not in NOTIFIERS:
+            logging.info(f"Ignoring unknown alert sink {sink!r}")
+            continue
+        if sink == 'webhook' and not Config.ALERT_WEBHOOK_URL:
+            logging.info(f"Ignoring webhook alert sink without ALERT_WEBHOOK_URL")
+            continue
+        notifiers.append(NOTIFIERS[sink]())
+    return notifiers
+
+
+class AlertDispatcher:
+    """
+    Args:
+        notifiers: sinks with a notify(alert) method; defaults to those named in Config.ALERT_SINKS
+        min_score: lowest importance score that raises an alert
+        account: account name included in each alert
+    """
+
+    def __init__(self, notifiers=None, min_score=Config.ALERT_MIN_SCORE, account=''):
+        self.notifiers = make_notifiers() if notifiers is None else notifiers
+        self.min_score = min_score
+        self.account = account
+
+    def notify(self, result, run_start_time=None):
+        """
+        Sends result to every sink when it scores min_score or more. A failing sink is logged
+        and skipped so it can't hold up the others or the run. Returns True if an alert was raised.
+        """
+        if result.importance_score < self.min_score or not self.notifiers:
+            return False
+        if run_start_time is not None:
+            metrics.observe('time_to_alert_seconds', time.time() - run_start_time)
+
+        alert = alert_payload(result, self.account)
+        for notifier in self.notifiers:
+            try:
+                notifier.notify(alert)
+            except Exception:
+                logging.info(f"Error sending alert to {type(notifier).__name__}")
+                logging.exception("Full traceback in alert sink")
+                metrics.inc('alert_errors')
+        metrics.inc('alerts_sent')
+        logging.info(f"Alerted on {result.message_id} (score {result.importance_score})")
+        return True
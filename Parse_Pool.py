@@ -0,0 +1,100 @@
+"""
+Optional process pool for the CPU-bound part of fetching
+Base64 decoding and HTML stripping of Gmail payloads run in worker processes, so parsing a
+large backlog of HTML-heavy mail uses every core instead of sharing one under the GIL.
+Payloads are shipped in chunks to keep pickling and IPC overhead per message low. One pool
+(shared_parse_pool) serves every GmailHandler in the process.
+"""
+
+import atexit
+import concurrent.futures
+import multiprocessing
+import threading
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from Config import Config
+from Mime_Extractor import extract_body
+from Metrics import metrics
+
+
+def extract_payload(item):
+    """
+    Worker entry point: (payload, max_chars) -> extracted body text, or None when extraction
+    fails so the caller can retry inline and log the error in the main process
+    """
+    payload, max_chars = item
+    try:
+        return extract_body(payload, max_chars=max_chars)
+    except Exception:
+        return None
+
+
+class ParsePool:
+    """
+    Args:
+        workers: worker processes; the pool is only used when this is 2 or more
+        chunk_size: payloads sent to a worker per task
+        min_messages: smaller sets are parsed inline, where starting tasks would cost more than it saves
+    """
+
+    def __init__(self, workers=Config.PARSE_WORKERS, chunk_size=Config.PARSE_CHUNK_SIZE,
+                 min_messages=Config.PARSE_POOL_MIN_MESSAGES):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_messages = min_messages
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers and self.workers > 1
+
+    def executor(self):
+        """Started on first use and kept for later runs; spawned, since the caller runs other threads"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                logging.info(f"Started parse pool with {self.workers} workers")
+            return self._executor
+
+    def extract_bodies(self, payloads, max_chars=Config.EMAIL_BODY_CHAR_LIMIT):
+        """
+        Body text for each payload, in order, with None wherever the pool could not produce it
+        (a failed payload, a pool that died, or a set too small to be worth sending)
+        """
+        payloads = list(payloads)
+        if not self.enabled or len(payloads) < self.min_messages:
+            return [None] * len(payloads)
+
+        with metrics.span('parse_pool'):
+            try:
+                bodies = list(self.executor().map(extract_payload, [(payload, max_chars) for payload in payloads],
+                                                  chunksize=self.chunk_size))
+            except BrokenProcessPool:
+                logging.info(f"Parse pool stopped unexpectedly, parsing inline")
+                logging.exception("Full traceback in parse pool")
+                self.shutdown()
+                return [None] * len(payloads)
+        metrics.inc('parse_pool_messages', len(payloads))
+        return bodies
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def shared_parse_pool():
+    """The process-wide ParsePool: created on first call, shared by every account's handler, shut down at exit"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ParsePool(Config.PARSE_WORKERS, Config.PARSE_CHUNK_SIZE, Config.PARSE_POOL_MIN_MESSAGES)
+            atexit.register(_shared_pool.shutdown)
+        return _shared_pool
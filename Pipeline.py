@@ -0,0 +1,157 @@
+"""
+Streaming fetch -> parse -> summarize pipeline
+Each email is handed to the LLM as soon as its body has been extracted, so fetching and
+summarizing overlap instead of running as two fixed stages. Parsed emails wait in a priority
+queue, so when the LLM stage falls behind the most likely urgent ones are summarized first.
+Threads and near-duplicates are grouped within each window of parsed emails (whatever has
+arrived, up to batch_size) and summarized once per group.
+"""
+
+import math
+import queue
+import threading
+import logging
+from Config import Config
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+
+class EmailPipeline:
+    """
+    Runs the Gmail fetch, MIME parsing and LLM calls as concurrent stages connected by
+    bounded queues. A full queue blocks the stage feeding it, which keeps a slow LLM stage
+    from letting fetched payloads pile up in memory.
+
+    Args:
+        gmail_handler: GmailHandler used for batch fetching and body extraction
+        llm_processor: LLM_Processor used to summarize each email
+        max_concurrent: number of LLM worker threads (calls in flight still adapt below this)
+        queue_size: capacity of each inter-stage queue
+        batch_size: messages per Gmail batch request; small batches get the first email to the LLM sooner
+    """
+
+    def __init__(self, gmail_handler, llm_processor, max_concurrent=Config.LLM_MAX_CONCURRENCY,
+                 queue_size=Config.PIPELINE_QUEUE_SIZE, batch_size=Config.PIPELINE_BATCH_SIZE):
+        self.gmail_handler = gmail_handler
+        self.llm_processor = llm_processor
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.failed_ids = []
+        self.skipped_ids = []  # Deleted since they were listed (see GmailHandler.iter_messages_batched)
+
+    def run(self, service, message_ids, on_result=None):
+        """
+        Streams message_ids through the pipeline.
+
+        Args:
+            service: Gmail API service instance
+            message_ids: IDs of the messages to process
+            on_result: optional callback invoked with each result as soon as it is ready
+
+        Returns:
+            (emails, results) - every parsed EmailRecord and every SummaryResult, in completion order
+        """
+        logging.info(f"Starting pipeline for {len(message_ids)} messages")
+        self.failed_ids = []
+        self.skipped_ids = []
+        raw_queue = queue.Queue(maxsize=self.queue_size)
+        # (-urgency prior, index, email); ties are taken in fetch order
+        email_queue = queue.PriorityQueue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+        emails = []
+        groups = {}  # Summarized email's message ID -> EmailGroup, across windows
+        numbers = {}  # Message ID -> parse index
+
+        def fetch_stage():
+            try:
+                for msg_data in self.gmail_handler.iter_messages_batched(
+                        service, message_ids, self.batch_size, failed_ids=self.failed_ids,
+                        skipped_ids=self.skipped_ids):
+                    raw_queue.put(msg_data)
+            except Exception:
+                logging.info(f"Fatal error in pipeline fetch stage")
+                logging.exception("Full traceback in pipeline fetch stage")
+            finally:
+                raw_queue.put(_DONE)
+
+        def submit_window(window):
+            """Groups a window of parsed emails and queues one email per group"""
+            to_summarize, window_groups, _ = self.llm_processor.collapse_groups(window)
+            groups.update(window_groups)
+            for email in to_summarize:
+                email_queue.put((-self.llm_processor.urgency(email), numbers[email.message_id], email))
+
+        def parse_stage():
+            index = 0
+            window = []
+            try:
+                while True:
+                    msg_data = raw_queue.get()
+                    if msg_data is _DONE:
+                        break
+                    index += 1
+                    try:
+                        email = self.gmail_handler.parse_message(msg_data, index)
+                    except Exception:
+                        logging.exception(f"Failed to parse message {msg_data.get('id')}")
+                        self.failed_ids.append(msg_data.get('id'))
+                        continue
+                    emails.append(email)
+                    numbers[email.message_id] = index
+                    window.append(email)
+                    # Don't hold emails back waiting for a full window when nothing else has arrived
+                    if len(window) >= self.batch_size or raw_queue.empty():
+                        submit_window(window)
+                        window = []
+                if window:
+                    submit_window(window)
+            except Exception:
+                logging.info(f"Fatal error in pipeline parse stage")
+                logging.exception("Full traceback in pipeline parse stage")
+            finally:
+                # Sorted after every email still waiting
+                for number in range(self.max_concurrent):
+                    email_queue.put((math.inf, number, _DONE))
+
+        def llm_stage():
+            try:
+                while True:
+                    _, index, email = email_queue.get()
+                    if email is _DONE:
+                        break
+                    try:
+                        result = self.llm_processor.process_email(email, index)
+                    except Exception:
+                        logging.info(f"Fatal error in processing email {index}")
+                        logging.exception("Full traceback in processing error")
+                        continue
+                    if result:
+                        result_queue.put(self.llm_processor.expand_groups([result], groups, numbers))
+            finally:
+                result_queue.put(_DONE)
+
+        threads = [threading.Thread(target=fetch_stage, daemon=True),
+                   threading.Thread(target=parse_stage, daemon=True)]
+        threads += [threading.Thread(target=llm_stage, daemon=True) for _ in range(self.max_concurrent)]
+        for thread in threads:
+            thread.start()
+
+        # Result writing stage runs on the calling thread
+        results = []
+        finished_workers = 0
+        while finished_workers < self.max_concurrent:
+            expanded = result_queue.get()
+            if expanded is _DONE:
+                finished_workers += 1
+                continue
+            results.extend(expanded)
+            logging.info(f"Completed processing email {expanded[0].number}/{len(message_ids)}")
+            if on_result:
+                on_result(expanded[0])
+
+        for thread in threads:
+            thread.join()
+
+        logging.info(f"Pipeline finished: {len(results)} summaries from {len(emails)} emails")
+        return emails, results
@@ -0,0 +1,74 @@
+"""
+Cheap urgency prior used to order LLM work
+Emails from allowlisted senders, with urgent subject keywords, addressed directly to you or
+marked IMPORTANT by Gmail are summarized first, so urgent mail is scored (and alerted on)
+early in the run instead of whenever its turn comes up.
+"""
+
+import re
+from email.utils import getaddresses
+from Config import Config
+from Deduplicator import sender_address
+
+URGENT_SUBJECT = re.compile(
+    r'\burgent\b|\basap\b|\bimmediately\b|action required|respond by|\bdeadline\b|\boverdue\b|\btoday\b|'
+    r'\beod\b|security alert|suspicious|password|payment (failed|declined)|final notice|interview|offer letter',
+    re.IGNORECASE)
+
+# Gmail label -> weight
+LABEL_WEIGHTS = {
+    'IMPORTANT': 2,
+    'STARRED': 1,
+    'CATEGORY_PROMOTIONS': -2,
+    'CATEGORY_SOCIAL': -1,
+    'CATEGORY_FORUMS': -1,
+}
+
+ALLOWLIST_WEIGHT = 3
+SUBJECT_WEIGHT = 2
+DIRECT_WEIGHT = 1
+CC_WEIGHT = -1
+BULK_HEADER_WEIGHT = -2
+
+
+class UrgencyPrior:
+    """
+    Args:
+        senders: addresses or domains ('@example.com' or 'example.com') whose mail goes first
+        my_addresses: your own addresses, to tell mail sent to you from mail you are copied on;
+                      when empty, a To list of at most direct_max_recipients counts as direct
+    """
+
+    def __init__(self, senders=Config.PRIORITY_SENDERS, my_addresses=Config.PRIORITY_MY_ADDRESSES,
+                 direct_max_recipients=Config.PRIORITY_DIRECT_MAX_RECIPIENTS):
+        self.senders = {s.lower().lstrip('@') for s in senders}
+        self.my_addresses = {a.lower() for a in my_addresses}
+        self.direct_max_recipients = direct_max_recipients
+
+    def is_allowlisted(self, sender):
+        address = sender_address(sender)
+        return address in self.senders or address.partition('@')[2] in self.senders
+
+    def recipient_weight(self, email):
+        to = {address.lower() for _, address in getaddresses([email.headers.get('to', '')]) if address}
+        cc = {address.lower() for _, address in getaddresses([email.headers.get('cc', '')]) if address}
+        if self.my_addresses:
+            if to & self.my_addresses:
+                return DIRECT_WEIGHT
+            return CC_WEIGHT if cc & self.my_addresses else 0
+        return DIRECT_WEIGHT if 0 < len(to) <= self.direct_max_recipients else 0
+
+    def score(self, email):
+        """Summed weight of the urgency signals; higher is summarized sooner, 0 is neutral"""
+        weight = ALLOWLIST_WEIGHT if self.senders and self.is_allowlisted(email.sender) else 0
+        if URGENT_SUBJECT.search(email.subject or ''):
+            weight += SUBJECT_WEIGHT
+        weight += sum(LABEL_WEIGHTS.get(label, 0) for label in email.label_ids)
+        weight += self.recipient_weight(email)
+        if email.headers.get('list-unsubscribe') or email.headers.get('precedence'):
+            weight += BULK_HEADER_WEIGHT
+        return weight
+
+    def order(self, indexed_emails):
+        """(index, email) pairs sorted by descending prior; ties keep their fetch order"""
+        return sorted(indexed_emails, key=lambda item: -self.score(item[1]))
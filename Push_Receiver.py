@@ -0,0 +1,154 @@
+"""
+Gmail push notifications (users().watch) delivered through a Cloud Pub/Sub push subscription
+A small local HTTP endpoint receives each notification, and bursts are debounced into one
+incremental fetch, so new mail is scored within seconds without polling an idle inbox.
+"""
+
+import base64
+import json
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from Config import Config
+
+
+def decode_notification(body):
+    """
+    Decodes a Pub/Sub push request body into the Gmail notification it carries:
+    {"emailAddress": ..., "historyId": ...}. Returns None for malformed payloads.
+    """
+    try:
+        envelope = json.loads(body)
+        data = base64.b64decode(envelope['message']['data'])
+        notification = json.loads(data)
+        notification['historyId'] = int(notification['historyId'])
+        return notification
+    except (ValueError, KeyError, TypeError) as e:
+        logging.info(f"Ignoring malformed push notification: {e}")
+        return None
+
+
+class NotificationDebouncer:
+    """
+    Collapses a burst of notifications into a single callback.
+
+    The first notification starts a timer of delay_seconds; notifications arriving before it fires
+    are absorbed, so a burst costs one fetch and the delay is bounded. Notifications that arrive
+    while the callback is running trigger exactly one more callback once it returns.
+    """
+
+    def __init__(self, callback, delay_seconds=Config.PUSH_DEBOUNCE_SECONDS):
+        self.callback = callback
+        self.delay_seconds = delay_seconds
+        self.latest_history_id = None
+        self.notifications = 0
+        self.triggers = 0
+        self._timer = None
+        self._running = False
+        self._rerun = False
+        self._lock = threading.Lock()
+
+    def notify(self, history_id=None):
+        with self._lock:
+            self.notifications += 1
+            if history_id is not None:
+                self.latest_history_id = max(history_id, self.latest_history_id or 0)
+            if self._running:
+                self._rerun = True
+            elif self._timer is None:
+                self._timer = threading.Timer(self.delay_seconds, self._fire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            self._running = True
+
+        while True:
+            with self._lock:
+                self.triggers += 1
+                history_id = self.latest_history_id
+            try:
+                self.callback(history_id)
+            except Exception:
+                logging.info(f"Error in push-triggered run")
+                logging.exception("Full traceback in push-triggered run")
+
+            with self._lock:
+                if not self._rerun:
+                    self._running = False
+                    return
+                self._rerun = False
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+class PushReceiver:
+    """
+    Local HTTP endpoint for the Pub/Sub push subscription.
+
+    Args:
+        debouncer: NotificationDebouncer fed with every valid notification
+        port: port to listen on (0 picks a free one; see .port)
+        verification_token: when set, requests must carry ?token=<verification_token>
+    """
+
+    def __init__(self, debouncer, host=Config.PUSH_HOST, port=Config.PUSH_PORT,
+                 verification_token=Config.PUSH_VERIFICATION_TOKEN):
+        self.debouncer = debouncer
+        self.verification_token = verification_token
+        self.received = 0
+        self.rejected = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                token = parse_qs(urlparse(self.path).query).get('token', [None])[0]
+
+                if receiver.verification_token and token != receiver.verification_token:
+                    receiver.rejected += 1
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+
+                notification = decode_notification(body)
+                if notification is not None:
+                    receiver.received += 1
+                    logging.debug(f"Push notification for {notification.get('emailAddress')} "
+                                  f"at history ID {notification['historyId']}")
+                    receiver.debouncer.notify(notification['historyId'])
+
+                # Acknowledge malformed messages too, otherwise Pub/Sub redelivers them forever
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logging.debug(f"Push receiver: {format % args}")
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Push receiver listening on port {self.port}")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.debouncer.cancel()
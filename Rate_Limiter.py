@@ -0,0 +1,199 @@
+"""
+Client-side rate limiting and retry scheduling for Groq calls
+Token buckets for requests/min and tokens/min (sized and synced from the x-ratelimit-* response headers),
+jittered exponential backoff, and AIMD concurrency that rises on success and halves on throttling.
+"""
+
+import random
+import re
+import threading
+import time
+import logging
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError'}
+
+
+def parse_reset_duration(value):
+    """Parses Groq reset headers such as '7.66s', '2m59.56s' or '120ms' into seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    seconds = 0.0
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        seconds += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return seconds
+
+
+def is_retryable(exc):
+    """Throttling, server errors and connection problems are worth retrying; bad requests are not"""
+    return (getattr(exc, 'status_code', None) in RETRYABLE_STATUS_CODES
+            or type(exc).__name__ in RETRYABLE_ERROR_NAMES)
+
+
+def is_throttled(exc):
+    return getattr(exc, 'status_code', None) == 429
+
+
+def retry_after_seconds(exc):
+    """Reads retry-after from an API error's response headers, if there is one"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    return parse_reset_duration(headers.get('retry-after'))
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Refills continuously at capacity per minute. acquire() blocks until enough budget is available.
+    """
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.available = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+    def set_capacity(self, capacity_per_minute):
+        """Resizes the bucket to the limit the server reports; budget already spent stays spent"""
+        capacity = float(capacity_per_minute)
+        if capacity <= 0:
+            return
+        with self.lock:
+            if capacity == self.capacity:
+                return
+            self._refill(time.monotonic())
+            logging.info(f"Provider limit {self.capacity:g} -> {capacity:g} per minute")
+            self.capacity = capacity
+            self.available = min(self.available, capacity)
+            self.rate = capacity / 60.0
+
+    def sync(self, remaining, reset_seconds=None):
+        """Aligns the bucket with what the server reports as remaining"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.available = min(self.available, float(remaining))
+            # Spread the refill over the window the server reports instead of the nominal minute. Worked
+            # out afresh from every header, so a fast refill near a reset doesn't outlive that window.
+            nominal = self.capacity / 60.0
+            if reset_seconds:
+                self.rate = max(nominal, (self.capacity - self.available) / reset_seconds)
+            else:
+                self.rate = nominal
+
+
+class RateLimiter:
+    """
+    Gates calls on both a requests/min and a tokens/min bucket, and pauses everyone after a 429.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens):
+        with self.lock:
+            wait = self.paused_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+    def pause(self, seconds):
+        """Stops every caller from sending until the server's retry window has passed"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers):
+        """
+        Updates both buckets from x-ratelimit-* response headers when the provider sends them.
+        The limit-* headers replace the configured per-minute capacities, which are only the starting point.
+        """
+        if not headers:
+            return
+        for name, bucket in (('x-ratelimit-limit-requests', self.requests), ('x-ratelimit-limit-tokens', self.tokens)):
+            limit = headers.get(name)
+            if limit is not None:
+                try:
+                    bucket.set_capacity(limit)
+                except ValueError:
+                    logging.debug(f"Ignoring unparseable {name} header: {limit!r}")
+        remaining_requests = headers.get('x-ratelimit-remaining-requests')
+        if remaining_requests is not None:
+            self.requests.sync(remaining_requests, parse_reset_duration(headers.get('x-ratelimit-reset-requests')))
+        remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+        if remaining_tokens is not None:
+            self.tokens.sync(remaining_tokens, parse_reset_duration(headers.get('x-ratelimit-reset-tokens')))
+
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight calls.
+    The limit grows by one after `increase_after` consecutive successes and halves on throttling.
+    Slots are handed out in arrival order, so work submitted first (the most urgent email) is
+    not overtaken by a worker that has just released a slot and asks again.
+    """
+
+    def __init__(self, initial, maximum, minimum=1, increase_after=5):
+        self.limit = initial
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self.successes = 0
+        self.next_ticket = 0
+        self.serving = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while ticket != self.serving or self.in_flight >= self.limit:
+                self.condition.wait()
+            self.serving += 1
+            self.in_flight += 1
+            self.condition.notify_all()  # The next ticket may fit as well
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.successes = 0
+                new_limit = max(self.minimum, self.limit // 2)
+                if new_limit != self.limit:
+                    logging.info(f"Throttled by provider, concurrency {self.limit} -> {new_limit}")
+                self.limit = new_limit
+            else:
+                self.successes += 1
+                if self.successes >= self.increase_after and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
@@ -0,0 +1,176 @@
+"""
+Append-only SQLite store for email summaries
+Replaces writing a new email_summaries_<timestamp>.csv on every run; indexed on processed_at,
+importance_score and sender so historical questions don't need every file loaded.
+"""
+
+import csv
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+from Config import Config
+from Metrics import metrics
+
+COLUMNS = ['message_id', 'processed_at', 'importance_score', 'importance_level', 'sender',
+           'original_subject', 'summary', 'reason', 'link', 'tokens_saved', 'source', 'triage_verdict', 'signals',
+           'group_id', 'group_size', 'model']
+
+# Columns added after the first release, with their SQL types, for upgrading older databases
+ADDED_COLUMNS = {'source': 'TEXT', 'triage_verdict': 'TEXT', 'signals': 'TEXT', 'group_id': 'TEXT',
+                 'group_size': 'INTEGER', 'model': 'TEXT'}
+
+
+class ResultsStore:
+    """
+    Buffered writer and query API over the results database.
+
+    Args:
+        db_file: path to the SQLite database
+        batch_size: buffered results are written in one transaction once this many are pending
+    """
+
+    def __init__(self, db_file=Config.RESULTS_DB, batch_size=Config.RESULTS_WRITE_BATCH):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT,
+                processed_at TEXT NOT NULL,
+                importance_score INTEGER,
+                importance_level TEXT,
+                sender TEXT,
+                original_subject TEXT,
+                summary TEXT,
+                reason TEXT,
+                link TEXT,
+                tokens_saved INTEGER,
+                source TEXT,
+                triage_verdict TEXT,
+                signals TEXT,
+                group_id TEXT,
+                group_size INTEGER,
+                model TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_processed_at ON results (processed_at);
+            CREATE INDEX IF NOT EXISTS idx_results_score ON results (importance_score, processed_at);
+            CREATE INDEX IF NOT EXISTS idx_results_sender ON results (sender, processed_at);
+            CREATE INDEX IF NOT EXISTS idx_results_message_id ON results (message_id);
+        """)
+        existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(results)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+    def add(self, result):
+        """Buffers one SummaryResult, flushing when the batch is full"""
+        with self._lock:
+            self._buffer.append(tuple(getattr(result, column) for column in COLUMNS))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_many(self, results):
+        for result in results:
+            self.add(result)
+
+    def flush(self):
+        """Writes every buffered result in a single transaction"""
+        with self._lock:
+            if not self._buffer:
+                return 0
+            rows, self._buffer = self._buffer, []
+            with metrics.span('store_write'), self._conn:
+                self._conn.executemany(
+                    f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+                )
+        logging.debug(f"Wrote {len(rows)} results to {self.db_file}")
+        return len(rows)
+
+    def existing_message_ids(self, message_ids):
+        """The subset of message_ids that already have a stored result"""
+        message_ids = list(message_ids)
+        found = set()
+        with self._lock:
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT DISTINCT message_id FROM results WHERE message_id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(row['message_id'] for row in rows)
+        return found
+
+    def top_important(self, limit=10, since_hours=24, min_score=8):
+        """Highest-scoring results processed in the last since_hours hours"""
+        since = (datetime.now() - timedelta(hours=since_hours)).isoformat()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM results WHERE processed_at >= ? AND importance_score >= ? "
+                "ORDER BY importance_score DESC, processed_at DESC LIMIT ?",
+                (since, min_score, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def by_sender(self, sender, limit=50):
+        """Most recent results from one sender"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM results WHERE sender = ? ORDER BY processed_at DESC LIMIT ?", (sender, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def triage_report(self, since_hours=24 * 7, low_score_max=4):
+        """
+        How much mail local triage scored without the LLM, and how often the LLM agreed on the
+        audited sample of triage-skippable mail (agreement = LLM score of low_score_max or less)
+        """
+        since = (datetime.now() - timedelta(hours=since_hours)).isoformat()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS total, "
+                "SUM(source = 'triage') AS skipped, "
+                "SUM(source = 'llm' AND triage_verdict = 'bulk') AS audited, "
+                "SUM(source = 'llm' AND triage_verdict = 'bulk' AND importance_score <= ?) AS agreed, "
+                "SUM(source = 'llm' AND triage_verdict = 'bulk' AND importance_score >= 8) AS missed_important "
+                "FROM results WHERE processed_at >= ?", (low_score_max, since)
+            ).fetchone()
+        report = {key: row[key] or 0 for key in ('total', 'skipped', 'audited', 'agreed', 'missed_important')}
+        report['skip_rate'] = report['skipped'] / report['total'] if report['total'] else 0.0
+        report['agreement'] = report['agreed'] / report['audited'] if report['audited'] else None
+        return report
+
+    def training_rows(self, limit=20000):
+        """(signals, importance_score) for LLM-scored results, newest first, for training the triage model"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT signals, importance_score FROM results WHERE source = 'llm' AND signals IS NOT NULL "
+                "ORDER BY processed_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row['signals'], row['importance_score']) for row in rows]
+
+    def export_csv(self, csv_filename, since_hours=24):
+        """Writes results from the last since_hours hours to a CSV, members of a group next to each other"""
+        since = (datetime.now() - timedelta(hours=since_hours)).isoformat()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM results WHERE processed_at >= ? "
+                "ORDER BY importance_score DESC, group_id, processed_at", (since,)
+            ).fetchall()
+        with open(csv_filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,99 @@
+"""
+Deadline scheduler for the monitoring loop
+Replaces schedule.run_pending() polled every 60 seconds: the loop sleeps until the exact next
+deadline, deadlines advance from the previous deadline rather than from "now" so they don't drift,
+and an optional adaptive interval shortens on busy inboxes and lengthens on idle ones.
+"""
+
+import time
+import threading
+import logging
+from Config import Config
+
+OVERRUN_SKIP = 'skip'
+OVERRUN_COALESCE = 'coalesce'
+
+
+class AdaptiveInterval:
+    """
+    Interval that halves (down to min_seconds) after a run that found at least busy_threshold
+    emails and grows by idle_factor (up to max_seconds) after a run that found none.
+    """
+
+    def __init__(self, initial_seconds, min_seconds, max_seconds,
+                 busy_threshold=Config.ADAPTIVE_BUSY_THRESHOLD, idle_factor=Config.ADAPTIVE_IDLE_FACTOR):
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.busy_threshold = busy_threshold
+        self.idle_factor = idle_factor
+        self.seconds = min(max(initial_seconds, min_seconds), max_seconds)
+
+    def observe(self, email_count):
+        if email_count is None:
+            return self.seconds
+        if email_count >= self.busy_threshold:
+            self.seconds = max(self.min_seconds, self.seconds / 2)
+        elif email_count == 0:
+            self.seconds = min(self.max_seconds, self.seconds * self.idle_factor)
+        return self.seconds
+
+
+class DeadlineScheduler:
+    """
+    Runs job at fixed deadlines on a monotonic clock.
+
+    Args:
+        job: callable run at each deadline; may return the number of new emails it found,
+             which drives the adaptive interval
+        interval_seconds: time between deadlines
+        adaptive: an AdaptiveInterval, or None for a fixed interval
+        overrun_policy: what to do when a run finishes after one or more later deadlines have passed.
+                        'skip' drops the missed deadlines and waits for the next one on the original grid;
+                        'coalesce' runs once immediately for all of them, then continues from now
+    """
+
+    def __init__(self, job, interval_seconds, adaptive=None, overrun_policy=Config.SCHEDULER_OVERRUN_POLICY):
+        if overrun_policy not in (OVERRUN_SKIP, OVERRUN_COALESCE):
+            raise ValueError(f"Unknown overrun policy: {overrun_policy}")
+        self.job = job
+        self.interval_seconds = interval_seconds
+        self.adaptive = adaptive
+        self.overrun_policy = overrun_policy
+        self.skipped_runs = 0
+        self.coalesced_runs = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self, run_immediately=True):
+        """Blocks until stop() is called (or KeyboardInterrupt)"""
+        deadline = time.monotonic() if run_immediately else time.monotonic() + self.interval_seconds
+
+        while not self._stop.is_set():
+            delay = deadline - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+
+            email_count = self.job()
+            if self.adaptive is not None:
+                self.interval_seconds = self.adaptive.observe(email_count)
+
+            deadline = self.next_deadline(deadline, time.monotonic())
+            logging.debug(f"Next run in {max(0, deadline - time.monotonic()):.1f} seconds")
+
+    def next_deadline(self, deadline, now):
+        """Advances from the last deadline (not from now) so slow runs don't push the schedule back"""
+        deadline += self.interval_seconds
+        if deadline >= now:
+            return deadline
+
+        missed = int((now - deadline) // self.interval_seconds) + 1
+        if self.overrun_policy == OVERRUN_SKIP:
+            self.skipped_runs += missed
+            logging.info(f"Run overran its interval, skipping {missed} missed run(s)")
+            return deadline + missed * self.interval_seconds
+
+        self.coalesced_runs += missed - 1
+        logging.info(f"Run overran its interval, coalescing {missed} missed run(s) into one")
+        return now
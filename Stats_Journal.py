@@ -0,0 +1,224 @@
+"""
+Append-only run journal behind the automation statistics
+Every run is one JSON line appended (and fsynced) to Config.STATS_JOURNAL_FILE under a file lock,
+so a crash can at worst lose the line being written and several processes can share the journal.
+Totals are kept in a small counters snapshot (Config.STATS_FILE) that is brought up to date from
+the journal incrementally, so reading them costs the same however long the history grows.
+"""
+
+import collections
+import json
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from Config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialized
+    fcntl = None
+
+COUNTER_FIELDS = ('total_runs', 'total_emails_processed', 'high_importance_emails', 'total_processing_time')
+
+
+def run_record(timestamp, emails_processed, high_importance_count, processing_time):
+    return {'timestamp': timestamp, 'emails_processed': emails_processed,
+            'high_importance_count': high_importance_count, 'processing_time': processing_time}
+
+
+class RunJournal:
+    """
+    Args:
+        journal_file: JSONL file with one run (or, after compaction, one daily rollup) per line
+        counters_file: JSON snapshot of the totals and the journal offset they cover
+        recent_runs: runs kept in the snapshot for print_stats
+    """
+
+    def __init__(self, journal_file=Config.STATS_JOURNAL_FILE, counters_file=Config.STATS_FILE,
+                 recent_runs=Config.STATS_RECENT_RUNS):
+        self.journal_file = journal_file
+        self.counters_file = counters_file
+        self.recent_runs = recent_runs
+        self._lock = threading.Lock()
+        self.migrate_legacy_stats()
+
+    @contextmanager
+    def locked(self):
+        """Exclusive across threads, and across processes where fcntl is available"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.journal_file}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def empty_snapshot(self):
+        return {**dict.fromkeys(COUNTER_FIELDS, 0), 'journal_offset': 0, 'recent_runs': []}
+
+    def load_snapshot(self):
+        if os.path.exists(self.counters_file):
+            try:
+                with open(self.counters_file, 'r') as f:
+                    snapshot = json.load(f)
+                if 'journal_offset' in snapshot:
+                    return snapshot
+            except (IOError, ValueError):
+                logging.info(f"Rebuilding unreadable stats snapshot {self.counters_file}")
+        return self.empty_snapshot()
+
+    def save_snapshot(self, snapshot):
+        """Written to a temporary file and renamed so readers never see a partial snapshot"""
+        try:
+            tmp_file = f"{self.counters_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_file, self.counters_file)
+        except IOError:
+            logging.info(f"Error saving stats file")
+            logging.exception("An error occurred while saving the stats file.")
+
+    def read_records(self, offset=0):
+        """Yields (record, end offset) for each complete line from offset on; a torn final line is left alone"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                offset += len(line)
+                try:
+                    yield json.loads(line), offset
+                except ValueError:
+                    logging.info(f"Skipping unreadable line in {self.journal_file}")
+
+    def catch_up(self, snapshot):
+        """Folds journal lines written after the snapshot's offset into its counters"""
+        recent = collections.deque(snapshot['recent_runs'], maxlen=self.recent_runs)
+        for record, offset in self.read_records(snapshot['journal_offset']):
+            snapshot['total_runs'] += record.get('runs', 1)
+            snapshot['total_emails_processed'] += record['emails_processed']
+            snapshot['high_importance_emails'] += record['high_importance_count']
+            snapshot['total_processing_time'] += record['processing_time']
+            snapshot['journal_offset'] = offset
+            if 'runs' not in record:
+                recent.append(record)
+        snapshot['recent_runs'] = list(recent)
+        return snapshot
+
+    def record(self, timestamp, emails_processed, high_importance_count, processing_time):
+        """Appends one run to the journal, then updates the counters snapshot"""
+        line = json.dumps(run_record(timestamp, emails_processed, high_importance_count, processing_time)) + "\n"
+        with self.locked():
+            with open(self.journal_file, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.save_snapshot(self.catch_up(self.load_snapshot()))
+        logging.info(f"Successfully saved stats to {self.journal_file}")
+
+    def counters(self):
+        """
+        Totals, average processing time and the most recent runs. Reads the snapshot plus any
+        lines appended since it was written (normally none), so the cost does not grow with history.
+        """
+        with self.locked():
+            snapshot = self.catch_up(self.load_snapshot())
+        runs = snapshot['total_runs']
+        snapshot['average_processing_time'] = snapshot['total_processing_time'] / runs if runs else 0
+        return snapshot
+
+    def window(self, since=None, until=None):
+        """
+        Aggregates the runs between two datetimes (either end open) by streaming the journal.
+        Compacted history counts by day: a rollup is included when its day starts inside the window.
+        """
+        totals = {**dict.fromkeys(COUNTER_FIELDS, 0), 'since': since and since.isoformat(),
+                  'until': until and until.isoformat()}
+        for record, _ in self.read_records():
+            timestamp = datetime.fromisoformat(record.get('day') or record['timestamp'])
+            if (since and timestamp < since) or (until and timestamp >= until):
+                continue
+            totals['total_runs'] += record.get('runs', 1)
+            totals['total_emails_processed'] += record['emails_processed']
+            totals['high_importance_emails'] += record['high_importance_count']
+            totals['total_processing_time'] += record['processing_time']
+        runs = totals['total_runs']
+        totals['average_processing_time'] = totals['total_processing_time'] / runs if runs else 0
+        return totals
+
+    def compact(self, older_than_days=Config.STATS_COMPACT_AFTER_DAYS):
+        """
+        Replaces runs older than older_than_days with one rollup line per day, keeping the totals
+        and day-level window queries intact. Returns the number of lines removed.
+        """
+        cutoff_day = (datetime.now() - timedelta(days=older_than_days)).date().isoformat()
+        with self.locked():
+            snapshot = self.catch_up(self.load_snapshot())
+            rollups = {}
+            kept = []
+            lines_before = 0
+            for record, _ in self.read_records():
+                lines_before += 1
+                day = record.get('day') or record['timestamp'][:10]
+                if 'runs' not in record and day >= cutoff_day:
+                    kept.append(record)
+                    continue
+                rollup = rollups.setdefault(day, {'day': day, 'runs': 0, 'emails_processed': 0,
+                                                  'high_importance_count': 0, 'processing_time': 0})
+                rollup['runs'] += record.get('runs', 1)
+                rollup['emails_processed'] += record['emails_processed']
+                rollup['high_importance_count'] += record['high_importance_count']
+                rollup['processing_time'] += record['processing_time']
+
+            records = [rollups[day] for day in sorted(rollups)] + kept
+            tmp_file = f"{self.journal_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.journal_file)
+            snapshot['journal_offset'] = os.path.getsize(self.journal_file)
+            self.save_snapshot(snapshot)
+        logging.info(f"Compacted stats journal from {lines_before} to {len(records)} lines")
+        return lines_before - len(records)
+
+    def migrate_legacy_stats(self):
+        """
+        Converts an Automation_Stats.json written before the journal existed: its runs_history goes
+        into the journal and its totals (which cover runs the history had dropped) are kept as they are
+        """
+        if not os.path.exists(self.counters_file) or os.path.exists(self.journal_file):
+            return
+        try:
+            with open(self.counters_file, 'r') as f:
+                legacy = json.load(f)
+        except (IOError, ValueError):
+            return
+        if 'journal_offset' in legacy:
+            return
+
+        with self.locked():
+            history = legacy.get('runs_history', [])
+            with open(self.journal_file, 'a') as f:
+                for run in history:
+                    f.write(json.dumps(run_record(run['timestamp'], run['emails_processed'],
+                                                  run['high_importance_count'], run['processing_time'])) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            snapshot = self.empty_snapshot()
+            snapshot['total_runs'] = legacy.get('total_runs', 0)
+            snapshot['total_emails_processed'] = legacy.get('total_emails_processed', 0)
+            snapshot['high_importance_emails'] = legacy.get('high_importance_emails', 0)
+            snapshot['total_processing_time'] = legacy.get('average_processing_time', 0) * snapshot['total_runs']
+            snapshot['journal_offset'] = os.path.getsize(self.journal_file)
+            snapshot['recent_runs'] = history[-self.recent_runs:]
+            self.save_snapshot(snapshot)
+        logging.info(f"Moved {len(history)} runs from {self.counters_file} into {self.journal_file}")
@@ -0,0 +1,200 @@
+"""
+Structured LLM responses
+Completions are parsed (bare JSON, or JSON inside prose or a code fence) and checked against a
+compiled schema that coerces them into the shape the rest of the pipeline relies on: an integer
+importance_score from 1 to 10, a level consistent with it, and non-empty text. OutputTokenBudget
+sizes max_tokens from the completions actually seen instead of a fixed allowance.
+"""
+
+import collections
+import json
+import math
+import re
+import threading
+from Config import Config
+
+CODE_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$', re.IGNORECASE)
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+PERCENT_SCALE = re.compile(r'%|/\s*100\b')
+
+LEVELS = ('low', 'medium', 'high')
+
+SUMMARY_SCHEMA = {
+    'summary': {'type': 'text', 'required': True, 'max_chars': 600},
+    'importance_score': {'type': 'score', 'required': True},
+    'importance_level': {'type': 'enum', 'values': LEVELS},
+    'reason': {'type': 'text', 'max_chars': 600},
+    'confidence': {'type': 'number', 'minimum': 0.0, 'maximum': 1.0},
+}
+
+
+class SchemaError(ValueError):
+    """A response that can't be used, with every problem found in it"""
+
+    def __init__(self, problems):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+def level_for(score):
+    return 'high' if score >= 8 else 'medium' if score >= 5 else 'low'
+
+
+def coerce_score(value):
+    """
+    Integer 1-10 from 8, 8.4, '8' or '8/10'; '85%' and '85/100' are rescaled to 9. Returns (score, changed).
+    Raises ValueError if there is no finite number or it is outside 1-10, so a bare 85 goes to a repair
+    request instead of being clamped to 10.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"not a number: {value!r}")
+    match = NUMBER.search(value) if isinstance(value, str) else None
+    if isinstance(value, str) and not match:
+        raise ValueError(f"not a number: {value!r}")
+    number = float(match.group()) if match else float(value)
+    if not math.isfinite(number):  # JSON allows Infinity and NaN, which int() can't take
+        raise ValueError(f"not a finite number: {value!r}")
+    if match and PERCENT_SCALE.search(value[match.end():]):
+        number /= 10
+    score = int(number + 0.5)  # Half up, so 85% is 9
+    if not 1 <= score <= 10:
+        raise ValueError(f"out of range 1-10: {value!r}")
+    return score, score != value
+
+
+def parse_json(text):
+    """
+    The JSON object in a completion. Returns (object, extracted) where extracted is True when it
+    had to be cut out of surrounding prose or a code fence; raises ValueError when there is none.
+    """
+    text = (text or '').strip()
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    text = CODE_FENCE.sub('', text)
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object in response")
+    return json.loads(text[start:end]), True
+
+
+class CompiledSchema:
+    """
+    A field schema turned into one checker per field once, up front. validate() returns a cleaned copy
+    of the response, or raises SchemaError listing every missing or unusable required field.
+    Unusable optional fields are dropped; importance_level is made consistent with the score.
+    """
+
+    def __init__(self, schema):
+        self.checks = [(field, spec.get('required', False), self.compile_field(spec)) for field, spec in schema.items()]
+
+    @staticmethod
+    def compile_field(spec):
+        """Returns a function value -> (cleaned value, changed) that raises ValueError when the value can't be used"""
+        kind = spec['type']
+        if kind == 'score':
+            return coerce_score
+        if kind == 'text':
+            max_chars = spec.get('max_chars')
+
+            def check_text(value):
+                if isinstance(value, (dict, list)):
+                    raise ValueError("expected a string")
+                text = str(value).strip()
+                if not text:
+                    raise ValueError("empty")
+                if max_chars and len(text) > max_chars:
+                    text = text[:max_chars - 3] + "..."
+                return text, text != value
+            return check_text
+        if kind == 'enum':
+            values = spec['values']
+
+            def check_enum(value):
+                cleaned = str(value).strip().lower()
+                if cleaned not in values:
+                    raise ValueError(f"expected one of {', '.join(values)}")
+                return cleaned, cleaned != value
+            return check_enum
+        if kind == 'number':
+            minimum, maximum = spec.get('minimum'), spec.get('maximum')
+
+            def check_number(value):
+                if isinstance(value, bool):
+                    raise ValueError("expected a number")
+                number = float(value)
+                if not math.isfinite(number):
+                    raise ValueError("expected a finite number")
+                clamped = min(maximum, max(minimum, number))
+                return clamped, clamped != value
+            return check_number
+        raise ValueError(f"Unknown schema type {kind!r}")
+
+    def validate(self, response):
+        """Returns (cleaned response, names of the fields that had to be coerced)"""
+        if not isinstance(response, dict):
+            raise SchemaError(["expected a JSON object"])
+        cleaned = dict(response)
+        problems = []
+        coerced = []
+        for field, required, check in self.checks:
+            value = response.get(field)
+            try:
+                if value is None or value == '':
+                    raise ValueError("missing")
+                cleaned[field], changed = check(value)
+                if changed:
+                    coerced.append(field)
+            except (TypeError, ValueError, OverflowError) as e:  # OverflowError: integers too big for a float
+                if required:
+                    problems.append(f"{field}: {e}")
+                cleaned.pop(field, None)
+        if problems:
+            raise SchemaError(problems)
+
+        if 'importance_score' in cleaned:
+            level = level_for(cleaned['importance_score'])
+            if cleaned.get('importance_level') != level:
+                if 'importance_level' in response and 'importance_level' not in coerced:
+                    coerced.append('importance_level')
+                cleaned['importance_level'] = level
+        cleaned.setdefault('reason', '')
+        return cleaned, coerced
+
+
+SUMMARY_VALIDATOR = CompiledSchema(SUMMARY_SCHEMA)
+
+
+class OutputTokenBudget:
+    """
+    max_tokens for one kind of prompt: the p99 of recent completion sizes times headroom, kept
+    between minimum and maximum. Until enough completions have been seen, initial is used.
+    A truncated completion raises the lower bound so the same prompt isn't cut off again.
+    """
+
+    def __init__(self, initial=Config.LLM_OUTPUT_TOKENS_INITIAL, minimum=Config.LLM_OUTPUT_TOKENS_MIN,
+                 maximum=Config.LLM_OUTPUT_TOKENS_MAX, headroom=Config.LLM_OUTPUT_TOKENS_HEADROOM,
+                 samples=200, min_samples=20):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.recent = collections.deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def max_tokens(self):
+        with self._lock:
+            if len(self.recent) < self.min_samples:
+                return max(self.minimum, min(self.maximum, self.initial))
+            ordered = sorted(self.recent)
+            p99 = ordered[int(0.99 * (len(ordered) - 1))]
+        return max(self.minimum, min(self.maximum, int(p99 * self.headroom) + 1))
+
+    def observe(self, completion_tokens, truncated=False):
+        with self._lock:
+            if truncated:
+                self.minimum = min(self.maximum, max(self.minimum, int(completion_tokens * 1.5)))
+            elif completion_tokens:
+                self.recent.append(completion_tokens)
@@ -0,0 +1,139 @@
+"""
+Persistent SQLite cache of LLM summaries
+Keyed by Gmail message ID plus a hash of everything that influences the completion, so
+re-running over the same mail (crash recovery, retries, the notebook) doesn't pay for it twice.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from Config import Config
+
+
+class SummaryCache:
+    """
+    On-disk summary cache with TTL expiry and least-recently-used eviction.
+
+    Args:
+        db_file: path to the SQLite database
+        ttl_seconds: entries older than this are treated as misses and removed
+        max_entries: once exceeded, the least recently used entries are evicted
+    """
+
+    def __init__(self, db_file=Config.CACHE_FILE, ttl_seconds=Config.CACHE_TTL_SECONDS,
+                 max_entries=Config.CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                message_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (message_id, content_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_summaries_last_access ON summaries (last_access);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def content_hash(sender, subject, body, prompt_template, model):
+        """Hash of every input that changes the completion"""
+        digest = hashlib.sha256()
+        for part in (sender, subject, body, prompt_template, model):
+            digest.update((part or '').encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, message_id, content_hash):
+        """Returns the cached result dictionary, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM summaries WHERE message_id = ? AND content_hash = ?",
+                (message_id, content_hash)
+            ).fetchone()
+
+            if row and now - row[1] <= self.ttl_seconds:
+                self._conn.execute(
+                    "UPDATE summaries SET last_access = ? WHERE message_id = ? AND content_hash = ?",
+                    (now, message_id, content_hash)
+                )
+                self._count('hits')
+                self._conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+
+            if row:
+                # Expired entry
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE message_id = ? AND content_hash = ?",
+                    (message_id, content_hash)
+                )
+            self._count('misses')
+            self._conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, message_id, content_hash, result):
+        """Stores a result and evicts the least recently used entries beyond max_entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                (message_id, content_hash, json.dumps(result), now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE rowid IN "
+                    "(SELECT rowid FROM summaries ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                logging.debug(f"Evicted {count - self.max_entries} summaries from cache")
+            self._conn.commit()
+
+    def purge_expired(self):
+        """Deletes every entry older than the TTL and returns how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        """Hit/miss counters for this process and across every run that used the cache file"""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+        total_hits = counters.get('hits', 0)
+        total_lookups = total_hits + counters.get('misses', 0)
+        return {
+            'entries': entries,
+            'session_hits': self.hits,
+            'session_misses': self.misses,
+            'total_hits': total_hits,
+            'total_misses': counters.get('misses', 0),
+            'hit_rate': total_hits / total_lookups if total_lookups else 0.0,
+        }
+
+    def _count(self, name):
+        self._conn.execute(
+            "INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
@@ -0,0 +1,166 @@
+"""
+Incremental Gmail sync based on mailbox history IDs
+Lists only the messages added since the previous run instead of re-listing is:unread every time
+"""
+
+import json
+import os
+import logging
+from datetime import datetime
+from googleapiclient.errors import HttpError
+from Config import Config
+from Gmail_Handler import GmailHandler
+from Metrics import metrics
+
+
+class IncrementalSync:
+    """
+    Keeps the last-seen Gmail historyId on disk and turns it into the list of new message IDs.
+    Falls back to a full is:unread listing on the first run or when the stored ID has expired.
+
+    IDs a run couldn't take (past max_results) or couldn't finish (see defer) are kept as pending.
+    Each run takes new mail first, then leftovers, then retries, so a pile of failing messages
+    can't hold up new mail; a message is dropped after Config.SYNC_MAX_ATTEMPTS failed runs.
+
+    Args:
+        gmail_handler: used to page through the full listing
+    """
+
+    def __init__(self, state_file=Config.SYNC_STATE_FILE, gmail_handler=None):
+        self.state_file = state_file
+        self.gmail_handler = gmail_handler or GmailHandler()
+        self.state = self.load_state()
+        self._pending_after_commit = []
+        self._attempts_after_commit = {}
+        self._attempts_listed = {}
+
+    def load_state(self):
+        """Load the stored history ID and any message IDs left over from a capped run"""
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        return {'history_id': None, 'pending_ids': [], 'attempts': {}, 'last_sync': None}
+
+    def save_state(self):
+        try:
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f, indent=2)
+        except IOError:
+            logging.info(f"Error saving sync state")
+            logging.exception("An error occurred while saving the sync state file.")
+
+    def list_new_message_ids(self, service, max_results=Config.MAX_EMAILS_PER_RUN):
+        """
+        Returns (message_ids, history_id) where history_id should be passed to commit()
+        once the messages have been processed.
+
+        At most max_results IDs are returned, new ones first; the rest (including everything past
+        max_results in a full listing) are kept as pending for the next run.
+        """
+        history_id = self.state.get('history_id')
+        pending = list(self.state.get('pending_ids', []))
+        attempts = dict(self.state.get('attempts', {}))
+
+        if history_id is None:
+            logging.info("No stored history ID, running full unread listing")
+            new_ids, history_id = self.full_listing(service)
+        else:
+            try:
+                with metrics.span('gmail_history_list'):
+                    new_ids, history_id = self.history_listing(service, history_id)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # IDs already deferred stay queued; the listing may repeat some of them, which the merge drops
+                logging.info(f"History ID {history_id} has expired, falling back to full unread listing")
+                new_ids, history_id = self.full_listing(service)
+
+        # New mail first, then leftovers never tried, then retries of failed messages, without duplicates
+        leftovers = [m for m in pending if m not in attempts]
+        retries = [m for m in pending if m in attempts]
+        message_ids = list(dict.fromkeys(new_ids + leftovers + retries))
+        self._pending_after_commit = message_ids[max_results:]
+        self._attempts_after_commit = {m: attempts[m] for m in self._pending_after_commit if m in attempts}
+        # Listed this run: their earlier attempts count again if defer() is called for them
+        self._attempts_listed = {m: attempts.get(m, 0) for m in message_ids[:max_results]}
+
+        logging.info(f"Incremental sync found {len(message_ids)} new messages "
+                     f"({len(self._pending_after_commit)} deferred to the next run)")
+        return message_ids[:max_results], history_id
+
+    def history_listing(self, service, start_history_id):
+        """Walks users().history().list pages and collects messages added to the inbox while unread"""
+        message_ids = []
+        page_token = None
+        latest_history_id = start_history_id
+
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                labelId='INBOX',
+                pageToken=page_token
+            ).execute()
+
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added['message']
+                    if 'UNREAD' in message.get('labelIds', []):
+                        message_ids.append(message['id'])
+
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        return message_ids, latest_history_id
+
+    def full_listing(self, service):
+        """
+        Lists every unread message from scratch, page by page, and records the mailbox's current
+        history ID. The caller processes the first MAX_EMAILS_PER_RUN and queues the rest.
+        """
+        # Read the history ID before listing so nothing delivered in between is missed
+        with metrics.span('gmail_list'):
+            history_id = service.users().getProfile(userId='me').execute()['historyId']
+
+        message_ids = []
+        for _, page_ids, _ in self.gmail_handler.iter_message_id_pages(service, 'is:unread'):
+            message_ids.extend(page_ids)
+        return message_ids, history_id
+
+    def defer(self, message_ids):
+        """
+        Carry message IDs that could not be fetched or summarized over to the next run, counting
+        the attempt; IDs that have now failed Config.SYNC_MAX_ATTEMPTS times are dropped instead
+        """
+        retry = []
+        for message_id in message_ids:
+            attempts = self._attempts_listed.get(message_id, 0) + 1
+            if attempts >= Config.SYNC_MAX_ATTEMPTS:
+                logging.info(f"Dropping message {message_id} after {attempts} failed attempts")
+                metrics.inc('sync_dropped_ids')
+                continue
+            self._attempts_after_commit[message_id] = attempts
+            retry.append(message_id)
+        self._pending_after_commit = list(dict.fromkeys(self._pending_after_commit + retry))
+
+    def drop(self, message_ids):
+        """Forget message IDs that can never be processed (deleted since they were listed)"""
+        message_ids = set(message_ids)
+        if message_ids:
+            logging.info(f"Dropping {len(message_ids)} messages that no longer exist")
+            metrics.inc('sync_dropped_ids', len(message_ids))
+        self._pending_after_commit = [m for m in self._pending_after_commit if m not in message_ids]
+        for message_id in message_ids:
+            self._attempts_after_commit.pop(message_id, None)
+
+    def commit(self, history_id):
+        """Persist the new history ID once the listed messages have been processed"""
+        self.state['history_id'] = history_id
+        pending = set(self._pending_after_commit)
+        self.state['pending_ids'] = self._pending_after_commit
+        self.state['attempts'] = {m: n for m, n in self._attempts_after_commit.items() if m in pending}
+        self.state['last_sync'] = datetime.now().isoformat()
+        self.save_state()
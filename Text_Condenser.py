@@ -0,0 +1,175 @@
+"""
+Email body condensation before prompting
+Strips quoted reply history, signatures and footer boilerplate, collapses URLs and whitespace,
+then truncates to a per-model token budget instead of a fixed character count.
+"""
+
+import re
+import logging
+from Config import Config
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character heuristic
+    _ENCODING = None
+
+# Reply headers: the quoted history starts here. A forwarded message is the payload and is kept.
+REPLY_HEADER = re.compile(r'^On .{0,200}wrote:\s*$')  # Only a header when quoted ('>') lines follow
+ORIGINAL_MESSAGE = re.compile(r'^-{2,}\s*Original Message\s*-{2,}', re.IGNORECASE)
+FORWARDED_MESSAGE = re.compile(r'^-{2,}\s*Forwarded message\s*-{2,}|^Begin forwarded message:', re.IGNORECASE)
+HEADER_FROM = re.compile(r'^From: .+$')  # Outlook reply block: From: followed by Sent:/Date:
+HEADER_SENT = re.compile(r'^(Sent|Date): .+$')
+HEADER_FORWARD_SUBJECT = re.compile(r'^Subject: *(fwd?|fw) *:', re.IGNORECASE)
+SEPARATOR = re.compile(r'^_{10,}\s*$')  # Outlook puts one above its header block
+HEADER_BLOCK_LINES = 5
+
+SIGNATURE_PATTERNS = [
+    re.compile(r'^--\s*$'),
+    re.compile(r'^Sent from my (iPhone|iPad|Android|mobile device|Galaxy).*$', re.IGNORECASE),
+    re.compile(r'^Get Outlook for (iOS|Android).*$', re.IGNORECASE),
+]
+
+BOILERPLATE_PATTERNS = [
+    re.compile(r'unsubscribe', re.IGNORECASE),
+    re.compile(r'view (this email )?in (your )?browser', re.IGNORECASE),
+    re.compile(r'you (are )?receiv(ed|ing) this (email|message)', re.IGNORECASE),
+    re.compile(r'manage (your )?(email )?preferences', re.IGNORECASE),
+    re.compile(r'privacy policy|terms of (service|use)', re.IGNORECASE),
+    re.compile(r'(©|\(c\)|copyright)\s*\d{4}', re.IGNORECASE),
+    re.compile(r'all rights reserved', re.IGNORECASE),
+]
+
+# Signatures and footers are only looked for near the end of the new text, so a '--' separator or a
+# sentence mentioning "unsubscribe" or a privacy policy in the middle of a message is kept
+SIGNATURE_MAX_LINES = 10
+FOOTER_MAX_LINES = 15
+FOOTER_MAX_CHARS = 300
+
+URL_PATTERN = re.compile(r'(https?://|www\.)([^\s/<>"\')\]]+)[^\s<>"\')\]]*', re.IGNORECASE)
+
+
+def count_tokens(text):
+    """Token count with tiktoken when installed, otherwise about 4 characters per token"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts text to at most max_tokens tokens, marking the cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        return _ENCODING.decode(tokens[:max_tokens]) + "... [truncated]"
+    return text[:max_tokens * 4] + "... [truncated]"
+
+
+def token_budget_for(model):
+    return Config.MODEL_BODY_TOKEN_BUDGETS.get(model, Config.DEFAULT_BODY_TOKEN_BUDGET)
+
+
+def is_reply_header(lines, i):
+    """Whether lines[i] starts quoted reply history (rather than, say, a forwarded message or a rule)"""
+    line = lines[i].strip()
+    following = [l.strip() for l in lines[i + 1:i + 1 + HEADER_BLOCK_LINES] if l.strip()]
+    if REPLY_HEADER.match(line):
+        return bool(following) and following[0].startswith('>')
+    if ORIGINAL_MESSAGE.match(line):
+        return True
+    if HEADER_FROM.match(line):
+        return any(HEADER_SENT.match(l) for l in following[:2]) and \
+            not any(HEADER_FORWARD_SUBJECT.match(l) for l in following)
+    return False
+
+
+def strip_quoted_history(lines):
+    """
+    Drops '>' quoted lines and everything from the first reply header onwards. Forwarded messages
+    are kept, headers included, since they are usually what the email is about.
+    """
+    kept = []
+    forwarded_headers_until = -1
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith('>'):
+            continue
+        if FORWARDED_MESSAGE.match(stripped):
+            forwarded_headers_until = i + HEADER_BLOCK_LINES
+        # A From: block only marks quoted history once the new message has some content
+        elif i > forwarded_headers_until and (kept or not HEADER_FROM.match(stripped)) and is_reply_header(lines, i):
+            while kept and (not kept[-1].strip() or SEPARATOR.match(kept[-1].strip())):
+                kept.pop()
+            break
+        kept.append(line)
+    return kept
+
+
+def strip_signature(lines):
+    """Cuts at the first signature marker within the last SIGNATURE_MAX_LINES lines"""
+    for i in range(max(0, len(lines) - SIGNATURE_MAX_LINES), len(lines)):
+        if any(p.match(lines[i].strip()) for p in SIGNATURE_PATTERNS):
+            return lines[:i]
+    return lines
+
+
+def is_boilerplate(line):
+    return any(p.search(line) for p in BOILERPLATE_PATTERNS)
+
+
+def strip_boilerplate(lines):
+    """
+    Drops the trailing footer block: a paragraph within the last FOOTER_MAX_LINES lines that starts
+    with a boilerplate line and runs to the end, where no line is longer than FOOTER_MAX_CHARS and at
+    least half of the lines are boilerplate
+    """
+    for i in range(max(1, len(lines) - FOOTER_MAX_LINES), len(lines)):
+        if lines[i - 1].strip() or not is_boilerplate(lines[i]):
+            continue
+        block = [line for line in lines[i:] if line.strip()]
+        if all(len(line) <= FOOTER_MAX_CHARS for line in block) and \
+                2 * sum(1 for line in block if is_boilerplate(line)) >= len(block):
+            return lines[:i]
+    return lines
+
+
+def collapse_urls(text):
+    """Replaces full URLs (often long tracking links) with just their domain"""
+    return URL_PATTERN.sub(lambda m: f"[link: {m.group(2).lower()}]", text)
+
+
+def collapse_whitespace(lines):
+    collapsed = []
+    for line in lines:
+        line = ' '.join(line.split())
+        if line or (collapsed and collapsed[-1]):
+            collapsed.append(line)
+    return '\n'.join(collapsed).strip()
+
+
+def condense_body(body, model=Config.GROQ_MODEL):
+    """
+    Condenses an email body for prompting.
+
+    Returns:
+        (condensed_text, original_tokens, condensed_tokens)
+    """
+    original_tokens = count_tokens(body)
+
+    lines = body.splitlines()
+    lines = strip_quoted_history(lines)
+    lines = strip_signature(lines)
+    lines = strip_boilerplate(lines)
+    text = collapse_whitespace(lines)
+    text = collapse_urls(text)
+
+    # Don't hand the model an empty body if everything looked like boilerplate
+    if not text.strip():
+        text = collapse_urls(collapse_whitespace(body.splitlines()))
+
+    text = truncate_to_tokens(text, token_budget_for(model))
+    condensed_tokens = count_tokens(text)
+
+    logging.debug(f"Condensed body from {original_tokens} to {condensed_tokens} tokens")
+    return text, original_tokens, condensed_tokens
@@ -0,0 +1,249 @@
+"""
+Local pre-classifier run before the LLM
+Newsletters, receipts and notifications are recognised from their headers, Gmail category labels,
+sender and subject, and get a deterministic low score with an extractive summary instead of a
+completion. An optional logistic model trained on past LLM scores catches bulk mail the rules miss.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import logging
+from datetime import datetime
+from Config import Config
+from Metrics import metrics
+from Text_Condenser import strip_quoted_history, strip_signature, strip_boilerplate, collapse_whitespace, collapse_urls
+
+VERDICT_BULK = 'bulk'
+VERDICT_LLM = 'llm'
+
+# (header, signal name, value pattern, weight); a header counts when its value matches the pattern
+HEADER_RULES = [
+    ('list-unsubscribe', 'list_unsubscribe', re.compile(r'.'), 2),
+    ('list-id', 'list_id', re.compile(r'.'), 1),
+    ('precedence', 'precedence_bulk', re.compile(r'^\s*(bulk|list|junk)\b', re.IGNORECASE), 2),
+    ('auto-submitted', 'auto_submitted', re.compile(r'^\s*(?!no\b)\S', re.IGNORECASE), 1),
+]
+
+LABEL_RULES = {
+    'CATEGORY_PROMOTIONS': ('label_promotions', 3),
+    'CATEGORY_SOCIAL': ('label_social', 2),
+    'CATEGORY_UPDATES': ('label_updates', 1),
+    'CATEGORY_FORUMS': ('label_forums', 1),
+}
+
+SENDER_RULES = [
+    ('sender_noreply', re.compile(r'\b(no-?reply|do-?not-?reply|donotreply|mailer-daemon)\b', re.IGNORECASE), 1),
+    ('sender_bulk_mailbox', re.compile(r'\b(newsletters?|marketing|promo(tions)?|news|digest|notifications?|updates|offers|deals)@',
+                                       re.IGNORECASE), 1),
+]
+
+SUBJECT_RULES = [
+    ('subject_promotion', re.compile(r'\d+\s*% off|\bsale\b|\bdeals?\b|\bcoupon\b|\bpromo(tion)?\b|free shipping|limited time',
+                                     re.IGNORECASE), 1),
+    ('subject_newsletter', re.compile(r'\bnewsletter\b|\bdigest\b|\bweekly\b|\bmonthly\b|\bwebinar\b', re.IGNORECASE), 1),
+    ('subject_receipt', re.compile(r'\breceipt\b|order (confirmation|#?\d+)|your order|has shipped|out for delivery',
+                                   re.IGNORECASE), 1),
+]
+
+# Mail that always goes to the LLM however bulk it looks
+PROTECTED_SUBJECT = re.compile(
+    r'\burgent\b|security alert|suspicious|password|verify|verification|action required|deadline|overdue|'
+    r'payment (failed|declined)|interview|offer letter|final notice', re.IGNORECASE)
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def sender_domain(sender):
+    match = re.search(r'@([\w.-]+)', sender or '')
+    return match.group(1).lower() if match else ''
+
+
+def in_sample(message_id, rate):
+    """Deterministic sample keyed on the message ID, so reruns pick the same messages"""
+    if not rate or not message_id:
+        return False
+    bucket = int(hashlib.sha1(message_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return bucket < rate
+
+
+def extractive_summary(subject, body, max_chars=200):
+    """First sentences of the body once quoted history, signatures and footers are removed"""
+    lines = strip_boilerplate(strip_signature(strip_quoted_history((body or '').splitlines())))
+    text = collapse_urls(collapse_whitespace(lines)).replace('\n', ' ')
+    summary = ''
+    for sentence in SENTENCE_END.split(text):
+        if summary and len(summary) + len(sentence) + 1 > max_chars:
+            break
+        summary = f"{summary} {sentence}".strip()
+    if not summary:
+        return subject or ''
+    return summary if len(summary) <= max_chars else summary[:max_chars - 3] + "..."
+
+
+class TriageDecision:
+    __slots__ = ('verdict', 'signals', 'rule_weight', 'model_probability', 'audit')
+
+    def __init__(self, verdict, signals, rule_weight, model_probability=None, audit=False):
+        self.verdict = verdict
+        self.signals = signals
+        self.rule_weight = rule_weight
+        self.model_probability = model_probability
+        self.audit = audit  # Bulk mail sent to the LLM anyway to measure agreement
+
+    @property
+    def skip_llm(self):
+        return self.verdict == VERDICT_BULK and not self.audit
+
+
+class Triage:
+    """
+    Args:
+        model_file: JSON weights written by train(); ignored if missing
+        bulk_threshold: summed rule weight at which mail is treated as bulk
+        audit_rate: fraction of bulk mail still sent to the LLM to measure agreement
+    """
+
+    def __init__(self, model_file=Config.TRIAGE_MODEL_FILE, bulk_threshold=Config.TRIAGE_BULK_THRESHOLD,
+                 audit_rate=Config.TRIAGE_AUDIT_RATE):
+        self.model_file = model_file
+        self.bulk_threshold = bulk_threshold
+        self.audit_rate = audit_rate
+        self.bulk_domains = tuple(d.lower() for d in Config.TRIAGE_BULK_DOMAINS)
+        self.protected_senders = tuple(s.lower() for s in Config.TRIAGE_PROTECTED_SENDERS)
+        self.model = self.load_model()
+
+    def load_model(self):
+        if not self.model_file or not os.path.exists(self.model_file):
+            return None
+        try:
+            with open(self.model_file, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            logging.info(f"Ignoring unreadable triage model {self.model_file}")
+            return None
+
+    def signals(self, email):
+        """Returns ([signal names], summed rule weight) for an EmailRecord"""
+        found = []
+        weight = 0
+
+        for header, name, pattern, rule_weight in HEADER_RULES:
+            value = email.headers.get(header)
+            if value and pattern.search(value):
+                found.append(name)
+                weight += rule_weight
+
+        for label in email.label_ids:
+            if label in LABEL_RULES:
+                name, rule_weight = LABEL_RULES[label]
+                found.append(name)
+                weight += rule_weight
+
+        for name, pattern, rule_weight in SENDER_RULES:
+            if pattern.search(email.sender or ''):
+                found.append(name)
+                weight += rule_weight
+
+        domains = (sender_domain(email.sender), sender_domain(email.headers.get('return-path')))
+        if any(d and d.endswith(self.bulk_domains) for d in domains):
+            found.append('bulk_domain')
+            weight += 2
+
+        for name, pattern, rule_weight in SUBJECT_RULES:
+            if pattern.search(email.subject or ''):
+                found.append(name)
+                weight += rule_weight
+
+        return found, weight
+
+    def is_protected(self, email):
+        sender = (email.sender or '').lower()
+        return bool(PROTECTED_SUBJECT.search(email.subject or '')) or \
+            any(protected in sender for protected in self.protected_senders)
+
+    def model_probability(self, signals):
+        """Probability that mail with these signals scores low, from the trained logistic model"""
+        if not self.model:
+            return None
+        z = self.model['bias'] + sum(self.model['weights'].get(signal, 0.0) for signal in signals)
+        return 1 / (1 + math.exp(-z))
+
+    def should_audit(self, message_id):
+        return in_sample(message_id, self.audit_rate)
+
+    def classify(self, email):
+        with metrics.span('triage'):
+            signals, weight = self.signals(email)
+            probability = self.model_probability(signals)
+
+            # The model only decides for mail with at least one signal, never on its bias alone
+            bulk = weight >= self.bulk_threshold or \
+                (signals and probability is not None and probability >= Config.TRIAGE_MODEL_THRESHOLD)
+            if not bulk or self.is_protected(email):
+                metrics.inc('triage_sent_to_llm')
+                return TriageDecision(VERDICT_LLM, signals, weight, probability)
+
+            audit = self.should_audit(email.message_id)
+            metrics.inc('triage_audited' if audit else 'triage_skipped')
+            return TriageDecision(VERDICT_BULK, signals, weight, probability, audit)
+
+    def bulk_response(self, email, decision):
+        """The deterministic low-score response used in place of an LLM completion"""
+        if decision.rule_weight >= self.bulk_threshold:
+            reason = f"Bulk mail ({', '.join(decision.signals)})"
+        else:
+            reason = f"Bulk mail by triage model ({decision.model_probability:.0%} likely low priority)"
+        return {
+            "summary": extractive_summary(email.subject, email.body),
+            "importance_score": Config.TRIAGE_BULK_SCORE,
+            "importance_level": "low",
+            "reason": reason,
+        }
+
+    def train(self, rows, epochs=300, learning_rate=0.5, l2=0.01):
+        """
+        Fits a logistic regression on binary signal features to predict an LLM score of
+        Config.TRIAGE_LOW_SCORE_MAX or less, and saves it to self.model_file.
+
+        Args:
+            rows: (comma-separated signals, importance_score) pairs, e.g. ResultsStore.training_rows()
+
+        Returns:
+            Training summary dict, or None when there are fewer than Config.TRIAGE_MIN_TRAINING_SAMPLES rows
+        """
+        samples = [([s for s in (signals or '').split(',') if s], int(score <= Config.TRIAGE_LOW_SCORE_MAX))
+                   for signals, score in rows if score is not None]
+        if len(samples) < Config.TRIAGE_MIN_TRAINING_SAMPLES:
+            logging.info(f"Not enough results to train the triage model ({len(samples)} samples)")
+            return None
+
+        features = sorted({signal for signals, _ in samples for signal in signals})
+        weights = dict.fromkeys(features, 0.0)
+        bias = 0.0
+
+        # Full-batch gradient descent; the feature set is a few dozen binary signals
+        for _ in range(epochs):
+            grad_w = dict.fromkeys(features, 0.0)
+            grad_b = 0.0
+            for signals, label in samples:
+                z = bias + sum(weights[s] for s in signals)
+                error = 1 / (1 + math.exp(-z)) - label
+                grad_b += error
+                for s in signals:
+                    grad_w[s] += error
+            bias -= learning_rate * grad_b / len(samples)
+            for s in features:
+                weights[s] -= learning_rate * (grad_w[s] / len(samples) + l2 * weights[s])
+
+        self.model = {'weights': weights, 'bias': bias, 'samples': len(samples),
+                      'trained_at': datetime.now().isoformat()}
+        correct = sum(int((self.model_probability(signals) >= 0.5) == bool(label)) for signals, label in samples)
+        self.model['training_accuracy'] = correct / len(samples)
+
+        with open(self.model_file, 'w') as f:
+            json.dump(self.model, f, indent=2)
+        logging.info(f"Trained triage model on {len(samples)} results")
+        return {key: self.model[key] for key in ('samples', 'training_accuracy', 'trained_at')}